@@ -1,73 +1,216 @@
 from decimal import Decimal, getcontext
-from typing import Dict, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import logging
+import numpy as np
 from config import settings
 from cex_client import CEXClient
 from dex_client import DexPriceFetcher
 from chainlink_verifier import ChainlinkPriceVerifier
-from execution_predictor import ExecutionPredictor
+from execution_predictor import execution_predictor
 from liquidity_analyzer import LiquidityAnalyzer
+from metrics import metrics
+from trade_sizing import depth_adjusted
+from batch_evaluator import evaluate_batch
 from telegram_notifier import send_telegram_message
 from utils import format_decimal
 
 getcontext().prec = 12
 
+# A screened cell awaiting exact confirmation:
+# (symbol, pool, liquidity, exchange, CEX price, direction, size)
+Candidate = Tuple[str, Tuple[float, float], Decimal, str, Decimal, int, float]
+
 class ArbitrageEngine:
     def __init__(self):
         self.cex = CEXClient()
         self.dex = DexPriceFetcher()
         self.chainlink = ChainlinkPriceVerifier()
-        self.liquidity = LiquidityAnalyzer()
-        self.predictor = ExecutionPredictor()
+        self.liquidity = LiquidityAnalyzer(self.dex)
+        self.predictor = execution_predictor
+        # Where alert messages go; in sharded mode the feeder forwards them to the notifier process
+        self.alert = send_telegram_message
+        # Sharded workers hold no order books, so they hand screened candidates to the feeder instead
+        self.defer_confirm: Optional[Callable[[List[Candidate]], Awaitable[None]]] = None
+
+    async def analyze_pair(self, symbol: str, address: str, priority: int = 0) -> Optional[Dict]:
+        """Scan one token for CEX/DEX opportunities and summarise the outcome for the scheduler.
 
-    async def analyze_pair(self, symbol: str, address: str):
+        Returns None for USDT itself, otherwise a dict with the scan `status`
+        ('no_pool', 'illiquid', 'no_quotes', 'no_edge' or 'opportunity'), the
+        DEX mid price, the best sized profit seen and the alerts sent.
+        """
         if symbol == "USDT":
-            return
+            return None
+        result = {'symbol': symbol, 'status': 'no_pool', 'dex_price': None, 'best_profit': Decimal(0), 'alerts': 0}
+
+        # Get DEX data; liquidity is the USDT side of the same (possibly routed) pool
+        with metrics.timer("arb_stage_seconds", stage='dex_quote'):
+            pools = await self.liquidity.get_pools([address])
+        pool, liquidity = pools[address]
 
-        # Get DEX data
-        dex_price = await self.dex.get_price_with_slippage(address, 1000)
-        liquidity = await self.liquidity.get_liquidity(address)
-        
+        if pool is None or pool[0] <= 0:
+            return result
+        result['dex_price'] = pool[1] / pool[0]
         if liquidity < settings.MIN_LIQUIDITY:
-            return
+            result['status'] = 'illiquid'
+            return result
 
         # Get CEX data
-        cex_prices = await self.cex.get_prices(f"{symbol}/USDT")
-        
-        for exchange, data in cex_prices.items():
-            if not data['success']:
-                continue
-                
-            # Price verification
-            if not await self.chainlink.verify_price(data['price'], f"{symbol}/USD"):
-                continue
-                
-            # Profit calculation
-            spread = await self.calculate_spread(data['price'], dex_price)
-            profit = await self.calculate_profit(data['price'], dex_price, 1000)
-            
-            if profit < settings.MIN_PROFIT_USD:
-                continue
-                
-            # Execution time prediction
-            exec_time = await self.predictor.predict(exchange, 1000)
+        pair = f"{symbol}/USDT"
+        with metrics.timer("arb_stage_seconds", stage='cex'):
+            cex_prices = await self.cex.get_prices(pair, priority)
+        quoted = {exchange: data for exchange, data in cex_prices.items() if data['success']}
+        if not quoted:
+            result['status'] = 'no_quotes'
+            return result
+        result['status'] = 'no_edge'
+
+        await self.evaluate_quotes(symbol, pool, liquidity, quoted, result)
+        return result
+
+    async def evaluate_quotes(self, symbol: str, pool: Tuple[float, float], liquidity: Decimal,
+                              quoted: Dict[str, Dict], result: Dict):
+        """Size, verify and alert on the given exchanges' quotes against one pool, updating `result`"""
+        await self.evaluate_many([(symbol, pool, liquidity, quoted, result)])
+
+    async def evaluate_many(self, rows: List[Tuple[str, Tuple[float, float], Decimal, Dict[str, Dict], Dict]],
+                            oracle: Optional[Dict[str, Optional[Decimal]]] = None):
+        """Screen many (symbol, pool, liquidity, quotes, result) rows in one vectorized pass.
+
+        Every pair x exchange cell is sized and thresholded in float64 by
+        evaluate_batch; only the surviving candidates are re-checked in exact
+        Decimal math, against CEX depth and the execution-time model. Oracle
+        prices keyed by feed ("ETH/USD") can be passed in instead of being read.
+        """
+        if not rows:
+            return
+        exchanges = sorted({exchange for row in rows for exchange in row[3]})
+        column = {exchange: index for index, exchange in enumerate(exchanges)}
+
+        cex_prices = np.full((len(rows), len(exchanges)), np.nan)
+        for row_index, (_, _, _, quoted, _) in enumerate(rows):
+            for exchange, data in quoted.items():
+                cex_prices[row_index, column[exchange]] = float(data['price'])
+
+        # One batched oracle read for every symbol in the batch
+        feeds = [f"{symbol}/USD" for symbol, *_ in rows]
+        if oracle is None:
+            with metrics.timer("arb_stage_seconds", stage='chainlink'):
+                oracle = await self.chainlink.get_prices(list(set(feeds)))
+        oracle_prices = [float(oracle[feed]) if oracle.get(feed) else np.nan for feed in feeds]
+
+        with metrics.timer("arb_stage_seconds", stage='screen'):
+            batch = evaluate_batch(
+                [row[1][0] for row in rows], [row[1][1] for row in rows],
+                [float(row[2]) for row in rows], cex_prices, oracle_prices
+            )
+        # A market past a feed's deviation threshold means a new oracle round is on its way
+        worst = np.fmax.reduce(batch.deviation, axis=1, initial=np.nan)
+        self.chainlink.check_deviations(
+            {feed: float(deviation) for feed, deviation in zip(feeds, worst) if not np.isnan(deviation)}
+        )
+
+        # Cells without a quote size to zero profit, so a plain max is safe
+        best = batch.sizing.profit.max(axis=1, initial=0.0)
+        for row_index, row in enumerate(rows):
+            row[4]['best_profit'] = max(row[4]['best_profit'], Decimal(str(best[row_index])))
+
+        candidates: List[Candidate] = []
+        results: List[Dict] = []
+        for row_index, column_index in np.argwhere(batch.candidates):
+            symbol, pool, liquidity, quoted, result = rows[row_index]
+            exchange = exchanges[column_index]
+            candidates.append((
+                symbol, pool, liquidity, exchange, quoted[exchange]['price'],
+                int(batch.sizing.direction[row_index, column_index]),
+                float(batch.sizing.size[row_index, column_index])
+            ))
+            results.append(result)
+        if not candidates:
+            return
+        if self.defer_confirm is not None:
+            await self.defer_confirm(candidates)
+            return
+        await self.confirm_candidates(candidates, results)
+
+    async def confirm_candidates(self, candidates: List[Candidate], results: Optional[List[Dict]] = None):
+        """Exact depth/Decimal re-check, execution-time model and alert for screened candidates"""
+        if results is None:
+            results = [{'status': 'no_edge', 'alerts': 0} for _ in candidates]
+        confirmed = []
+        for candidate, result in zip(candidates, results):
+            symbol, pool, liquidity, exchange, cex_price, direction, size = candidate
+            with metrics.timer("arb_stage_seconds", stage='confirm'):
+                trade = self._confirm(symbol, exchange, pool, cex_price, direction, size)
+            if trade is not None:
+                confirmed.append((symbol, liquidity, result, exchange) + trade)
+        if not confirmed:
+            return
+
+        # Execution time for every confirmed candidate in one model call
+        with metrics.timer("arb_stage_seconds", stage='predict'):
+            exec_times = self.predictor.predict_batch(
+                [exchange for _, _, _, exchange, _, _, _, _ in confirmed],
+                [float(size) for _, _, _, _, _, _, size, _ in confirmed]
+            )
+        for (symbol, liquidity, result, exchange, cex_price, dex_price, size, profit), exec_time in zip(confirmed, exec_times):
             if exec_time > settings.MAX_EXECUTION_TIME:
                 continue
-                
+            spread = self.calculate_spread(cex_price, dex_price)
+
             # Send notification
             message = self._prepare_message(
-                symbol, exchange, data['price'], 
-                dex_price, spread, profit, exec_time, liquidity
+                symbol, exchange, cex_price,
+                dex_price, spread, profit, float(exec_time), liquidity, size
             )
-            await send_telegram_message(message)
+            with metrics.timer("arb_stage_seconds", stage='notify'):
+                await self.alert(message, key=f"{symbol}/USDT:{exchange}", value=float(profit))
+            result['status'] = 'opportunity'
+            result['alerts'] += 1
+
+    def _confirm(self, symbol: str, exchange: str, pool: Tuple[float, float], cex_price: Decimal,
+                 direction: int, size: float) -> Optional[Tuple[Decimal, Decimal, Decimal, Decimal]]:
+        """Exact re-check of one screened cell: (CEX price, DEX price, size, profit) if it still holds"""
+        pair = f"{symbol}/USDT"
+
+        # Price both legs at the same size against CEX depth when a book is available
+        book = self.cex.get_book(exchange, pair)
+        if book is not None:
+            adjusted = depth_adjusted(book, pool[0], pool[1], direction, size)
+            if adjusted is None:
+                return None
+            size, _, book_price, _ = adjusted
+            cex_price = Decimal(str(book_price))
+
+        size = Decimal(str(size))
+        dex_usdt = self.dex_leg_exact(direction, size, Decimal(str(pool[0])), Decimal(str(pool[1])))
+        if dex_usdt is None:
+            return None
+        dex_price = dex_usdt / size
+        if (cex_price - dex_price) * direction <= 0:
+            return None
+        profit = self.calculate_profit(cex_price, dex_price, size)
+        if profit < settings.MIN_PROFIT_USD:
+            return None
+        return cex_price, dex_price, size, profit
+
+    @staticmethod
+    def dex_leg_exact(direction: int, size: Decimal, token_reserve: Decimal, usdt_reserve: Decimal) -> Optional[Decimal]:
+        """USDT paid to buy (+1) or received for selling (-1) `size` tokens, in Decimal"""
+        fee = 1 - settings.DEX_COMMISSION
+        if direction > 0:
+            if size >= token_reserve:
+                return None
+            return usdt_reserve * size / (fee * (token_reserve - size))
+        return fee * size * usdt_reserve / (token_reserve + fee * size)
 
-    async def calculate_spread(self, cex_price: Decimal, dex_price: Decimal) -> Decimal:
+    def calculate_spread(self, cex_price: Decimal, dex_price: Decimal) -> Decimal:
         return abs((cex_price - dex_price) / cex_price) * 100
 
-    async def calculate_profit(self, cex_price: Decimal, dex_price: Decimal, amount: Decimal) -> Decimal:
+    def calculate_profit(self, cex_price: Decimal, dex_price: Decimal, amount: Decimal) -> Decimal:
         return abs(cex_price - dex_price) * amount
 
-    def _prepare_message(self, symbol, exchange, cex_price, dex_price, spread, profit, exec_time, liquidity):
+    def _prepare_message(self, symbol, exchange, cex_price, dex_price, spread, profit, exec_time, liquidity, size):
         return (
             f"🚀 *Arbitrage Opportunity* 🚀\n"
             f"• Pair: {symbol}/USDT\n"
@@ -75,6 +218,7 @@ class ArbitrageEngine:
             f"• CEX Price: ${format_decimal(cex_price, 6)}\n"
             f"• DEX Price: ${format_decimal(dex_price, 6)}\n"
             f"• Spread: {spread:.2f}%\n"
+            f"• Size: {format_decimal(size, 4)} {symbol}\n"
             f"• Est. Profit: ${format_decimal(profit)}\n"
             f"• Exec. Time: {exec_time:.1f}s\n"
             f"• Liquidity: ${format_decimal(liquidity)}"
@@ -0,0 +1,38 @@
+from config import settings
+from trade_sizing import TradeSizing, optimal_trades
+import numpy as np
+from typing import NamedTuple
+
+
+class BatchEvaluation(NamedTuple):
+    sizing: TradeSizing
+    spread: np.ndarray     # % gap between the CEX price and the DEX execution price, P x E
+    deviation: np.ndarray  # |CEX - oracle| / oracle, NaN where there is no oracle price, P x E
+    candidates: np.ndarray # cells passing every threshold, P x E bool
+
+
+def evaluate_batch(token_reserves, usdt_reserves, liquidity, cex_prices, oracle_prices) -> BatchEvaluation:
+    """Screen every pair x exchange cell in one vectorized float64 pass.
+
+    Reserves, liquidity and oracle prices have shape P; `cex_prices` is P x E
+    with NaN where an exchange has no quote. A cell is a candidate when the
+    pair is liquid enough, the sized profit clears MIN_PROFIT_USD and the CEX
+    price is within MAX_PRICE_DEVIATION of the oracle (or there is no oracle
+    price). Candidates still need the exact re-check in the engine.
+    """
+    prices = np.asarray(cex_prices, dtype=np.float64)
+    liquidity = np.asarray(liquidity, dtype=np.float64).reshape(-1, 1)
+    oracle = np.asarray(oracle_prices, dtype=np.float64).reshape(-1, 1)
+    sizing = optimal_trades(token_reserves, usdt_reserves, prices)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spread = np.abs(prices - sizing.dex_price) / prices * 100
+        deviation = np.abs(prices - oracle) / oracle
+
+    candidates = (
+        (sizing.direction != 0)
+        & (sizing.profit >= float(settings.MIN_PROFIT_USD))
+        & (liquidity >= float(settings.MIN_LIQUIDITY))
+        & (np.isnan(deviation) | (deviation <= float(settings.MAX_PRICE_DEVIATION)))
+    )
+    return BatchEvaluation(sizing, spread, deviation, candidates)
@@ -1,52 +1,201 @@
-import aiohttp
+import asyncio
 import hmac
 import hashlib
 import time
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 from config import settings
+from market_stream import market_stream
+from order_book import OrderBook
+from rate_limiter import rate_limiter
+from execution_predictor import execution_predictor
+from metrics import metrics, MeteredTTLCache
+from http_transport import http_transport
+from cex_symbols import from_exchange_symbol
 from decimal import Decimal
 import logging
-from cachetools import TTLCache
 import json
 
+# Endpoints returning every market's ticker in one response
+BULK_TICKER_URLS = {
+    'binance': 'https://api.binance.com/api/v3/ticker/price',
+    'kucoin': 'https://api.kucoin.com/api/v1/market/allTickers',
+    'kraken': 'https://api.kraken.com/0/public/Ticker',
+    'coinbase': 'https://api.coinbase.com/v2/exchange-rates?currency={quote}'
+}
+
 class CEXClient:
     def __init__(self):
         self.session = None
-        self.cache = TTLCache(maxsize=1000, ttl=10)
-        self.rate_limits = {exchange: {'last_request': 0, 'limit': settings.EXCHANGES[exchange].get('rate_limit', 10)} 
-                           for exchange in settings.EXCHANGES}
+        self.cache = MeteredTTLCache('cex_price', maxsize=1000, ttl=10)
+        # "exchange:*QUOTE" -> {pair: price}, shared by every pair in a scan cycle
+        self.snapshots = MeteredTTLCache('cex_snapshot', maxsize=100, ttl=settings.CEX_SNAPSHOT_TTL)
+        # Requests still running past the deadline, keyed like the cache
+        self.in_flight: Dict[str, asyncio.Task] = {}
 
     async def _ensure_session(self):
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            self.session = await http_transport.get_session()
+
+    async def get_prices(self, pair: str, priority: int = 0) -> Dict:
+        """Latest price from every exchange, streamed where possible, else over REST.
 
-    async def get_prices(self, pair: str) -> Dict:
+        REST requests run concurrently and the call returns what arrived by
+        CEX_FANOUT_DEADLINE. Exchanges that miss the deadline keep running up
+        to their own timeout and land in the cache for the next round. With
+        CEX_BULK_SNAPSHOT, REST reads come from one all-tickers snapshot per
+        exchange that every pair in the cycle shares. REST requests queue on
+        each exchange's token bucket, lower `priority` values first.
+        """
         await self._ensure_session()
+        await market_stream.watch(pair)
         results = {}
+        tasks: Dict[str, asyncio.Task] = {}
         for exchange in settings.EXCHANGES:
-            if self._check_rate_limit(exchange):
-                try:
-                    price = await self._fetch_price(exchange, pair)
-                    results[exchange] = {'success': True, 'price': price}
-                except Exception as e:
-                    logging.error(f"Error fetching {pair} price from {exchange}: {e}")
-                    results[exchange] = {'success': False, 'error': str(e)}
+            cache_key = f"{exchange}:{pair}"
+            streamed = market_stream.get_price(exchange, pair)
+            if streamed is not None:
+                results[exchange] = {'success': True, 'price': streamed}
+            elif self._uses_snapshot(exchange):
+                snapshot_key = self._snapshot_key(exchange, pair)
+                if snapshot_key in self.snapshots:
+                    results[exchange] = self._from_snapshot(self.snapshots[snapshot_key], pair)
+                elif snapshot_key in self.in_flight:
+                    tasks[exchange] = self.in_flight[snapshot_key]
+                else:
+                    tasks[exchange] = self._start_snapshot(exchange, pair, priority)
+            elif cache_key in self.cache:
+                results[exchange] = {'success': True, 'price': self.cache[cache_key]}
+            elif cache_key in self.in_flight:
+                tasks[exchange] = self.in_flight[cache_key]
+            else:
+                tasks[exchange] = self._start_fetch(exchange, pair, priority)
+
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=settings.CEX_FANOUT_DEADLINE)
+
+        for exchange, task in tasks.items():
+            if not task.done():
+                results[exchange] = {'success': False, 'error': 'Deadline exceeded'}
+            elif task.cancelled():
+                results[exchange] = {'success': False, 'error': 'Cancelled'}
+            elif task.exception() is not None:
+                e = task.exception()
+                logging.error(f"Error fetching {pair} price from {exchange}: {e!r}")
+                results[exchange] = {'success': False, 'error': str(e) or repr(e)}
+            elif isinstance(task.result(), dict):
+                results[exchange] = self._from_snapshot(task.result(), pair)
             else:
-                results[exchange] = {'success': False, 'error': 'Rate limited'}
+                results[exchange] = {'success': True, 'price': task.result()}
         return results
 
-    def _check_rate_limit(self, exchange: str) -> bool:
-        """Check if we're within rate limits for the exchange"""
-        now = time.time()
-        rate_info = self.rate_limits.get(exchange, {'last_request': 0, 'limit': 10})
-        
-        if now - rate_info['last_request'] < (1.0 / rate_info['limit']):
-            return False
-            
-        self.rate_limits[exchange]['last_request'] = now
-        return True
+    def endpoints(self) -> List[str]:
+        """REST URLs this client calls, for connection pre-warming"""
+        urls = []
+        for exchange, config in settings.EXCHANGES.items():
+            if config.get('url'):
+                urls.append(config['url'])
+            if self._uses_snapshot(exchange):
+                urls.append(config.get('bulk_url', BULK_TICKER_URLS.get(exchange)))
+        return urls
+
+    def get_book(self, exchange: str, pair: str) -> Optional[OrderBook]:
+        """Fresh local L2 book for an exchange market, if one is streamed"""
+        return market_stream.get_book(exchange, pair)
 
-    async def _fetch_price(self, exchange: str, pair: str) -> Decimal:
+    def get_vwap(self, exchange: str, pair: str, side: str, amount: float) -> Optional[Decimal]:
+        """Average price to 'buy' or 'sell' `amount` base units against the local book"""
+        book = self.get_book(exchange, pair)
+        if book is None:
+            return None
+        price = book.vwap_buy(amount) if side == 'buy' else book.vwap_sell(amount)
+        return Decimal(str(price)) if price is not None else None
+
+    def _uses_snapshot(self, exchange: str) -> bool:
+        return settings.CEX_BULK_SNAPSHOT and bool(
+            settings.EXCHANGES[exchange].get('bulk_url', BULK_TICKER_URLS.get(exchange))
+        )
+
+    @staticmethod
+    def _snapshot_key(exchange: str, pair: str) -> str:
+        return f"{exchange}:*{pair.split('/')[1].upper()}"
+
+    @staticmethod
+    def _from_snapshot(snapshot: Dict[str, Decimal], pair: str) -> Dict:
+        price = snapshot.get(pair.upper())
+        if price is None:
+            return {'success': False, 'error': 'Pair not listed'}
+        return {'success': True, 'price': price}
+
+    def _start_snapshot(self, exchange: str, pair: str, priority: int = 0) -> asyncio.Task:
+        """Launch one all-tickers request, shared by every pair with the same quote asset"""
+        snapshot_key = self._snapshot_key(exchange, pair)
+        timeout = settings.EXCHANGES[exchange].get('timeout', settings.CEX_REQUEST_TIMEOUT)
+        quote = pair.split('/')[1].upper()
+        task = asyncio.create_task(asyncio.wait_for(self._fetch_snapshot(exchange, quote, priority), timeout))
+        self.in_flight[snapshot_key] = task
+        task.add_done_callback(lambda done: self._finish_fetch(snapshot_key, done))
+        return task
+
+    async def _fetch_snapshot(self, exchange: str, quote: str, priority: int = 0) -> Dict[str, Decimal]:
+        """Every ticker of an exchange as {BASE/QUOTE: price}, symbols normalized"""
+        url = settings.EXCHANGES[exchange].get('bulk_url', BULK_TICKER_URLS.get(exchange))
+        await rate_limiter.acquire(exchange, 'snapshot', priority)
+        started = time.monotonic()
+        async with self.session.get(url.replace("{quote}", quote)) as response:
+            rate_limiter.on_response(exchange, response.status, response.headers.get('Retry-After'))
+            if response.status != 200:
+                text = await response.text()
+                raise Exception(f"Error {response.status}: {text}")
+            data = await response.json()
+        elapsed = time.monotonic() - started
+        execution_predictor.record_latency(exchange, elapsed)
+        metrics.observe("arb_http_request_seconds", elapsed, exchange=exchange, endpoint='snapshot')
+
+        snapshot = self._parse_snapshot(exchange, data, quote)
+        self.snapshots[f"{exchange}:*{quote}"] = snapshot
+        return snapshot
+
+    def _parse_snapshot(self, exchange: str, data: Any, quote: str) -> Dict[str, Decimal]:
+        """Map an all-tickers response to {BASE/QUOTE: price}, using the same fields as _extract_price"""
+        if exchange == 'binance':
+            tickers = ((item['symbol'], item['price']) for item in data)
+        elif exchange == 'kucoin':
+            tickers = ((item['symbol'], item['last']) for item in data['data']['ticker'])
+        elif exchange == 'kraken':
+            tickers = ((symbol, item['a'][0]) for symbol, item in data['result'].items())
+        elif exchange == 'coinbase':
+            # Rates are units of each asset per one quote unit, so the price is the inverse
+            rates = data['data']['rates']
+            return {
+                f"{asset}/{quote}": 1 / Decimal(str(rate))
+                for asset, rate in rates.items() if Decimal(str(rate)) > 0
+            }
+        else:
+            raise ValueError(f"No snapshot parser for exchange {exchange}")
+
+        snapshot = {}
+        for symbol, price in tickers:
+            pair = from_exchange_symbol(exchange, symbol)
+            if pair is not None and price is not None:
+                snapshot[pair] = Decimal(str(price))
+        return snapshot
+
+    def _start_fetch(self, exchange: str, pair: str, priority: int = 0) -> asyncio.Task:
+        """Launch a bounded price request that outlives the caller's deadline if needed"""
+        cache_key = f"{exchange}:{pair}"
+        timeout = settings.EXCHANGES[exchange].get('timeout', settings.CEX_REQUEST_TIMEOUT)
+        task = asyncio.create_task(asyncio.wait_for(self._fetch_price(exchange, pair, priority), timeout))
+        self.in_flight[cache_key] = task
+        task.add_done_callback(lambda done: self._finish_fetch(cache_key, done))
+        return task
+
+    def _finish_fetch(self, cache_key: str, task: asyncio.Task):
+        self.in_flight.pop(cache_key, None)
+        # Retrieve the outcome so late failures are not reported as never awaited
+        if not task.cancelled() and task.exception() is not None:
+            logging.debug(f"Late {cache_key} request failed: {task.exception()!r}")
+
+    async def _fetch_price(self, exchange: str, pair: str, priority: int = 0) -> Decimal:
         """Fetch price from specific exchange"""
         cache_key = f"{exchange}:{pair}"
         if cache_key in self.cache:
@@ -63,6 +212,8 @@ class CEXClient:
         # Replace placeholder with actual pair
         url = url.replace("{pair}", pair.replace("/", ""))
         
+        await rate_limiter.acquire(exchange, 'price', priority)
+
         # Add authentication if needed
         headers = {}
         if 'auth_required' in exchange_config and exchange_config['auth_required']:
@@ -74,12 +225,17 @@ class CEXClient:
                 'API-Signature': signature
             })
         
+        started = time.monotonic()
         async with self.session.get(url, headers=headers) as response:
+            rate_limiter.on_response(exchange, response.status, response.headers.get('Retry-After'))
             if response.status != 200:
                 text = await response.text()
                 raise Exception(f"Error {response.status}: {text}")
                 
             data = await response.json()
+            elapsed = time.monotonic() - started
+            execution_predictor.record_latency(exchange, elapsed)
+            metrics.observe("arb_http_request_seconds", elapsed, exchange=exchange, endpoint='price')
             price = self._extract_price(exchange, data)
             self.cache[cache_key] = price
             return price
@@ -133,6 +289,6 @@ class CEXClient:
         raise ValueError(f"Could not extract price from {exchange} response: {data}")
     
     async def close(self):
-        """Close the HTTP session"""
-        if self.session and not self.session.closed:
-            await self.session.close()
\ No newline at end of file
+        """Cancel outstanding requests; the shared session is closed by http_transport"""
+        for task in list(self.in_flight.values()):
+            task.cancel()
\ No newline at end of file
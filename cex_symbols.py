@@ -0,0 +1,47 @@
+from typing import List, Optional
+
+# Quote/base spellings that differ from the ones used in settings
+KRAKEN_ASSETS = {"BTC": "XBT", "DOGE": "XDG"}
+# Quote assets tried, longest first, when splitting concatenated symbols
+QUOTE_ASSETS = ("USDT", "USDC", "BUSD", "USD", "BTC", "ETH")
+
+def to_exchange_symbol(exchange: str, pair: str) -> str:
+    """Exchange-native market symbol for a pair written as BASE/QUOTE"""
+    base, quote = pair.upper().split("/")
+    if exchange == 'binance':
+        return f"{base}{quote}"
+    if exchange in ('kucoin', 'coinbase'):
+        return f"{base}-{quote}"
+    if exchange == 'kraken':
+        # WebSocket v2 uses the common names (BTC/USD), REST the legacy ones
+        return f"{base}/{quote}"
+    return f"{base}{quote}"
+
+def from_exchange_symbol(exchange: str, symbol: str) -> Optional[str]:
+    """BASE/QUOTE pair for an exchange-native symbol, if it can be parsed"""
+    symbol = symbol.upper()
+    if exchange in ('kucoin', 'coinbase'):
+        parts = symbol.split("-")
+    elif exchange == 'kraken':
+        parts = symbol.split("/") if "/" in symbol else _split_kraken_rest(symbol)
+        parts = [next((name for name, alias in KRAKEN_ASSETS.items() if alias == part), part) for part in parts]
+    else:
+        quote = next((quote for quote in QUOTE_ASSETS if symbol.endswith(quote) and len(symbol) > len(quote)), None)
+        parts = [symbol[:-len(quote)], quote] if quote else []
+    if len(parts) != 2:
+        return None
+    return f"{parts[0]}/{parts[1]}"
+
+def _split_kraken_rest(symbol: str) -> List[str]:
+    """Split a Kraken REST pair name such as XXBTZUSD, XETHZUSD or ETHUSDT"""
+    # Legacy pairs glue X-prefixed crypto and Z-prefixed fiat four-letter codes
+    if len(symbol) == 8 and symbol[0] == 'X' and symbol[4] in 'XZ':
+        return [symbol[1:4], symbol[5:8]]
+    quote = next((quote for quote in QUOTE_ASSETS if symbol.endswith(quote) and len(symbol) > len(quote)), None)
+    if quote is None:
+        return []
+    base = symbol[:-len(quote)]
+    # Some legacy bases keep their prefix even against newer quotes (XXBTUSDT)
+    if len(base) == 4 and base[0] == 'X':
+        base = base[1:]
+    return [base, quote]
@@ -1,78 +1,360 @@
-from typing import Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from web3_client import web3_client
+from metadata_store import metadata_store
 from config import settings
 from decimal import Decimal
 import time
 import logging
 import asyncio
-from cachetools import TTLCache
+
+# keccak256("AnswerUpdated(int256,uint256,uint256)")
+ANSWER_UPDATED_TOPIC = '0x0559884fd3a460db3073b7fc896cc77986f16e378210ded43186175bf646fc5f'
+
+# Feed Registry denominations for assets without an ERC-20 address
+USD_DENOMINATION = '0x0000000000000000000000000000000000000348'
+ETH_DENOMINATION = '0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE'
+BTC_DENOMINATION = '0xbBbBBBBbbBBBbbbBbbBbbbbBBbBbbbbBbBbbBBbB'
+# Wrapped tokens are listed in the registry under their native asset
+REGISTRY_ALIASES = {'ETH': ETH_DENOMINATION, 'WETH': ETH_DENOMINATION, 'BTC': BTC_DENOMINATION, 'WBTC': BTC_DENOMINATION}
+
+
+class FeedState:
+    """What we know about one feed: its update parameters and the latest round seen"""
+
+    def __init__(self, pair: str, contract, decimals: int):
+        params = settings.CHAINLINK_FEED_PARAMS.get(pair, {})
+        self.pair = pair
+        self.contract = contract
+        self.decimals = decimals
+        self.heartbeat = float(params.get('heartbeat', settings.CHAINLINK_DEFAULT_HEARTBEAT))
+        self.deviation = Decimal(str(params.get('deviation', settings.CHAINLINK_DEFAULT_DEVIATION)))
+        # Contract emitting AnswerUpdated: the aggregator behind a proxy, or the feed itself
+        self.source: str = contract.address
+        self.round_id: Optional[int] = None
+        self.price: Optional[Decimal] = None
+        self.updated_at = 0.0
+        self.checked_at = 0.0
+
+    def refresh_due(self, now: float) -> bool:
+        """A heartbeat round is about to be (or is already) due"""
+        return (now >= self.updated_at + self.heartbeat - settings.CHAINLINK_REFRESH_AHEAD
+                and now - self.checked_at >= settings.CHAINLINK_POLL_INTERVAL)
+
+    def is_stale(self, now: float) -> bool:
+        return now - self.updated_at > self.heartbeat + settings.CHAINLINK_HEARTBEAT_GRACE
+
 
 class ChainlinkPriceVerifier:
+    """Round-aware Chainlink feed manager.
+
+    Each feed's answer stays valid until a new round is possible: its
+    heartbeat runs out, the market moves past its deviation threshold, or an
+    AnswerUpdated log shows the round. A background loop follows those logs
+    and re-reads feeds CHAINLINK_REFRESH_AHEAD before their heartbeat, so
+    reads only ever touch memory. Callers report how far the market is from
+    each answer through check_deviations, which re-reads feeds past their
+    threshold. Feeds come from CHAINLINK_FEEDS or,
+    for any other configured token, lazily from the Chainlink Feed Registry.
+    Loads that fail on RPC errors are retried with exponential backoff.
+    """
+
     def __init__(self):
-        self.feeds = {}
-        self.decimals_cache = {}
-        self.price_cache = TTLCache(maxsize=100, ttl=60)  # Cache prices for 60 seconds
-        self._init_feeds()
-
-    def _init_feeds(self):
-        """Initialize all chainlink price feeds"""
-        for pair, address in settings.CHAINLINK_FEEDS.items():
+        self.feeds: Dict[str, FeedState] = {}
+        self.unavailable: Set[str] = set()
+        # pair -> (earliest retry time, consecutive failures) for loads that errored
+        self.failed: Dict[str, Tuple[float, int]] = {}
+        self.registry = web3_client.get_contract(settings.CHAINLINK_FEED_REGISTRY, abi=settings.CHAINLINK_REGISTRY_ABI)
+        self.load_lock = asyncio.Lock()
+        self.refreshing: Set[str] = set()
+        # Pairs being loaded in the background, and every background task still running
+        self.loading: Set[str] = set()
+        self.background: Set[asyncio.Task] = set()
+        self.last_log_block: Optional[int] = None
+        self.task = None
+        # Called with the feed pair (e.g. "ETH/USD") when a new oracle round is seen
+        self.listeners: List[Callable[[str], None]] = []
+
+    def add_listener(self, callback: Callable[[str], None]):
+        self.listeners.append(callback)
+
+    def _notify_round(self, pair: str):
+        for callback in self.listeners:
             try:
-                self.feeds[pair] = web3_client.get_contract(
-                    address,
-                    abi=settings.CHAINLINK_AGGREGATOR_ABI
-                )
-                # Cache the decimals to avoid repeated calls
-                self.decimals_cache[pair] = self.feeds[pair].functions.decimals().call()
+                callback(pair)
+            except Exception as e:
+                logging.error(f"Chainlink listener failed: {e}")
+
+    def configured_pairs(self) -> List[str]:
+        pairs = dict.fromkeys(settings.CHAINLINK_FEEDS)
+        pairs.update((f"{symbol}/USD", None) for symbol in settings.TOKENS if symbol != "USDT")
+        return list(pairs)
+
+    async def start(self):
+        await self.load_feeds(self.configured_pairs())
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        for task in list(self.background):
+            task.cancel()
+        await asyncio.gather(*self.background, return_exceptions=True)
+
+    async def load_feeds(self, pairs: Iterable[str]):
+        """Resolve, describe and read every feed not loaded yet, in as few batches as possible"""
+        async with self.load_lock:
+            now = time.time()
+            pairs = [pair for pair in dict.fromkeys(pairs) if self._loadable(pair, now)]
+            if not pairs:
+                return
+            addresses = await self._resolve(pairs)
+
+            contracts = {
+                pair: web3_client.get_contract(address, abi=settings.CHAINLINK_AGGREGATOR_ABI)
+                for pair, address in addresses.items()
+            }
+            unknown_decimals = [pair for pair, contract in contracts.items()
+                                if metadata_store.get_feed_decimals(contract.address) is None]
+            calls = [(contracts[pair], "decimals", ()) for pair in unknown_decimals]
+            for contract in contracts.values():
+                calls += [(contract, "aggregator", ()), (contract, "latestRoundData", ())]
+            try:
+                results = iter(await web3_client.batch_call(calls))
+            except Exception as e:
+                logging.error(f"Failed to load Chainlink feeds {pairs}: {e}")
+                self._mark_failed(list(contracts))
+                return
+
+            for pair in unknown_decimals:
+                feed_decimals = next(results)
+                if feed_decimals is not None:
+                    metadata_store.set_feed_decimals(contracts[pair].address, feed_decimals)
+            for pair, contract in contracts.items():
+                aggregator, round_data = next(results), next(results)
+                feed_decimals = metadata_store.get_feed_decimals(contract.address)
+                if feed_decimals is None or round_data is None:
+                    logging.error(f"Could not read Chainlink feed for {pair}")
+                    self._mark_failed([pair])
+                    continue
+                self.failed.pop(pair, None)
+                state = FeedState(pair, contract, feed_decimals)
+                if aggregator:
+                    state.source = aggregator
+                self.feeds[pair] = state
+                self._apply_round(state, round_data[0], round_data[1], round_data[3])
                 logging.info(f"Initialized Chainlink feed for {pair}")
+                # Readers that went without this feed while it loaded can verify against it now
+                self._notify_round(pair)
+
+    async def _resolve(self, pairs: List[str]) -> Dict[str, str]:
+        """Feed address per pair: configured, remembered from the registry, or looked up now"""
+        addresses = {}
+        lookups = []
+        for pair in pairs:
+            address = settings.CHAINLINK_FEEDS.get(pair) or metadata_store.get_meta(f"chainlink_feed:{pair}")
+            if address:
+                addresses[pair] = address
+                continue
+            base, quote = pair.split("/")
+            base_address = REGISTRY_ALIASES.get(base) or settings.TOKENS.get(base)
+            if quote != "USD" or base_address is None:
+                self._mark_unavailable(pair)
+                continue
+            lookups.append((pair, base_address))
+
+        if lookups:
+            try:
+                found = await web3_client.batch_call(
+                    [(self.registry, "getFeed", (base_address, USD_DENOMINATION)) for _, base_address in lookups]
+                )
             except Exception as e:
-                logging.error(f"Failed to initialize Chainlink feed for {pair}: {e}")
+                logging.error(f"Chainlink Feed Registry lookup failed: {e}")
+                self._mark_failed([pair for pair, _ in lookups])
+                return addresses
+            for (pair, _), address in zip(lookups, found):
+                if address:
+                    addresses[pair] = address
+                    metadata_store.set_meta(f"chainlink_feed:{pair}", address)
+                else:
+                    self._mark_unavailable(pair)
+        return addresses
+
+    def _loadable(self, pair: str, now: float) -> bool:
+        """Not loaded, not known to be missing, and not backing off after a failed load"""
+        if pair in self.feeds or pair in self.unavailable:
+            return False
+        retry_at, _ = self.failed.get(pair, (0.0, 0))
+        return now >= retry_at
+
+    def _mark_failed(self, pairs: List[str]):
+        now = time.time()
+        for pair in pairs:
+            _, failures = self.failed.get(pair, (0.0, 0))
+            delay = min(settings.CHAINLINK_RETRY_BASE * 2 ** failures, settings.CHAINLINK_RETRY_MAX)
+            self.failed[pair] = (now + delay, failures + 1)
+
+    def _mark_unavailable(self, pair: str):
+        self.unavailable.add(pair)
+        logging.warning(f"No Chainlink feed available for {pair}")
+
+    def _apply_round(self, state: FeedState, round_id: int, answer: int, updated_at: int):
+        state.checked_at = time.time()
+        if updated_at <= state.updated_at:
+            return
+        previous = state.round_id
+        state.round_id = round_id
+        state.price = Decimal(answer) / (10 ** state.decimals)
+        state.updated_at = float(updated_at)
+        if previous is not None:
+            self._notify_round(state.pair)
+
+    def peek(self, pair: str) -> Optional[Decimal]:
+        """Current answer from memory; unknown feeds are loaded in the background"""
+        state = self.feeds.get(pair)
+        if state is None:
+            self._schedule_load([pair])
+            return None
+        now = time.time()
+        if state.refresh_due(now):
+            self._schedule_refresh([state])
+        if state.is_stale(now):
+            logging.warning(f"Stale Chainlink data for {pair}, last updated {now - state.updated_at:.0f} seconds ago")
+            return None
+        return state.price
 
     async def get_price(self, pair: str) -> Optional[Decimal]:
-        """Get price from Chainlink oracle with caching"""
-        # Check cache first
-        if pair in self.price_cache:
-            return self.price_cache[pair]
-            
+        """Get price from Chainlink oracle"""
+        prices = await self.get_prices([pair])
+        return prices.get(pair)
+
+    async def get_prices(self, pairs: List[str]) -> Dict[str, Optional[Decimal]]:
+        """Answers for many feeds from memory; unknown feeds are loaded in one background batch"""
+        self._schedule_load([pair for pair in pairs if pair not in self.feeds])
+        return {pair: self.peek(pair) for pair in pairs}
+
+    def _schedule_load(self, pairs: List[str]):
+        now = time.time()
+        pairs = [pair for pair in dict.fromkeys(pairs) if pair not in self.loading and self._loadable(pair, now)]
+        if pairs:
+            self.loading.update(pairs)
+            self._spawn(self.load_feeds(pairs), f"Chainlink feed load for {pairs}",
+                        lambda: self.loading.difference_update(pairs))
+
+    def _spawn(self, coroutine, description: str, on_done: Optional[Callable[[], None]] = None):
+        """Run a background task, keeping a reference until it finishes and logging its failure"""
+        task = asyncio.create_task(coroutine)
+        self.background.add(task)
+
+        def finished(done: asyncio.Task):
+            self.background.discard(done)
+            if on_done is not None:
+                on_done()
+            if not done.cancelled() and done.exception() is not None:
+                logging.error(f"{description} failed: {done.exception()!r}")
+        task.add_done_callback(finished)
+
+    def _schedule_refresh(self, states: List[FeedState]):
+        states = [state for state in states if state.pair not in self.refreshing]
+        if states:
+            self.refreshing.update(state.pair for state in states)
+            self._spawn(self._refresh(states), "Chainlink refresh")
+
+    def check_deviations(self, deviations: Dict[str, float]):
+        """Re-read feeds the market has moved past their deviation threshold from.
+
+        `deviations` maps a feed ("ETH/USD") to the largest |market - answer| /
+        answer seen for it; the feed is then likely to publish a new round.
+        """
+        due = []
+        for pair, deviation in deviations.items():
+            state = self.feeds.get(pair)
+            if state is not None and state.price is not None and deviation >= state.deviation:
+                due.append(state)
+        if due:
+            self._schedule_refresh(due)
+
+    async def _refresh(self, states: List[FeedState]):
+        """Re-read feeds, picking up aggregator upgrades behind proxies as well"""
         try:
-            web3_client.reconnect_if_needed()
-            
-            contract = self.feeds.get(pair)
-            if not contract:
-                logging.warning(f"No Chainlink feed available for {pair}")
-                return None
-                
-            round_data = contract.functions.latestRoundData().call()
-            decimals = self.decimals_cache.get(pair, 8)  # Default to 8 decimals
-            price = Decimal(round_data[1]) / (10 ** decimals)
-            
-            # Check if data is stale (older than 15 minutes)
-            if (time.time() - round_data[3]) > 900:
-                logging.warning(f"Stale Chainlink data for {pair}, last updated {time.time() - round_data[3]} seconds ago")
-                return None
-            
-            # Cache the price
-            self.price_cache[pair] = price
-            return price
+            calls = []
+            for state in states:
+                calls += [(state.contract, "aggregator", ()), (state.contract, "latestRoundData", ())]
+            results = iter(await web3_client.batch_call(calls))
+            for state in states:
+                aggregator, round_data = next(results), next(results)
+                if aggregator:
+                    state.source = aggregator
+                if round_data is not None:
+                    self._apply_round(state, round_data[0], round_data[1], round_data[3])
         except Exception as e:
-            logging.error(f"Chainlink error for {pair}: {e}")
-            return None
+            logging.error(f"Chainlink refresh failed for {[state.pair for state in states]}: {e}")
+        finally:
+            self.refreshing.difference_update(state.pair for state in states)
+
+    async def _run(self):
+        while True:
+            try:
+                if settings.CHAINLINK_WATCH_LOGS:
+                    await self._poll_logs()
+                now = time.time()
+                self._schedule_refresh([state for state in self.feeds.values() if state.refresh_due(now)])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Chainlink feed update failed: {e}")
+            await asyncio.sleep(settings.CHAINLINK_POLL_INTERVAL)
+
+    async def _poll_logs(self):
+        """Apply AnswerUpdated logs, so deviation-triggered rounds land without polling the feeds"""
+        sources = {state.source.lower(): state for state in self.feeds.values()}
+        head = await web3_client.w3.eth.block_number
+        if self.last_log_block is None or not sources:
+            self.last_log_block = head
+            return
+        from_block = self.last_log_block + 1
+        to_block = min(head, self.last_log_block + settings.CHAINLINK_MAX_BLOCK_RANGE)
+        if from_block > to_block:
+            return
+
+        logs = await web3_client.w3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': [state.source for state in sources.values()],
+            'topics': [ANSWER_UPDATED_TOPIC]
+        })
+        for log in sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex'])):
+            state = sources.get(log['address'].lower())
+            if state is None or log.get('removed'):
+                continue
+            answer = int.from_bytes(bytes(log['topics'][1]), 'big', signed=True)
+            aggregator_round = int.from_bytes(bytes(log['topics'][2]), 'big')
+            # Proxies report phase-prefixed round ids; the aggregator's log does not
+            phase = (state.round_id or 0) >> 64 << 64
+            self._apply_round(state, phase | aggregator_round, answer, int.from_bytes(bytes(log['data']), 'big'))
+        self.last_log_block = to_block
 
     async def verify_price(self, market_price: Decimal, pair: str) -> bool:
-        """Verify a market price against Chainlink oracle data"""
+        """Verify a market price against the last Chainlink answer, without waiting on RPC"""
         try:
-            chainlink_price = await self.get_price(pair)
+            chainlink_price = self.peek(pair)
             if not chainlink_price:
                 logging.info(f"No Chainlink price available for {pair}, skipping verification")
                 return True  # Skip verification if no price available
-                
+
             deviation = abs(market_price - chainlink_price) / chainlink_price
+            self.check_deviations({pair: deviation})
+
             is_valid = deviation <= settings.MAX_PRICE_DEVIATION
-            
+
             if not is_valid:
                 logging.warning(f"Price verification failed for {pair}. Market: {market_price}, Chainlink: {chainlink_price}, Deviation: {deviation*100:.2f}%")
-                
+
             return is_valid
         except Exception as e:
             logging.error(f"Error during price verification for {pair}: {e}")
-            return False  # Fail closed on errors
\ No newline at end of file
+            return False  # Fail closed on errors
@@ -0,0 +1,92 @@
+import logging
+import numpy as np
+from typing import Any, Optional
+
+
+class CompiledEnsemble:
+    """A fitted GradientBoostingRegressor flattened into NumPy node tables.
+
+    The nodes of every tree share one set of arrays (feature, threshold,
+    left, right, value) and each tree has a root offset. Leaves point at
+    themselves, so a batch walks all trees at once for `depth` steps with
+    plain fancy indexing and no sklearn on the call path.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, depth: int, init: float, learning_rate: float):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.children = np.column_stack([left, right]).ravel()
+        self.depth = depth
+        self.init = init
+        self.learning_rate = learning_rate
+
+    def predict(self, features) -> np.ndarray:
+        # sklearn compares float32 inputs against the stored thresholds
+        features = np.asarray(features, dtype=np.float32)
+        # Flat gathers: row offsets into the feature matrix, (left, right) pairs per node
+        offsets = (np.arange(len(features)) * features.shape[1])[:, None]
+        flat = features.ravel()
+        nodes = np.repeat(self.roots[None, :], len(features), axis=0)
+        for _ in range(self.depth):
+            go_right = flat[offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_right]
+        return self.init + self.learning_rate * self.value[nodes].sum(axis=1)
+
+    def save(self, path: str):
+        np.savez(
+            path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+            value=self.value, roots=self.roots, scalars=np.array([self.depth, self.init, self.learning_rate])
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledEnsemble":
+        with np.load(path) as arrays:
+            depth, init, learning_rate = arrays['scalars']
+            return cls(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                       arrays['value'], arrays['roots'], int(depth), float(init), float(learning_rate))
+
+
+def compile_model(model: Any, n_features: int) -> Optional[CompiledEnsemble]:
+    """Flatten a single-output GradientBoostingRegressor over `n_features` inputs; None for anything else"""
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None or estimators.ndim != 2 or estimators.shape[1] != 1:
+        return None
+    trained = getattr(model, 'n_features_in_', None)
+    if trained != n_features:
+        # Trees indexing past the feature matrix would read garbage (or fail) at predict time
+        logging.warning(f"Execution model was trained on {trained} features, expected {n_features}")
+        return None
+    init = getattr(model, 'init_', None)
+    if isinstance(init, str) and init == 'zero':
+        init_value = 0.0
+    elif hasattr(init, 'constant_'):
+        init_value = float(np.ravel(init.constant_)[0])
+    else:
+        # A fitted estimator as init needs sklearn to evaluate
+        return None
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for estimator in estimators[:, 0]:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+        rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+        values.append(tree.value[:, 0, 0])
+        roots.append(offset)
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+
+    return CompiledEnsemble(
+        np.concatenate(features).astype(np.intp), np.concatenate(thresholds),
+        np.concatenate(lefts).astype(np.intp), np.concatenate(rights).astype(np.intp),
+        np.concatenate(values), np.array(roots, dtype=np.intp), depth, init_value, float(model.learning_rate)
+    )
@@ -1,9 +1,8 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from decimal import Decimal
+from functools import lru_cache
 from typing import Dict, List, Any
 import os
-import ssl
-ssl._create_default_https_context = ssl._create_unverified_context
 
 class Settings(BaseSettings):
     # Telegram
@@ -14,10 +13,57 @@ class Settings(BaseSettings):
     INFURA_PROJECT_ID: str
     UNISWAP_ROUTER_ADDRESS: str = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
     UNISWAP_FACTORY_ADDRESS: str = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
+    MULTICALL3_ADDRESS: str = '0xcA11bde05977b3631167028862bE2a173976CA11'
+    MULTICALL_BATCH_SIZE: int = 200
+    RPC_TIMEOUT: float = 10.0
+    RPC_POOL_SIZE: int = 20
+    RPC_STATS_WINDOW: int = 200
+    RPC_HEDGE_ENABLED: bool = True
+    RPC_HEDGE_DEFAULT_DELAY: float = 0.3
+    RPC_HEDGE_MIN_DELAY: float = 0.05
+    RPC_BREAKER_FAILURES: int = 3
+    RPC_BREAKER_COOLDOWN: float = 30.0
+    
+    # Reserves mirror
+    RESERVES_POLL_INTERVAL: float = 1.0
+    RESERVES_REORG_DEPTH: int = 12
+    RESERVES_MAX_BLOCK_RANGE: int = 100
+    RESERVES_MAX_FILTER_ADDRESSES: int = 500
+    
+    # Factory pair indexer
+    INDEXER_POLL_INTERVAL: float = 12.0
+    INDEXER_BATCH_SIZE: int = 1000
+    INDEXER_MAX_BLOCK_RANGE: int = 2000
+    
+    # Multi-hop routing and cycle detection
+    ROUTING_HUB_TOKENS: List[str] = [
+        "0xdAC17F958D2ee523a2206206994597C13D831ec7",  # USDT
+        "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",  # WETH
+        "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",  # USDC
+        "0x6B175474E89094C44Da98b954EedeAC495271d0F"   # DAI
+    ]
+    ROUTING_MAX_HOPS: int = 3
+    ROUTING_MAX_RELAXATIONS: int = 200000
     CHAINLINK_FEEDS: Dict[str, str] = {
         "ETH/USD": "0x5f4eC3Df9cbd43714FE2740f5E3616155c5b8419",
         "BTC/USD": "0xF4030086522a5bEEa4988F8cA5B36dbC97BeE88c"
     }
+    # Feeds for other tokens are looked up here on first use
+    CHAINLINK_FEED_REGISTRY: str = "0x47fb2585d2c56FE188d0e6EC628a38B74DceB2cf"
+    # Heartbeat (s) and deviation threshold per feed, from the feed's data.chain.link page
+    CHAINLINK_FEED_PARAMS: Dict[str, Dict[str, float]] = {
+        "ETH/USD": {"heartbeat": 3600, "deviation": 0.005},
+        "BTC/USD": {"heartbeat": 3600, "deviation": 0.005}
+    }
+    CHAINLINK_DEFAULT_HEARTBEAT: float = 86400.0
+    CHAINLINK_DEFAULT_DEVIATION: float = 0.01
+    CHAINLINK_HEARTBEAT_GRACE: float = 300.0  # a feed this far past its heartbeat is stale
+    CHAINLINK_REFRESH_AHEAD: float = 30.0  # re-read feeds this long before their heartbeat round
+    CHAINLINK_POLL_INTERVAL: float = 12.0
+    CHAINLINK_WATCH_LOGS: bool = True  # follow AnswerUpdated logs for deviation-triggered rounds
+    CHAINLINK_MAX_BLOCK_RANGE: int = 1000  # blocks per AnswerUpdated log query
+    CHAINLINK_RETRY_BASE: float = 30.0  # first retry delay after a failed feed load, doubling per failure
+    CHAINLINK_RETRY_MAX: float = 1800.0
     
     # Chainlink ABI
     CHAINLINK_AGGREGATOR_ABI: List[Dict[str, Any]] = [
@@ -40,6 +86,27 @@ class Settings(BaseSettings):
             ],
             "stateMutability": "view",
             "type": "function"
+        },
+        {
+            "inputs": [],
+            "name": "aggregator",
+            "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+            "stateMutability": "view",
+            "type": "function"
+        }
+    ]
+    
+    # Chainlink Feed Registry ABI
+    CHAINLINK_REGISTRY_ABI: List[Dict[str, Any]] = [
+        {
+            "inputs": [
+                {"internalType": "address", "name": "base", "type": "address"},
+                {"internalType": "address", "name": "quote", "type": "address"}
+            ],
+            "name": "getFeed",
+            "outputs": [{"internalType": "address", "name": "aggregator", "type": "address"}],
+            "stateMutability": "view",
+            "type": "function"
         }
     ]
     
@@ -54,11 +121,50 @@ class Settings(BaseSettings):
             "outputs": [{"internalType": "address", "name": "", "type": "address"}],
             "stateMutability": "view",
             "type": "function"
+        },
+        {
+            "inputs": [],
+            "name": "allPairsLength",
+            "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+            "stateMutability": "view",
+            "type": "function"
+        },
+        {
+            "inputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+            "name": "allPairs",
+            "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+            "stateMutability": "view",
+            "type": "function"
+        },
+        {
+            "anonymous": False,
+            "inputs": [
+                {"indexed": True, "internalType": "address", "name": "token0", "type": "address"},
+                {"indexed": True, "internalType": "address", "name": "token1", "type": "address"},
+                {"indexed": False, "internalType": "address", "name": "pair", "type": "address"},
+                {"indexed": False, "internalType": "uint256", "name": "", "type": "uint256"}
+            ],
+            "name": "PairCreated",
+            "type": "event"
         }
     ]
     
     # Uniswap Pair ABI
     UNISWAP_PAIR_ABI: List[Dict[str, Any]] = [
+        {
+            "inputs": [],
+            "name": "token0",
+            "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+            "stateMutability": "view",
+            "type": "function"
+        },
+        {
+            "inputs": [],
+            "name": "token1",
+            "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+            "stateMutability": "view",
+            "type": "function"
+        },
         {
             "inputs": [],
             "name": "getReserves",
@@ -72,21 +178,139 @@ class Settings(BaseSettings):
         }
     ]
     
+    # ERC20 ABI
+    ERC20_ABI: List[Dict[str, Any]] = [
+        {
+            "constant": True,
+            "inputs": [],
+            "name": "decimals",
+            "outputs": [{"name": "", "type": "uint8"}],
+            "type": "function"
+        }
+    ]
+    
+    # Multicall3 ABI
+    MULTICALL3_ABI: List[Dict[str, Any]] = [
+        {
+            "inputs": [
+                {
+                    "components": [
+                        {"internalType": "address", "name": "target", "type": "address"},
+                        {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                        {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                    ],
+                    "internalType": "struct Multicall3.Call3[]",
+                    "name": "calls",
+                    "type": "tuple[]"
+                }
+            ],
+            "name": "aggregate3",
+            "outputs": [
+                {
+                    "components": [
+                        {"internalType": "bool", "name": "success", "type": "bool"},
+                        {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                    ],
+                    "internalType": "struct Multicall3.Result[]",
+                    "name": "returnData",
+                    "type": "tuple[]"
+                }
+            ],
+            "stateMutability": "payable",
+            "type": "function"
+        }
+    ]
+    
+    # Persistent metadata (pair addresses, token ordering, decimals)
+    METADATA_DB_PATH: str = 'data/metadata.sqlite'
+    
     # Exchanges
     EXCHANGES: Dict[str, Dict[str, Any]] = {}
+    CEX_REQUEST_TIMEOUT: float = 5.0  # per exchange, overridable with a 'timeout' key
+    CEX_FANOUT_DEADLINE: float = 1.5  # answer with whatever arrived by then
+    CEX_BULK_SNAPSHOT: bool = True  # one all-tickers request per exchange per cycle
+    CEX_SNAPSHOT_TTL: float = 2.0
+    
+    # Shared HTTP transport for exchanges and notifications
+    HTTP_POOL_SIZE: int = 100
+    HTTP_POOL_PER_HOST: int = 10
+    HTTP_DNS_CACHE_TTL: int = 300
+    HTTP_KEEPALIVE_TIMEOUT: float = 60.0
+    HTTP_CONNECT_TIMEOUT: float = 3.0
+    HTTP_READ_TIMEOUT: float = 5.0
+    
+    # Telegram delivery
+    TELEGRAM_QUEUE_SIZE: int = 100  # pending alerts; the least valuable is dropped beyond this
+    TELEGRAM_COALESCE_WINDOW: float = 30.0  # repeats for one pair/exchange merge within this
+    TELEGRAM_BATCH_SIZE: int = 10  # alerts per digest message
+    TELEGRAM_CHAT_RATE: float = 1.0  # messages per second to one chat
+    TELEGRAM_CHAT_BURST: float = 3.0
+    TELEGRAM_GLOBAL_RATE: float = 30.0  # messages per second for the whole bot
+    TELEGRAM_MAX_RETRIES: int = 5
+    TELEGRAM_BASE_BACKOFF: float = 1.0
+    TELEGRAM_MAX_BACKOFF: float = 60.0
+    TELEGRAM_FLUSH_TIMEOUT: float = 10.0
+    
+    # CEX REST rate limiting ('rate_limit', 'burst' and 'weights' per exchange)
+    RATE_LIMIT_BASE_BACKOFF: float = 1.0
+    RATE_LIMIT_MAX_BACKOFF: float = 120.0
+    RATE_LIMIT_MIN_RATE_FRACTION: float = 0.1
+    RATE_LIMIT_RECOVERY_STEP: float = 0.05  # fraction of the base rate regained per success
+    
+    # CEX WebSocket market data
+    CEX_STREAM_ENABLED: bool = True
+    CEX_STREAM_MAX_AGE: float = 5.0  # older streamed prices fall back to REST
+    CEX_STREAM_STALE_AFTER: float = 30.0
+    CEX_STREAM_HEARTBEAT: float = 20.0
+    CEX_STREAM_RECONNECT_MAX_DELAY: float = 30.0
+    CEX_ORDER_BOOKS: bool = True
+    CEX_BOOK_DEPTH: int = 100
+    CEX_DEPTH_SIZE_STEPS: int = 6  # halvings tried when a book is too thin for the sized trade
     
     # Tokens
     TOKENS: Dict[str, str] = {
-        "USDT": "0xdAC17F958D2ee523a2206206994597C13D831ec7"  # Пример адреса USDT
+        "USDT": "0xdAC17F958D2ee523a2206206994597C13D831ec7",  # Пример адреса USDT
+        "ETH": "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"  # WETH
     }
     
+    # Evaluation mode: 'incremental' (change-driven), 'scan' (timer-driven scanner)
+    # or 'sharded' (feeder + worker processes over a shared-memory price board)
+    ENGINE_MODE: str = 'incremental'
+    SHARD_WORKERS: int = 4
+    SHARD_POLL_INTERVAL: float = 0.005
+    INCREMENTAL_DEBOUNCE: float = 0.05
+    INCREMENTAL_FALLBACK_INTERVAL: float = 5.0  # REST polling for exchanges without a stream
+    INCREMENTAL_ORACLE_INTERVAL: float = 60.0
+    INCREMENTAL_POOL_RETRY_INTERVAL: float = 60.0  # re-read pools that were missing or empty
+    
+    # Multi-pair scanner
+    SCANNER_WORKERS: int = 8
+    SCANNER_MIN_INTERVAL: float = 1.0  # hot pairs
+    SCANNER_BASE_INTERVAL: float = 5.0
+    SCANNER_MAX_INTERVAL: float = 300.0  # backoff cap for dead or illiquid pairs
+    SCANNER_VOLATILITY_THRESHOLD: float = 0.002  # DEX price move between scans that makes a pair hot
+    SCANNER_NEAR_PROFIT_RATIO: float = 0.5  # share of MIN_PROFIT_USD that makes a pair hot
+    SCANNER_REPORT_INTERVAL: float = 60.0
+    
     # Commissions
     DEX_COMMISSION: Decimal = Decimal('0.003')
     MAX_SLIPPAGE: Decimal = Decimal('0.01')
     
     # ML
-    ML_MODEL_PATH: str = 'models/execution_model.pkl'
-    MAX_EXECUTION_TIME: int = 3
+    ML_MODEL_PATH: str = 'models/execution_model.pkl'  # optional correction on top of observed latencies
+    MAX_EXECUTION_TIME: float = 15.0  # p95 seconds for both legs, including a block for the DEX side
+    PREDICTOR_WINDOW: int = 500  # samples per quantile window
+    PREDICTOR_MIN_SAMPLES: int = 50  # before a new window answers on its own
+    PREDICTOR_EWMA_ALPHA: float = 0.1
+    PREDICTOR_DEFAULT_CEX_LATENCY: float = 0.5  # until an exchange has been measured
+    PREDICTOR_DEFAULT_INCLUSION_TIME: float = 12.0  # one mainnet slot
+    PREDICTOR_CACHE_SIZE: int = 4096  # model corrections by quantized features
+    PREDICTOR_CACHE_STEP: float = 0.02  # relative width of a quantization bucket
+    
+    # Metrics (Prometheus text at http://METRICS_HOST:METRICS_PORT/metrics)
+    METRICS_ENABLED: bool = True
+    METRICS_HOST: str = '127.0.0.1'  # local only; scrape through an agent or tunnel
+    METRICS_PORT: int = 9108
     
     # Risk Management
     MIN_PROFIT_USD: Decimal = Decimal('50')
@@ -99,4 +323,27 @@ class Settings(BaseSettings):
         extra="ignore"
     )
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Read and validate the environment and .env once, on first use"""
+    return Settings()
+
+
+class LazySettings:
+    """Module-level stand-in for Settings, so importing config reads nothing.
+
+    Each attribute is copied onto the proxy the first time it is read, so
+    later reads are plain attribute lookups. Assignments go to both.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(get_settings(), name)
+        object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(get_settings(), name, value)
+        object.__setattr__(self, name, value)
+
+
+settings = LazySettings()
@@ -1,123 +1,238 @@
 from web3_client import web3_client
+from reserves_state import reserves_mirror
+from quote_engine import quote_batch
+from route_graph import route_graph
+from trade_sizing import compose_reserves
 from config import settings
 from decimal import Decimal
 import logging
-from cachetools import TTLCache
+from metadata_store import metadata_store
+from pair_indexer import pair_index
 import asyncio
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 class DexPriceFetcher:
     def __init__(self):
-        self.router = web3_client.uniswap_router
-        self.decimals_cache = TTLCache(maxsize=500, ttl=3600)
-        self.pair_cache = TTLCache(maxsize=500, ttl=300)  # Cache pair addresses for 5 minutes
+        # token -> pairs whose reserves determine its USDT pool (direct or routed)
+        self.pool_pairs: Dict[str, List[str]] = {}
 
     async def _get_decimals(self, token_address: str) -> int:
         """Get token decimals with caching"""
-        if token_address in self.decimals_cache:
-            return self.decimals_cache[token_address]
-        
+        decimals = await self._get_decimals_many([token_address])
+        return decimals[token_address]
+
+    async def _get_decimals_many(self, token_addresses: List[str]) -> Dict[str, int]:
+        """Get decimals for many tokens from the metadata store, fetching misses in one batch"""
+        results = {}
+        missing = []
+        for token_address in token_addresses:
+            decimals = metadata_store.get_decimals(token_address)
+            if decimals is not None:
+                results[token_address] = decimals
+            elif token_address not in missing:
+                missing.append(token_address)
+
+        if not missing:
+            return results
+
         try:
-            token_contract = web3_client.get_contract(
-                token_address,
-                abi=[
-                    {
-                        "constant": True,
-                        "inputs": [],
-                        "name": "decimals",
-                        "outputs": [{"name": "", "type": "uint8"}],
-                        "type": "function"
-                    }
-                ]
-            )
-            decimals = token_contract.functions.decimals().call()
-            self.decimals_cache[token_address] = decimals
-            return decimals
+            fetched = await web3_client.batch_call([
+                (web3_client.get_contract(token_address, abi=settings.ERC20_ABI), "decimals", ())
+                for token_address in missing
+            ])
         except Exception as e:
-            logging.error(f"Error fetching decimals for token {token_address}: {e}")
-            return 18  # Default to 18 decimals
+            logging.error(f"Error fetching decimals for tokens {missing}: {e}")
+            fetched = [None] * len(missing)
+
+        for token_address, decimals in zip(missing, fetched):
+            if decimals is None:
+                logging.error(f"Error fetching decimals for token {token_address}")
+                results[token_address] = 18  # Default to 18 decimals
+            else:
+                metadata_store.set_decimals(token_address, decimals)
+                results[token_address] = decimals
+        return results
 
     async def _get_pair_address(self, token_address: str, usdt_address: str) -> Optional[str]:
-        """Get the pair address for a token/USDT pair with caching"""
-        cache_key = f"{token_address}:{usdt_address}"
-        if cache_key in self.pair_cache:
-            return self.pair_cache[cache_key]
-            
+        """Get the pair address for a token/USDT pair from the metadata store"""
+        pair_address = metadata_store.get_pair(token_address, usdt_address)
+        if pair_address:
+            return pair_address
+        if pair_index.known_missing(token_address, usdt_address):
+            return None
+
         try:
             # Ensure addresses are checksum format
             token_address = web3_client.convert_to_checksum_address(token_address)
             usdt_address = web3_client.convert_to_checksum_address(usdt_address)
-            
+
             factory = web3_client.uniswap_factory
-            pair_address = factory.functions.getPair(token_address, usdt_address).call()
-            
+            pair_address = await factory.functions.getPair(token_address, usdt_address).call()
+
             if pair_address == '0x' + '0'*40:
                 return None
-                
-            self.pair_cache[cache_key] = pair_address
+
+            metadata_store.set_pair(token_address, usdt_address, pair_address)
             return pair_address
         except Exception as e:
             logging.error(f"Error getting pair address: {e}")
             return None
 
     async def get_price_with_slippage(self, token_address: str, amount_usd: Decimal) -> Optional[Decimal]:
-        """Get price for a token with slippage applied"""
+        """Get the per-token execution price for selling `amount_usd` tokens into the USDT pool"""
+        prices = await self.get_prices_with_slippage([token_address], amount_usd)
+        return prices.get(token_address)
+
+    async def get_prices_with_slippage(self, token_addresses: List[str], amount_usd: Decimal) -> Dict[str, Optional[Decimal]]:
+        """Get execution prices for many tokens, quoted locally from mirrored reserves.
+
+        Quotes whose true price impact exceeds MAX_SLIPPAGE are rejected (None).
+        """
+        quotes = await self.get_quotes(token_addresses, [amount_usd])
+        results = {}
+        for token_address in token_addresses:
+            quote = quotes.get(token_address)
+            if quote is None:
+                results[token_address] = None
+                continue
+
+            price, impact = quote[0]
+            if impact > settings.MAX_SLIPPAGE:
+                logging.info(f"Price impact {impact*100:.2f}% for {amount_usd} of {token_address} exceeds max slippage")
+                results[token_address] = None
+            else:
+                results[token_address] = price
+        return results
+
+    async def get_quotes(self, token_addresses: List[str], amounts: List[Decimal]) -> Dict[str, Optional[List[Tuple[Decimal, Decimal]]]]:
+        """Quote selling each amount of each token for USDT in one vectorized pass.
+
+        Returns, per token, a (execution price per token, price impact) tuple for
+        every amount, or None when the pair or its reserves are unknown.
+        """
+        results = {}
         try:
-            web3_client.reconnect_if_needed()
-            
             # Get token information
-            token_decimals = await self._get_decimals(token_address)
+            token_decimals = await self._get_decimals_many(token_addresses)
             usdt_address = settings.TOKENS["USDT"]
             usdt_decimals = 6  # USDT always has 6 decimals
-            
-            # Calculate the amount in token's smallest unit
-            amount_in_wei = int(amount_usd * 10**token_decimals)
-            
-            try:
-                # Try direct price query first
-                amounts = self.router.functions.getAmountsOut(
-                    amount_in_wei,
-                    [token_address, usdt_address]
-                ).call()
-                
-                price = Decimal(amounts[1]) / 10**usdt_decimals
-                return price * (1 - settings.MAX_SLIPPAGE)
-            except Exception as e:
-                logging.warning(f"Direct price query failed: {e}")
-                
-                # Fallback to reserves calculation
+
+            pairs = {}
+            for token_address in token_addresses:
                 pair_address = await self._get_pair_address(token_address, usdt_address)
                 if not pair_address:
-                    logging.error(f"No liquidity pair found for {token_address} and USDT")
-                    return None
-                    
-                pair_contract = web3_client.get_contract(
-                    pair_address,
-                    abi=settings.UNISWAP_PAIR_ABI
+                    # No direct pool: route through the hub tokens instead
+                    results[token_address] = await self._get_routed_quotes(token_address, amounts, token_decimals[token_address])
+                    continue
+                pairs[token_address] = pair_address
+            await reserves_mirror.track(pairs.values())
+        except Exception as e:
+            logging.error(f"DEX price error: {e}")
+            return {token_address: None for token_address in token_addresses}
+
+        quoted, amounts_in, reserves_in, reserves_out = [], [], [], []
+        for token_address, pair_address in pairs.items():
+            reserves = reserves_mirror.get_reserves(pair_address)
+            if reserves is None:
+                results[token_address] = None
+                continue
+
+            # Determine which reserve belongs to which token
+            token0, _ = reserves_mirror.get_pair_tokens(pair_address)
+            if token0.lower() == token_address.lower():
+                reserves_in.append(reserves[0])
+                reserves_out.append(reserves[1])
+            else:
+                reserves_in.append(reserves[1])
+                reserves_out.append(reserves[0])
+
+            # Calculate the amounts in token's smallest unit
+            amounts_in.append([int(Decimal(amount) * 10**token_decimals[token_address]) for amount in amounts])
+            quoted.append(token_address)
+
+        if not quoted:
+            return results
+
+        amounts_out, impacts = quote_batch(amounts_in, reserves_in, reserves_out)
+        for row, token_address in enumerate(quoted):
+            results[token_address] = [
+                (
+                    (Decimal(amounts_out[row][col]) / 10**usdt_decimals) / Decimal(amount) if amount else Decimal(0),
+                    Decimal(str(impacts[row][col]))
                 )
-                
-                # Get token order in the pair
-                token0 = pair_contract.functions.token0().call()
-                token1 = pair_contract.functions.token1().call()
-                
-                # Get reserves
-                reserves = pair_contract.functions.getReserves().call()
-                
-                # Determine which reserve belongs to which token
-                if token0.lower() == token_address.lower():
-                    token_reserve = reserves[0]
-                    usdt_reserve = reserves[1]
+                for col, amount in enumerate(amounts)
+            ]
+        return results
+
+    async def _get_routed_quotes(self, token_address: str, amounts: List[Decimal],
+                                 token_decimals: int) -> Optional[List[Tuple[Decimal, Decimal]]]:
+        """Quote a token without a direct USDT pool along its best multi-hop route"""
+        usdt_address = settings.TOKENS["USDT"]
+        usdt_decimals = 6  # USDT always has 6 decimals
+        await route_graph.track_token(token_address)
+
+        quotes = []
+        for amount in amounts:
+            amount_in = int(Decimal(amount) * 10**token_decimals)
+            route = route_graph.best_route(token_address, usdt_address, amount_in)
+            if route is None or amount_in == 0:
+                logging.error(f"No liquidity route found for {token_address} to USDT")
+                return None
+
+            path, pairs, amount_out = route
+            realized = amount_out / amount_in
+            impact = 1 - realized / route_graph.mid_rate(path, pairs)
+            price = (Decimal(amount_out) / 10**usdt_decimals) / Decimal(amount)
+            quotes.append((price, Decimal(str(impact))))
+        return quotes
+
+    async def get_pools(self, token_addresses: List[str]) -> Dict[str, Optional[Tuple[float, float]]]:
+        """(token reserve, USDT reserve) in whole units for each token's USDT pool.
+
+        Tokens without a direct pool get the equivalent pool of their best route.
+        """
+        results = {}
+        try:
+            token_decimals = await self._get_decimals_many(token_addresses)
+            usdt_address = settings.TOKENS["USDT"]
+            usdt_decimals = 6  # USDT always has 6 decimals
+
+            for token_address in token_addresses:
+                pair_address = await self._get_pair_address(token_address, usdt_address)
+                if pair_address:
+                    await reserves_mirror.track([pair_address])
+                    self.pool_pairs[token_address] = [pair_address]
+                    reserves = reserves_mirror.get_reserves(pair_address)
+                    tokens = reserves_mirror.get_pair_tokens(pair_address)
+                    if reserves is None:
+                        results[token_address] = None
+                        continue
+                    if tokens[0].lower() == token_address.lower():
+                        raw = (reserves[0], reserves[1])
+                    else:
+                        raw = (reserves[1], reserves[0])
                 else:
-                    token_reserve = reserves[1]
-                    usdt_reserve = reserves[0]
-                
-                # Calculate price based on reserves (with slippage)
-                if token_reserve == 0:
-                    return None
-                    
-                price = (Decimal(usdt_reserve) / 10**usdt_decimals) / (Decimal(token_reserve) / 10**token_decimals)
-                return price * (1 - settings.MAX_SLIPPAGE)
-                
+                    await route_graph.track_token(token_address)
+                    route = route_graph.best_route(token_address, usdt_address, 10**token_decimals[token_address])
+                    if route is None:
+                        results[token_address] = None
+                        continue
+                    path, pairs, _ = route
+                    # Any pair touching the token can change which route is best
+                    self.pool_pairs[token_address] = list(
+                        set(pairs) | set(route_graph.edges.get(token_address.lower(), {}).values())
+                    )
+                    raw = compose_reserves([
+                        route_graph.oriented_reserves(token_in, pair_address)
+                        for token_in, pair_address in zip(path, pairs)
+                    ])
+
+                results[token_address] = (
+                    raw[0] / 10**token_decimals[token_address],
+                    raw[1] / 10**usdt_decimals
+                )
         except Exception as e:
-            logging.error(f"DEX price error: {e}")
-            return None
\ No newline at end of file
+            logging.error(f"DEX pool error: {e}")
+            for token_address in token_addresses:
+                results.setdefault(token_address, None)
+        return results
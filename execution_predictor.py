@@ -1,32 +1,291 @@
-from decimal import Decimal
 import numpy as np
-import joblib
-from sklearn.ensemble import GradientBoostingRegressor
-from datetime import datetime
+from metrics import MeteredLRUCache
+from compiled_model import CompiledEnsemble, compile_model
+import bisect
 import logging
+import math
 import os
 from config import settings
-from typing import List, Dict, Union, Any
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Inputs of the optional correction model, in column order
+MODEL_FEATURES = ['cex_p50', 'cex_p95', 'dex_p50', 'dex_p95', 'size']
+# One-sided z-score of the 95th percentile, for the EWMA fallback
+Z_95 = 1.645
+
+
+class P2Quantile:
+    """Streaming quantile estimate in constant memory (Jain & Chlamtac's P² algorithm).
+
+    Five markers track the minimum, the q/2, q and (1+q)/2 quantiles and the
+    maximum; each observation moves the middle markers by at most one
+    position, adjusting their heights with a piecewise-parabolic fit.
+    """
+
+    def __init__(self, q: float):
+        self.q = q
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5.0]
+        self.increments = [0.0, q / 2, q, (1 + q) / 2, 1.0]
+
+    def add(self, x: float):
+        self.count += 1
+        heights = self.heights
+        if len(heights) < 5:
+            bisect.insort(heights, x)
+            return
+
+        if x < heights[0]:
+            heights[0] = x
+            cell = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            cell = 3
+        else:
+            cell = bisect.bisect_right(heights, x) - 1
+        for i in range(cell + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        positions = self.positions
+        for i in (1, 2, 3):
+            offset = self.desired[i] - positions[i]
+            if ((offset >= 1 and positions[i + 1] - positions[i] > 1)
+                    or (offset <= -1 and positions[i - 1] - positions[i] < -1)):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        n, h = self.positions, self.heights
+        return h[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            # Too few samples for the markers yet: exact quantile of what we have
+            return self.heights[int(round(self.q * (len(self.heights) - 1)))]
+        return self.heights[2]
+
+
+class LatencyStats:
+    """Recent latency of one venue in bounded memory.
+
+    P² sketches give p50/p95 over windows of PREDICTOR_WINDOW samples. The
+    previous window answers while the current one warms up, so estimates
+    follow a change in conditions within one window. Until a window is warm
+    an EWMA of the mean and variance stands in.
+    """
+
+    def __init__(self):
+        self.current = self._sketches()
+        self.previous: Optional[Tuple[P2Quantile, P2Quantile]] = None
+        self.ewma: Optional[float] = None
+        self.ewvar = 0.0
+        self.count = 0
+
+    @staticmethod
+    def _sketches() -> Tuple[P2Quantile, P2Quantile]:
+        return P2Quantile(0.5), P2Quantile(0.95)
+
+    def add(self, seconds: float):
+        self.count += 1
+        if self.ewma is None:
+            self.ewma = seconds
+        else:
+            alpha = settings.PREDICTOR_EWMA_ALPHA
+            diff = seconds - self.ewma
+            self.ewma += alpha * diff
+            self.ewvar = (1 - alpha) * (self.ewvar + alpha * diff * diff)
+
+        for sketch in self.current:
+            sketch.add(seconds)
+        if self.current[0].count >= settings.PREDICTOR_WINDOW:
+            self.previous, self.current = self.current, self._sketches()
+
+    def estimate(self) -> Optional[Tuple[float, float]]:
+        """(p50, p95) in seconds, or None before the first sample"""
+        if self.ewma is None:
+            return None
+        sketches = self.current if self.current[0].count >= settings.PREDICTOR_MIN_SAMPLES else self.previous
+        if sketches is None:
+            return self.ewma, self.ewma + Z_95 * math.sqrt(self.ewvar)
+        return sketches[0].value(), sketches[1].value()
+
+
+class ExecutionEstimate(NamedTuple):
+    p50: float
+    p95: float
+
 
 class ExecutionPredictor:
+    """Execution-time estimates learned online from measured latencies.
+
+    CEX request latencies are recorded per exchange by the REST client, and
+    DEX inclusion time from block intervals seen by the reserves mirror (or
+    from real receipts via record_inclusion). The two legs run concurrently,
+    so a trade completes when the slower one does. A model at ML_MODEL_PATH,
+    when present, adds a correction from MODEL_FEATURES on top.
+    """
+
     def __init__(self):
-        self.model = self._load_model()
-        self.features = {
-            'latency': [],
-            'volume': [],
-            'spread': [],
-            'timestamp': []
-        }
-        self.exchange_latency = {}
+        self.latency: Dict[str, LatencyStats] = {}
+        self.inclusion = LatencyStats()
+        self.last_block: Optional[Tuple[int, int]] = None
+        # Estimates measured in another process (sharded workers make no requests of their own)
+        self.adopted: Dict[str, Tuple[float, float]] = {}
+        self.adopted_inclusion: Optional[Tuple[float, float]] = None
+        # Corrections by quantized feature row; the cache and model are set up on first estimate
+        self.cache: Optional[MeteredLRUCache] = None
+        self.model: Optional[Any] = None
+        self.compiled: Optional[CompiledEnsemble] = None
 
-    def _load_model(self) -> GradientBoostingRegressor:
-        """Load the ML model or create a default one if loading fails"""
+    def _ensure_model(self):
+        if self.cache is None:
+            self.cache = MeteredLRUCache('predictor', maxsize=settings.PREDICTOR_CACHE_SIZE)
+            self.model, self.compiled = self._load_model()
+
+    def _load_model(self) -> Tuple[Optional[Any], Optional[CompiledEnsemble]]:
+        """Load the optional correction model, compiled to node tables whenever possible.
+
+        The tables are saved next to the pickle, so later starts need neither
+        sklearn nor joblib. Models that cannot be compiled run through sklearn.
+        """
+        path = settings.ML_MODEL_PATH
+        if not os.path.exists(path):
+            logging.info(f"Model file {path} not found, predicting from observed latencies only")
+            return None, None
+        compiled_path = f"{path}.npz"
         try:
-            # Check if model file exists
-            if os.path.exists(settings.ML_MODEL_PATH):
-                return joblib.load(settings.ML_MODEL_PATH)
-            else:
-                logging.warning(f"Model file {settings.ML_MODEL_PATH} not found, using default model")
-                return self._create_default_model()
+            if os.path.exists(compiled_path) and os.path.getmtime(compiled_path) >= os.path.getmtime(path):
+                return None, CompiledEnsemble.load(compiled_path)
+            import joblib
+            model = joblib.load(path)
+            if getattr(model, 'n_features_in_', len(MODEL_FEATURES)) != len(MODEL_FEATURES):
+                logging.warning(f"Model {path} does not take {MODEL_FEATURES}, predicting from observed latencies only")
+                return None, None
+            compiled = compile_model(model, len(MODEL_FEATURES))
+            if compiled is None:
+                logging.info("Execution model cannot be compiled, using sklearn inference")
+                return model, None
+            try:
+                compiled.save(compiled_path)
+            except OSError as e:
+                logging.warning(f"Could not save compiled execution model: {e}")
+            return None, compiled
         except Exception as e:
-            logging.warning(f"Error loading model: {e}. Using default model.")
\ No newline at end of file
+            logging.warning(f"Error loading model: {e}. Predicting from observed latencies only.")
+            return None, None
+
+    def record_latency(self, exchange: str, seconds: float):
+        """A completed CEX REST round trip"""
+        stats = self.latency.get(exchange)
+        if stats is None:
+            stats = self.latency[exchange] = LatencyStats()
+        stats.add(seconds)
+
+    def record_inclusion(self, seconds: float):
+        """Time from submitting a DEX transaction to its inclusion"""
+        self.inclusion.add(seconds)
+
+    def record_block(self, number: int, timestamp: int):
+        """A new chain head; the block interval bounds how long inclusion takes"""
+        if self.last_block is not None and number > self.last_block[0]:
+            previous_number, previous_timestamp = self.last_block
+            self.inclusion.add((timestamp - previous_timestamp) / (number - previous_number))
+        self.last_block = (number, timestamp)
+
+    def export(self, exchanges: Sequence[str]) -> np.ndarray:
+        """(p50, p95) per exchange, then DEX inclusion, NaN where nothing was measured"""
+        values = np.full((len(exchanges) + 1, 2), np.nan)
+        for index, exchange in enumerate(exchanges):
+            stats = self.latency.get(exchange)
+            estimate = stats.estimate() if stats else None
+            if estimate is not None:
+                values[index] = estimate
+        inclusion = self.inclusion.estimate()
+        if inclusion is not None:
+            values[-1] = inclusion
+        return values
+
+    def adopt(self, exchanges: Sequence[str], values: np.ndarray):
+        """Use estimates exported by another process where this one has not measured its own"""
+        self.adopted = {
+            exchange: (float(values[index, 0]), float(values[index, 1]))
+            for index, exchange in enumerate(exchanges) if not np.isnan(values[index, 0])
+        }
+        self.adopted_inclusion = None if np.isnan(values[-1, 0]) else (float(values[-1, 0]), float(values[-1, 1]))
+
+    def _base(self, exchange: str) -> Tuple[float, float, float, float]:
+        stats = self.latency.get(exchange)
+        cex = ((stats.estimate() if stats else None) or self.adopted.get(exchange)
+               or (settings.PREDICTOR_DEFAULT_CEX_LATENCY,) * 2)
+        dex = (self.inclusion.estimate() or self.adopted_inclusion
+               or (settings.PREDICTOR_DEFAULT_INCLUSION_TIME,) * 2)
+        return cex[0], cex[1], dex[0], dex[1]
+
+    def estimate(self, exchange: str, size: float) -> ExecutionEstimate:
+        """p50/p95 execution time in seconds, from the current sketches in O(1)"""
+        p50, p95 = self.estimate_batch([exchange], [size])
+        return ExecutionEstimate(float(p50[0]), float(p95[0]))
+
+    def estimate_batch(self, exchanges: Sequence[str], sizes: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """p50 and p95 arrays for many (exchange, size) candidates, with one model call"""
+        self._ensure_model()
+        base = np.array([self._base(exchange) for exchange in exchanges], dtype=np.float64).reshape(-1, 4)
+        p50 = np.maximum(base[:, 0], base[:, 2])
+        p95 = np.maximum(base[:, 1], base[:, 3])
+        if self.model is not None or self.compiled is not None:
+            correction = self._corrections(np.column_stack([base, np.asarray(sizes, dtype=np.float64)]))
+            p50 = np.maximum(0.0, p50 + correction)
+            p95 = np.maximum(p50, p95 + correction)
+        return p50, p95
+
+    def predict_batch(self, exchanges: Sequence[str], sizes: Sequence[float]) -> np.ndarray:
+        """Conservative (p95) execution times for every candidate of a scan cycle"""
+        return self.estimate_batch(exchanges, sizes)[1]
+
+    def _corrections(self, features: np.ndarray) -> np.ndarray:
+        """Model output per row, evaluating only rows whose quantized features are not cached"""
+        # Log-spaced buckets: about PREDICTOR_CACHE_STEP relative width per feature
+        buckets = np.round(np.log1p(np.maximum(features, 0.0)) / settings.PREDICTOR_CACHE_STEP).astype(np.int64)
+        keys = [row.tobytes() for row in buckets]
+        corrections = np.empty(len(keys))
+        missing = []
+        for index, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(index)
+            else:
+                corrections[index] = cached
+        if missing:
+            try:
+                if self.compiled is not None:
+                    computed = self.compiled.predict(features[missing])
+                else:
+                    computed = self.model.predict(features[missing])
+            except Exception as e:
+                logging.warning(f"Execution model failed, disabling it: {e}")
+                self.model = self.compiled = None
+                return np.zeros(len(keys))
+            for index, value in zip(missing, computed):
+                corrections[index] = value
+                self.cache[keys[index]] = float(value)
+        return corrections
+
+    async def predict(self, exchange: str, size: float) -> float:
+        """Conservative (p95) execution time for a trade of `size` on `exchange`"""
+        return self.estimate(exchange, size).p95
+
+
+execution_predictor = ExecutionPredictor()
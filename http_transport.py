@@ -0,0 +1,102 @@
+from config import settings
+import aiohttp
+import asyncio
+import logging
+import ssl
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+
+class HttpTransport:
+    """One tuned aiohttp session shared by the exchange clients and notifications.
+
+    Connections are pooled per host with keep-alive and a DNS cache, requests
+    get explicit connect/read timeouts, TLS is verified, and the hosts used on
+    the hot path can be pre-warmed at startup so the first scan does not pay
+    for TCP and TLS handshakes. A trace hook counts new versus reused
+    connections per host.
+    """
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        # host -> {'requests', 'new', 'reused', 'dns'}
+        self.host_stats: Dict[str, Dict[str, int]] = {}
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.HTTP_POOL_SIZE,
+                limit_per_host=settings.HTTP_POOL_PER_HOST,
+                ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+                ssl=ssl.create_default_context(),
+                enable_cleanup_closed=True
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    connect=settings.HTTP_CONNECT_TIMEOUT,
+                    sock_read=settings.HTTP_READ_TIMEOUT
+                ),
+                trace_configs=[self._trace_config()]
+            )
+        return self.session
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        def count(context: SimpleNamespace, field: str):
+            host = getattr(context, 'host', None)
+            if host is not None:
+                stats = self.host_stats.setdefault(host, {'requests': 0, 'new': 0, 'reused': 0, 'dns': 0})
+                stats[field] += 1
+
+        async def on_request_start(session, context, params):
+            context.host = params.url.host
+            count(context, 'requests')
+
+        async def on_connection_create_end(session, context, params):
+            count(context, 'new')
+
+        async def on_connection_reuseconn(session, context, params):
+            count(context, 'reused')
+
+        async def on_dns_resolvehost_end(session, context, params):
+            count(context, 'dns')
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        return trace
+
+    async def prewarm(self, urls: Iterable[str]):
+        """Open a kept-alive connection to each URL's host ahead of the first real request"""
+        session = await self.get_session()
+        origins = {f"{parts.scheme}://{parts.netloc}/" for parts in map(urlsplit, urls) if parts.netloc}
+
+        async def touch(origin: str):
+            try:
+                async with session.head(origin, allow_redirects=False) as response:
+                    await response.read()
+            except Exception as e:
+                logging.debug(f"Pre-warming {origin} failed: {e!r}")
+
+        await asyncio.gather(*(touch(origin) for origin in origins))
+        logging.info(f"Pre-warmed connections to {len(origins)} hosts")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-host request counts and the share of requests served on a reused connection"""
+        return {
+            host: {**stats, 'reuse_ratio': stats['reused'] / stats['requests'] if stats['requests'] else 0.0}
+            for host, stats in self.host_stats.items()
+        }
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+http_transport = HttpTransport()
@@ -0,0 +1,202 @@
+from arbitrage import ArbitrageEngine
+from config import settings
+from market_stream import market_stream
+from reserves_state import reserves_mirror
+from decimal import Decimal
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set, Tuple
+
+# A (symbol, exchange) evaluation cell
+Cell = Tuple[str, str]
+
+
+class IncrementalEngine:
+    """Change-driven evaluation: only (symbol, exchange) cells whose inputs moved are re-run.
+
+    Inputs mark cells dirty as they change: a streamed CEX tick dirties one
+    cell, a Sync on any pair behind a token's pool dirties that token's row,
+    and a new Chainlink round dirties every cell verified against that feed.
+    Pools, liquidity and each cell's last evaluated inputs are memoized, so a
+    pass skips cells whose (pool, CEX price) did not actually change. REST-only
+    exchanges are polled on INCREMENTAL_FALLBACK_INTERVAL and only dirty the
+    cells whose price differs from the memoized one. Tokens whose pool could not
+    be read (or came back empty) are retried every INCREMENTAL_POOL_RETRY_INTERVAL,
+    since no Sync will ever arrive for a pair that is not mirrored.
+    """
+
+    def __init__(self, engine: ArbitrageEngine):
+        self.engine = engine
+        self.tokens: Dict[str, str] = {}
+        self.dirty_cells: Set[Cell] = set()
+        self.dirty_pools: Set[str] = set()
+        self.changed = asyncio.Event()
+        # symbol -> (pool, liquidity)
+        self.pools: Dict[str, Tuple[Optional[Tuple[float, float]], Decimal]] = {}
+        self.prices: Dict[Cell, Decimal] = {}
+        # cell -> (pool, CEX price) it was last evaluated with
+        self.evaluated: Dict[Cell, Tuple[Tuple[float, float], Decimal]] = {}
+        self.pair_symbols: Dict[str, Set[str]] = {}
+        self.tasks = []
+        self.evaluations = 0
+        self.skipped = 0
+
+        reserves_mirror.add_listener(self.on_reserves_update)
+        market_stream.board.add_listener(self.on_tick)
+        engine.chainlink.add_listener(self.on_oracle_round)
+
+    def _mark(self, cells, pools=()):
+        self.dirty_cells.update(cells)
+        self.dirty_pools.update(pools)
+        if self.dirty_cells or self.dirty_pools:
+            self.changed.set()
+
+    def _row(self, symbol: str):
+        return [(symbol, exchange) for exchange in settings.EXCHANGES]
+
+    def on_reserves_update(self, changed_pairs: Set[str], block: int):
+        symbols = set()
+        for pair_address in changed_pairs:
+            symbols |= self.pair_symbols.get(pair_address, set())
+        for symbol in symbols:
+            self._mark(self._row(symbol), [symbol])
+
+    def on_tick(self, exchange: str, pair: str):
+        symbol, quote = pair.split("/")
+        if quote == "USDT" and symbol in self.tokens:
+            self._mark([(symbol, exchange)])
+
+    def on_oracle_round(self, feed_pair: str):
+        symbol = feed_pair.split("/")[0]
+        if symbol in self.tokens:
+            # Cells that failed verification may pass now; force them through the memo
+            for cell in self._row(symbol):
+                self.evaluated.pop(cell, None)
+            self._mark(self._row(symbol))
+
+    async def start(self):
+        for symbol, address in settings.TOKENS.items():
+            if symbol != "USDT":
+                self.tokens[symbol] = address
+                await market_stream.watch(f"{symbol}/USDT")
+                self._mark(self._row(symbol), [symbol])
+        self.tasks = [
+            asyncio.create_task(self._evaluate_loop()),
+            asyncio.create_task(self._poll_rest()),
+            asyncio.create_task(self._poll_oracles())
+        ]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def run(self):
+        await self.start()
+        try:
+            await asyncio.gather(*self.tasks)
+        finally:
+            await self.stop()
+
+    async def _evaluate_loop(self):
+        while True:
+            await self.changed.wait()
+            # Let a burst of events (one block's Syncs, a flurry of ticks) coalesce
+            await asyncio.sleep(settings.INCREMENTAL_DEBOUNCE)
+            self.changed.clear()
+            cells, self.dirty_cells = self.dirty_cells, set()
+            pools, self.dirty_pools = self.dirty_pools, set()
+            try:
+                await self._evaluate(cells, pools)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Incremental evaluation failed: {e}")
+
+    async def _refresh_pools(self, symbols: Set[str]):
+        addresses = [self.tokens[symbol] for symbol in symbols]
+        pools = await self.engine.liquidity.get_pools(addresses)
+        for symbol, address in zip(symbols, addresses):
+            self.pools[symbol] = pools.get(address, (None, Decimal(0)))
+            for pair_address in self.engine.dex.pool_pairs.get(address, []):
+                self.pair_symbols.setdefault(pair_address, set()).add(symbol)
+
+    async def _evaluate(self, cells: Set[Cell], pools: Set[str]):
+        if pools:
+            await self._refresh_pools(pools)
+
+        by_symbol: Dict[str, Dict[str, Dict]] = {}
+        inputs: Dict[Cell, Tuple] = {}
+        for symbol, exchange in cells:
+            pool, liquidity = self.pools.get(symbol, (None, Decimal(0)))
+            if pool is None or pool[0] <= 0 or liquidity < settings.MIN_LIQUIDITY:
+                continue
+            price = market_stream.get_price(exchange, f"{symbol}/USDT") or self.prices.get((symbol, exchange))
+            if price is None:
+                continue
+            self.prices[(symbol, exchange)] = price
+            if self.evaluated.get((symbol, exchange)) == (pool, price):
+                self.skipped += 1
+                continue
+            inputs[(symbol, exchange)] = (pool, price)
+            by_symbol.setdefault(symbol, {})[exchange] = {'success': True, 'price': price}
+
+        # Every dirty cell of the pass goes through one vectorized screen
+        rows = []
+        for symbol, quoted in by_symbol.items():
+            pool, liquidity = self.pools[symbol]
+            result = {'symbol': symbol, 'status': 'no_edge', 'dex_price': pool[1] / pool[0],
+                      'best_profit': Decimal(0), 'alerts': 0}
+            rows.append((symbol, pool, liquidity, quoted, result))
+            self.evaluations += len(quoted)
+        await self.engine.evaluate_many(rows)
+        # Memoize only once evaluated, so cells of a failed pass are not skipped as unchanged later
+        self.evaluated.update(inputs)
+
+    def _retry_missing_pools(self):
+        """Re-dirty tokens whose pool is unknown or empty, so a new or recovered pool is picked up"""
+        missing = [symbol for symbol, (pool, liquidity) in self.pools.items() if pool is None or liquidity <= 0]
+        for symbol in missing:
+            self._mark(self._row(symbol), [symbol])
+        if missing:
+            logging.debug(f"Retrying pools for {len(missing)} tokens: {missing}")
+
+    async def _poll_rest(self):
+        """Refresh exchanges the stream does not cover, dirtying only cells whose price moved"""
+        pools_retried = time.monotonic()
+        while True:
+            started = time.monotonic()
+            if started - pools_retried >= settings.INCREMENTAL_POOL_RETRY_INTERVAL:
+                pools_retried = started
+                self._retry_missing_pools()
+            for symbol in list(self.tokens):
+                pair = f"{symbol}/USDT"
+                stale = [exchange for exchange in settings.EXCHANGES
+                         if market_stream.get_price(exchange, pair) is None]
+                if not stale:
+                    continue
+                try:
+                    prices = await self.engine.cex.get_prices(pair)
+                except Exception as e:
+                    logging.error(f"REST refresh of {pair} failed: {e}")
+                    continue
+                for exchange in stale:
+                    data = prices.get(exchange, {})
+                    if data.get('success') and self.prices.get((symbol, exchange)) != data['price']:
+                        self.prices[(symbol, exchange)] = data['price']
+                        self._mark([(symbol, exchange)])
+            await asyncio.sleep(max(0.0, settings.INCREMENTAL_FALLBACK_INTERVAL - (time.monotonic() - started)))
+
+    async def _poll_oracles(self):
+        """Read the feeds of tracked tokens so new rounds reach on_oracle_round"""
+        while True:
+            try:
+                await self.engine.chainlink.get_prices([f"{symbol}/USD" for symbol in self.tokens])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Oracle poll failed: {e}")
+            logging.debug(f"Incremental engine: {self.evaluations} cells evaluated, {self.skipped} skipped as unchanged")
+            await asyncio.sleep(settings.INCREMENTAL_ORACLE_INTERVAL)
@@ -1,20 +1,60 @@
+import argparse
 import asyncio
+import sys
 from arbitrage import ArbitrageEngine
+from scanner import Scanner
+from incremental_engine import IncrementalEngine
+from sharding import ShardedRunner
 from telegram_notifier import notifier
+from web3_client import web3_client
+from reserves_state import reserves_mirror
+from pair_indexer import pair_index
+from market_stream import market_stream
+from http_transport import http_transport
+from metrics import metrics
+from startup_check import check_startup
+import logging
+from config import settings
 
 async def main():
+    await metrics.start()
+    await web3_client.connect()
+    await reserves_mirror.start()
+    await pair_index.start()
+    await market_stream.start()
     await notifier.start()  # Запуск TelegramNotifier
     engine = ArbitrageEngine()
+    await engine.chainlink.start()
+    await http_transport.prewarm(engine.cex.endpoints() + ["https://api.telegram.org/"])
+
+    if settings.ENGINE_MODE == 'incremental':
+        runner = IncrementalEngine(engine)
+    elif settings.ENGINE_MODE == 'sharded':
+        runner = ShardedRunner(engine)
+    else:
+        runner = Scanner(engine)
 
     try:
-        while True:
-            # Пример анализа пары
-            await engine.analyze_pair("ETH", "0x...")  # Замените на реальные данные
-            await asyncio.sleep(5)  # Пауза между итерациями
+        await runner.run()
     except asyncio.CancelledError:
         pass
     finally:
         await notifier.stop()  # Корректное завершение TelegramNotifier
+        await engine.chainlink.stop()
+        await reserves_mirror.stop()
+        await pair_index.stop()
+        await market_stream.stop()
+        await engine.cex.close()
+        await web3_client.close()
+        logging.info(f"HTTP connection reuse: {http_transport.stats()}")
+        await http_transport.close()
+        await metrics.stop()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CEX/DEX arbitrage scanner")
+    parser.add_argument("--check-startup", action="store_true",
+                        help="time imports, settings, client construction and provider probes, then exit")
+    args = parser.parse_args()
+    if args.check_startup:
+        sys.exit(0 if asyncio.run(check_startup()) else 1)
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,531 @@
+from config import settings
+from cex_symbols import to_exchange_symbol
+from order_book import OrderBook
+from rate_limiter import rate_limiter
+from http_transport import http_transport
+from metrics import metrics
+from decimal import Decimal
+import aiohttp
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# (price, monotonic time it was received, exchange sequence or None)
+Tick = Tuple[Decimal, float, Optional[int]]
+
+
+class PriceBoard:
+    """Latest streamed price and L2 book per (exchange, pair), read locally by the scanner"""
+
+    def __init__(self):
+        self.ticks: Dict[Tuple[str, str], Tick] = {}
+        self.books: Dict[Tuple[str, str], OrderBook] = {}
+        self.gaps: Dict[str, int] = {}
+        # Called with (exchange, pair) whenever a streamed price changes
+        self.listeners: List[Callable[[str, str], None]] = []
+
+    def add_listener(self, callback: Callable[[str, str], None]):
+        self.listeners.append(callback)
+
+    def book(self, exchange: str, pair: str) -> OrderBook:
+        key = (exchange, pair)
+        if key not in self.books:
+            self.books[key] = OrderBook()
+        return self.books[key]
+
+    def get_book(self, exchange: str, pair: str, max_age: float = None) -> Optional[OrderBook]:
+        """Synced book if it was updated within `max_age` seconds"""
+        book = self.books.get((exchange, pair))
+        if book is None or not book.synced:
+            return None
+        if max_age is not None and time.monotonic() - book.updated > max_age:
+            return None
+        return book
+
+    def count_gap(self, exchange: str):
+        self.gaps[exchange] = self.gaps.get(exchange, 0) + 1
+
+    def update(self, exchange: str, pair: str, price: Decimal, sequence: Optional[int] = None,
+               contiguous: bool = False) -> bool:
+        """Record a tick; out-of-order or duplicate sequences are dropped.
+
+        With `contiguous` sequences a skipped number means a missed update,
+        which is counted per exchange.
+        """
+        key = (exchange, pair)
+        previous = self.ticks.get(key)
+        if sequence is not None and previous is not None and previous[2] is not None:
+            if sequence <= previous[2]:
+                return False
+            if contiguous and sequence > previous[2] + 1:
+                self.count_gap(exchange)
+                logging.debug(f"{exchange} {pair} missed {sequence - previous[2] - 1} updates")
+        self.ticks[key] = (price, time.monotonic(), sequence)
+        if previous is None or previous[0] != price:
+            for callback in self.listeners:
+                try:
+                    callback(exchange, pair)
+                except Exception as e:
+                    logging.error(f"Price board listener failed: {e}")
+        return True
+
+    def get(self, exchange: str, pair: str, max_age: float = None) -> Optional[Decimal]:
+        """Latest price if it is younger than `max_age` seconds"""
+        tick = self.ticks.get((exchange, pair))
+        if tick is None:
+            return None
+        if max_age is not None and time.monotonic() - tick[1] > max_age:
+            return None
+        return tick[0]
+
+    def reset_sequences(self, exchange: str):
+        """Forget sequences and books after a reconnect, since both restart per session"""
+        for key, (price, received, _) in list(self.ticks.items()):
+            if key[0] == exchange:
+                self.ticks[key] = (price, received, None)
+        for key, book in self.books.items():
+            if key[0] == exchange:
+                book.reset()
+
+
+class StreamAdapter:
+    """One exchange's WebSocket ticker feed: connect, subscribe, parse, reconnect"""
+
+    exchange = ''
+    url = ''
+    # Whether the parsed sequence increases by exactly one per update
+    contiguous_sequence = False
+
+    def __init__(self, board: PriceBoard):
+        self.board = board
+        self.pairs: Set[str] = set()
+        # exchange symbol -> pair, for the pairs subscribed on this feed
+        self.symbols: Dict[str, str] = {}
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.task: Optional[asyncio.Task] = None
+        self.message_id = 0
+
+    def _next_id(self) -> int:
+        self.message_id += 1
+        return self.message_id
+
+    async def watch(self, pairs: Iterable[str]):
+        """Add pairs to the feed, subscribing on the live connection if there is one"""
+        new = [pair for pair in pairs if pair not in self.pairs]
+        if not new:
+            return
+        for pair in new:
+            self.pairs.add(pair)
+            self.symbols[to_exchange_symbol(self.exchange, pair)] = pair
+        if self.ws is not None and not self.ws.closed:
+            try:
+                await self._subscribe(new)
+            except Exception as e:
+                logging.warning(f"{self.exchange} subscribe failed, will retry on reconnect: {e}")
+
+    def start(self, session: aiohttp.ClientSession):
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._run(session))
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, session: aiohttp.ClientSession):
+        self.session = session
+        delay = 1.0
+        while True:
+            try:
+                url = await self._connect_url(session)
+                async with session.ws_connect(url, heartbeat=settings.CEX_STREAM_HEARTBEAT) as ws:
+                    self.ws = ws
+                    self.board.reset_sequences(self.exchange)
+                    self._reset_sync()
+                    if self.pairs:
+                        await self._subscribe(sorted(self.pairs))
+                    logging.info(f"{self.exchange} stream connected, {len(self.pairs)} pairs")
+                    delay = 1.0
+                    await self._read(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"{self.exchange} stream error: {e!r}")
+            finally:
+                self.ws = None
+
+            # Exponential backoff with jitter so all feeds do not reconnect in step
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, settings.CEX_STREAM_RECONNECT_MAX_DELAY)
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse):
+        last_message = time.monotonic()
+        while True:
+            try:
+                message = await ws.receive(timeout=self._receive_timeout())
+            except asyncio.TimeoutError:
+                # A silent feed is treated as dead even if the socket still looks open
+                if time.monotonic() - last_message > settings.CEX_STREAM_STALE_AFTER:
+                    raise ConnectionError("no data within CEX_STREAM_STALE_AFTER")
+                await self._keepalive(ws)
+                continue
+
+            if message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                raise ConnectionError(f"socket closed ({message.type.name})")
+            last_message = time.monotonic()
+            await self._keepalive(ws)
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(message.data)
+            except ValueError:
+                continue
+            for pair, price, sequence in self._parse(data):
+                self.board.update(self.exchange, pair, price, sequence, self.contiguous_sequence)
+            if settings.CEX_ORDER_BOOKS:
+                self._parse_depth(data)
+
+    def _receive_timeout(self) -> float:
+        return settings.CEX_STREAM_STALE_AFTER
+
+    async def _connect_url(self, session: aiohttp.ClientSession) -> str:
+        return self.url
+
+    async def _keepalive(self, ws: aiohttp.ClientWebSocketResponse):
+        pass
+
+    def _reset_sync(self):
+        """Drop per-connection book sync state; the board's books were just reset"""
+        pass
+
+    async def _subscribe(self, pairs: List[str]):
+        raise NotImplementedError
+
+    def _parse(self, data: Any) -> List[Tuple[str, Decimal, Optional[int]]]:
+        raise NotImplementedError
+
+    def _parse_depth(self, data: Any):
+        """Apply L2 snapshot/diff messages to the board's books; ticker-only feeds ignore them"""
+        pass
+
+    @staticmethod
+    def _levels(levels: Iterable) -> List[Tuple[float, float]]:
+        return [(float(level[0]), float(level[1])) for level in levels]
+
+
+class BinanceStream(StreamAdapter):
+    exchange = 'binance'
+    url = 'wss://stream.binance.com:9443/ws'
+
+    depth_url = 'https://api.binance.com/api/v3/depth'
+
+    def __init__(self, board: PriceBoard):
+        super().__init__(board)
+        # Diffs received while a book's REST snapshot is loading
+        self.pending: Dict[str, List[dict]] = {}
+        self.syncing: Dict[str, asyncio.Task] = {}
+        # Books loaded from a snapshot with no buffered diff; their first diff may overlap it
+        self.awaiting_first: Set[str] = set()
+
+    def _reset_sync(self):
+        # Diffs and snapshots from the old connection cannot be stitched onto the new one
+        for task in self.syncing.values():
+            task.cancel()
+        self.syncing.clear()
+        self.pending.clear()
+        self.awaiting_first.clear()
+
+    async def _subscribe(self, pairs: List[str]):
+        streams = []
+        for pair in pairs:
+            symbol = to_exchange_symbol(self.exchange, pair).lower()
+            streams.append(f"{symbol}@ticker")
+            if settings.CEX_ORDER_BOOKS:
+                streams.append(f"{symbol}@depth@100ms")
+        await self.ws.send_json({"method": "SUBSCRIBE", "params": streams, "id": self._next_id()})
+
+    def _parse(self, data: Any) -> List[Tuple[str, Decimal, Optional[int]]]:
+        if not isinstance(data, dict) or data.get('e') != '24hrTicker':
+            return []
+        pair = self.symbols.get(data.get('s', ''))
+        if pair is None:
+            return []
+        # Last trade id is monotonic per symbol
+        return [(pair, Decimal(data['c']), int(data['L']))]
+
+    def _parse_depth(self, data: Any):
+        if not isinstance(data, dict) or data.get('e') != 'depthUpdate':
+            return
+        pair = self.symbols.get(data.get('s', ''))
+        if pair is None:
+            return
+        book = self.board.book(self.exchange, pair)
+        if book.synced and pair in self.awaiting_first:
+            # Binance's sync rule: drop diffs already in the snapshot, then the
+            # first one applied must span lastUpdateId + 1 (U <= id + 1 <= u)
+            if data['u'] <= book.sequence:
+                return
+            self.awaiting_first.discard(pair)
+            expected = data['U'] <= book.sequence + 1
+        else:
+            expected = data['U'] == book.sequence + 1
+        if book.synced and not expected:
+            # Missed a diff: the book can no longer be trusted, rebuild it
+            logging.debug(f"binance {pair} depth gap {book.sequence} -> {data['U']}, resyncing")
+            self.board.count_gap(self.exchange)
+            book.reset()
+        if not book.synced:
+            self.pending.setdefault(pair, []).append(data)
+            if pair not in self.syncing or self.syncing[pair].done():
+                self.syncing[pair] = asyncio.create_task(self._sync_book(pair))
+            return
+        self._apply_diff(book, data)
+
+    def _apply_diff(self, book: OrderBook, data: dict):
+        book.apply(self._levels(data['b']), self._levels(data['a']))
+        book.sequence = data['u']
+        book.updated = time.monotonic()
+
+    async def _sync_book(self, pair: str):
+        """Load a REST depth snapshot and replay the buffered diffs on top of it"""
+        try:
+            params = {"symbol": to_exchange_symbol(self.exchange, pair), "limit": settings.CEX_BOOK_DEPTH}
+            await rate_limiter.acquire(self.exchange, 'depth')
+            with metrics.timer("arb_http_request_seconds", exchange=self.exchange, endpoint='depth'):
+                async with self.session.get(self.depth_url, params=params) as response:
+                    rate_limiter.on_response(self.exchange, response.status, response.headers.get('Retry-After'))
+                    if response.status != 200:
+                        raise Exception(f"Error {response.status}: {await response.text()}")
+                    snapshot = await response.json()
+        except Exception as e:
+            logging.warning(f"binance {pair} depth snapshot failed: {e!r}")
+            self.pending.pop(pair, None)
+            return
+
+        book = self.board.book(self.exchange, pair)
+        last_update = snapshot['lastUpdateId']
+        buffered = [diff for diff in self.pending.pop(pair, []) if diff['u'] > last_update]
+        if buffered and buffered[0]['U'] > last_update + 1:
+            # Snapshot is older than the first diff we hold; the next diff retries
+            return
+        book.load(self._levels(snapshot['bids']), self._levels(snapshot['asks']), last_update)
+        book.updated = time.monotonic()
+        if buffered:
+            self.awaiting_first.discard(pair)
+        else:
+            self.awaiting_first.add(pair)
+        for index, diff in enumerate(buffered):
+            if index and diff['U'] != book.sequence + 1:
+                # A diff went missing while buffering: start over from a fresh snapshot
+                logging.debug(f"binance {pair} buffered depth gap {book.sequence} -> {diff['U']}, resyncing")
+                self.board.count_gap(self.exchange)
+                book.reset()
+                self.pending[pair] = buffered[index:]
+                self.syncing[pair] = asyncio.create_task(self._sync_book(pair))
+                return
+            self._apply_diff(book, diff)
+
+
+class KucoinStream(StreamAdapter):
+    exchange = 'kucoin'
+    token_url = 'https://api.kucoin.com/api/v1/bullet-public'
+
+    def __init__(self, board: PriceBoard):
+        super().__init__(board)
+        self.ping_interval = 18.0
+        self.last_ping = 0.0
+
+    async def _connect_url(self, session: aiohttp.ClientSession) -> str:
+        # KuCoin hands out a short-lived token and endpoint for each connection
+        async with session.post(self.token_url) as response:
+            payload = await response.json()
+        server = payload['data']['instanceServers'][0]
+        self.ping_interval = server.get('pingInterval', 18000) / 1000
+        return f"{server['endpoint']}?token={payload['data']['token']}&connectId={self._next_id()}"
+
+    async def _subscribe(self, pairs: List[str]):
+        symbols = ",".join(to_exchange_symbol(self.exchange, pair) for pair in pairs)
+        await self.ws.send_json({
+            "id": str(self._next_id()),
+            "type": "subscribe",
+            "topic": f"/market/ticker:{symbols}",
+            "response": True
+        })
+
+    def _receive_timeout(self) -> float:
+        return min(settings.CEX_STREAM_STALE_AFTER, self.ping_interval)
+
+    async def _keepalive(self, ws: aiohttp.ClientWebSocketResponse):
+        # KuCoin drops connections that do not send application-level pings
+        now = time.monotonic()
+        if now - self.last_ping >= self.ping_interval:
+            self.last_ping = now
+            await ws.send_json({"id": str(self._next_id()), "type": "ping"})
+
+    def _parse(self, data: Any) -> List[Tuple[str, Decimal, Optional[int]]]:
+        if not isinstance(data, dict) or data.get('type') != 'message':
+            return []
+        symbol = data.get('topic', '').rsplit(':', 1)[-1]
+        pair = self.symbols.get(symbol)
+        ticker = data.get('data', {})
+        if pair is None or 'price' not in ticker:
+            return []
+        sequence = ticker.get('sequence')
+        return [(pair, Decimal(str(ticker['price'])), int(sequence) if sequence is not None else None)]
+
+
+class KrakenStream(StreamAdapter):
+    exchange = 'kraken'
+    url = 'wss://ws.kraken.com/v2'
+
+    async def _subscribe(self, pairs: List[str]):
+        await self.ws.send_json({
+            "method": "subscribe",
+            "params": {"channel": "ticker", "symbol": [to_exchange_symbol(self.exchange, pair) for pair in pairs]},
+            "req_id": self._next_id()
+        })
+        if settings.CEX_ORDER_BOOKS:
+            await self.ws.send_json({
+                "method": "subscribe",
+                "params": {
+                    "channel": "book",
+                    "symbol": [to_exchange_symbol(self.exchange, pair) for pair in pairs],
+                    "depth": settings.CEX_BOOK_DEPTH
+                },
+                "req_id": self._next_id()
+            })
+
+    def _parse(self, data: Any) -> List[Tuple[str, Decimal, Optional[int]]]:
+        if not isinstance(data, dict) or data.get('channel') != 'ticker':
+            return []
+        ticks = []
+        for ticker in data.get('data', []):
+            pair = self.symbols.get(ticker.get('symbol', ''))
+            # Best ask, matching the REST ticker field used by _extract_price
+            if pair is not None and ticker.get('ask') is not None:
+                ticks.append((pair, Decimal(str(ticker['ask'])), None))
+        return ticks
+
+    def _parse_depth(self, data: Any):
+        if not isinstance(data, dict) or data.get('channel') != 'book':
+            return
+        for update in data.get('data', []):
+            pair = self.symbols.get(update.get('symbol', ''))
+            if pair is None:
+                continue
+            book = self.board.book(self.exchange, pair)
+            bids = [(float(level['price']), float(level['qty'])) for level in update.get('bids', [])]
+            asks = [(float(level['price']), float(level['qty'])) for level in update.get('asks', [])]
+            if data.get('type') == 'snapshot':
+                book.load(bids, asks)
+            elif book.synced:
+                book.apply(bids, asks)
+                # Kraken only maintains the subscribed depth; levels pushed out must be dropped
+                book.bids.truncate(settings.CEX_BOOK_DEPTH)
+                book.asks.truncate(settings.CEX_BOOK_DEPTH)
+            else:
+                continue
+            book.updated = time.monotonic()
+
+
+class CoinbaseStream(StreamAdapter):
+    exchange = 'coinbase'
+    url = 'wss://ws-feed.exchange.coinbase.com'
+    # One ticker per match, and trade ids are consecutive per product
+    contiguous_sequence = True
+
+    async def _subscribe(self, pairs: List[str]):
+        await self.ws.send_json({
+            "type": "subscribe",
+            "product_ids": [to_exchange_symbol(self.exchange, pair) for pair in pairs],
+            "channels": ["ticker", "level2_batch"] if settings.CEX_ORDER_BOOKS else ["ticker"]
+        })
+
+    def _parse(self, data: Any) -> List[Tuple[str, Decimal, Optional[int]]]:
+        if not isinstance(data, dict) or data.get('type') != 'ticker':
+            return []
+        pair = self.symbols.get(data.get('product_id', ''))
+        if pair is None or 'price' not in data:
+            return []
+        trade_id = data.get('trade_id')
+        return [(pair, Decimal(str(data['price'])), int(trade_id) if trade_id is not None else None)]
+
+    def _parse_depth(self, data: Any):
+        if not isinstance(data, dict) or data.get('type') not in ('snapshot', 'l2update'):
+            return
+        pair = self.symbols.get(data.get('product_id', ''))
+        if pair is None:
+            return
+        book = self.board.book(self.exchange, pair)
+        if data['type'] == 'snapshot':
+            book.load(self._levels(data['bids']), self._levels(data['asks']))
+        elif book.synced:
+            changes = data.get('changes', [])
+            book.apply(
+                [(float(price), float(size)) for side, price, size in changes if side == 'buy'],
+                [(float(price), float(size)) for side, price, size in changes if side == 'sell']
+            )
+        else:
+            return
+        book.updated = time.monotonic()
+
+
+ADAPTERS = {
+    adapter.exchange: adapter
+    for adapter in (BinanceStream, KucoinStream, KrakenStream, CoinbaseStream)
+}
+
+
+class MarketStream:
+    """WebSocket ticker feeds for the configured exchanges, feeding one price board.
+
+    CEXClient reads the board first and only falls back to REST for exchanges
+    without a stream or whose last tick is older than CEX_STREAM_MAX_AGE.
+    """
+
+    def __init__(self):
+        self.board = PriceBoard()
+        self.adapters: Dict[str, StreamAdapter] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        if not settings.CEX_STREAM_ENABLED:
+            return
+        # The shared pooled session, so depth snapshots reuse the REST clients' connections and DNS cache
+        self.session = await http_transport.get_session()
+        for exchange in settings.EXCHANGES:
+            adapter_class = ADAPTERS.get(exchange)
+            if adapter_class is None:
+                continue
+            if exchange not in self.adapters:
+                self.adapters[exchange] = adapter_class(self.board)
+            self.adapters[exchange].start(self.session)
+
+    async def stop(self):
+        for adapter in self.adapters.values():
+            await adapter.stop()
+        # The session belongs to http_transport, which closes it on shutdown
+        self.session = None
+
+    async def watch(self, pair: str):
+        """Make sure every streaming exchange is subscribed to a pair"""
+        for adapter in self.adapters.values():
+            await adapter.watch([pair])
+
+    def get_price(self, exchange: str, pair: str) -> Optional[Decimal]:
+        """Streamed price if the exchange has a fresh one"""
+        return self.board.get(exchange, pair, settings.CEX_STREAM_MAX_AGE)
+
+    def get_book(self, exchange: str, pair: str) -> Optional[OrderBook]:
+        """Synced local order book if the exchange has a fresh one"""
+        return self.board.get_book(exchange, pair, settings.CEX_STREAM_MAX_AGE)
+
+
+market_stream = MarketStream()
@@ -0,0 +1,157 @@
+from config import settings
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Tuple
+
+class MetadataStore:
+    """SQLite-backed registry of on-chain facts that never change.
+
+    Pair addresses, pair token ordering, token decimals and Chainlink feed
+    decimals are loaded into memory on first use and written through on miss,
+    so a restart does not have to fetch them again.
+    """
+
+    def __init__(self, path: str = None):
+        # Resolved on first use, so importing the store reads no settings
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.pairs: Dict[Tuple[str, str], str] = {}
+        self.pair_tokens: Dict[str, Tuple[str, str]] = {}
+        self.token_decimals: Dict[str, int] = {}
+        self.feed_decimals: Dict[str, int] = {}
+
+    def _ensure_loaded(self):
+        if self.conn is not None:
+            return
+
+        self.path = self.path or settings.METADATA_DB_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pairs (
+                token_a TEXT NOT NULL,
+                token_b TEXT NOT NULL,
+                pair TEXT NOT NULL,
+                PRIMARY KEY (token_a, token_b)
+            );
+            CREATE TABLE IF NOT EXISTS pair_tokens (
+                pair TEXT PRIMARY KEY,
+                token0 TEXT NOT NULL,
+                token1 TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS token_decimals (
+                token TEXT PRIMARY KEY,
+                decimals INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS feed_decimals (
+                feed TEXT PRIMARY KEY,
+                decimals INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+        for token_a, token_b, pair in self.conn.execute("SELECT token_a, token_b, pair FROM pairs"):
+            self.pairs[(token_a, token_b)] = pair
+        for pair, token0, token1 in self.conn.execute("SELECT pair, token0, token1 FROM pair_tokens"):
+            self.pair_tokens[pair.lower()] = (token0, token1)
+        for token, decimals in self.conn.execute("SELECT token, decimals FROM token_decimals"):
+            self.token_decimals[token] = decimals
+        for feed, decimals in self.conn.execute("SELECT feed, decimals FROM feed_decimals"):
+            self.feed_decimals[feed] = decimals
+        logging.info(f"Loaded metadata for {len(self.pairs)} pairs and {len(self.token_decimals)} tokens from {self.path}")
+
+    @staticmethod
+    def _pair_key(token_a: str, token_b: str) -> Tuple[str, str]:
+        token_a, token_b = token_a.lower(), token_b.lower()
+        return (token_a, token_b) if token_a < token_b else (token_b, token_a)
+
+    def _write(self, sql: str, params: tuple):
+        try:
+            self.conn.execute(sql, params)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Metadata store write failed: {e}")
+
+    def get_pair(self, token_a: str, token_b: str) -> Optional[str]:
+        self._ensure_loaded()
+        return self.pairs.get(self._pair_key(token_a, token_b))
+
+    def set_pair(self, token_a: str, token_b: str, pair_address: str):
+        self._ensure_loaded()
+        key = self._pair_key(token_a, token_b)
+        self.pairs[key] = pair_address
+        self._write("INSERT OR REPLACE INTO pairs VALUES (?, ?, ?)", (*key, pair_address))
+
+    def add_pairs(self, rows: List[Tuple[str, str, str]]):
+        """Record many (pair, token0, token1) factory pairs in one transaction"""
+        self._ensure_loaded()
+        for pair_address, token0, token1 in rows:
+            self.pairs[self._pair_key(token0, token1)] = pair_address
+            self.pair_tokens[pair_address.lower()] = (token0, token1)
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO pairs VALUES (?, ?, ?)",
+                    [(*self._pair_key(token0, token1), pair_address) for pair_address, token0, token1 in rows]
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO pair_tokens VALUES (?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Metadata store write failed: {e}")
+
+    def iter_pairs(self) -> Iterator[Tuple[str, str, str]]:
+        """Every stored (pair, token0, token1), with addresses as originally recorded"""
+        self._ensure_loaded()
+        return iter(self.conn.execute("SELECT pair, token0, token1 FROM pair_tokens").fetchall())
+
+    def get_meta(self, key: str) -> Optional[str]:
+        self._ensure_loaded()
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self._ensure_loaded()
+        self._write("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def get_pair_tokens(self, pair_address: str) -> Optional[Tuple[str, str]]:
+        self._ensure_loaded()
+        return self.pair_tokens.get(pair_address.lower())
+
+    def set_pair_tokens(self, pair_address: str, token0: str, token1: str):
+        self._ensure_loaded()
+        self.pair_tokens[pair_address.lower()] = (token0, token1)
+        self._write("INSERT OR REPLACE INTO pair_tokens VALUES (?, ?, ?)", (pair_address, token0, token1))
+
+    def get_decimals(self, token_address: str) -> Optional[int]:
+        self._ensure_loaded()
+        return self.token_decimals.get(token_address.lower())
+
+    def set_decimals(self, token_address: str, decimals: int):
+        self._ensure_loaded()
+        self.token_decimals[token_address.lower()] = decimals
+        self._write("INSERT OR REPLACE INTO token_decimals VALUES (?, ?)", (token_address.lower(), decimals))
+
+    def get_feed_decimals(self, feed_address: str) -> Optional[int]:
+        self._ensure_loaded()
+        return self.feed_decimals.get(feed_address.lower())
+
+    def set_feed_decimals(self, feed_address: str, decimals: int):
+        self._ensure_loaded()
+        self.feed_decimals[feed_address.lower()] = decimals
+        self._write("INSERT OR REPLACE INTO feed_decimals VALUES (?, ?)", (feed_address.lower(), decimals))
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+metadata_store = MetadataStore()
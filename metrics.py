@@ -0,0 +1,238 @@
+from config import settings
+from cachetools import LRUCache, TTLCache
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+# Histogram values are recorded in integer microseconds. Below 2**SIGNIFICANT_BITS
+# every value has its own bucket; above, each power of two is split into
+# 2**(SIGNIFICANT_BITS - 1) buckets, i.e. about 1.6% relative precision.
+SIGNIFICANT_BITS = 7
+HALF = 1 << (SIGNIFICANT_BITS - 1)
+EXACT_LIMIT = 1 << SIGNIFICANT_BITS
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+T = TypeVar('T')
+LabelKey = Tuple[Tuple[str, str], ...]
+SeriesKey = Tuple[str, LabelKey]
+
+
+def _bucket(micros: int) -> int:
+    if micros < EXACT_LIMIT:
+        return micros
+    shift = micros.bit_length() - SIGNIFICANT_BITS
+    return shift * HALF + (micros >> shift)
+
+
+def _bucket_midpoint(index: int) -> float:
+    if index < EXACT_LIMIT:
+        return float(index)
+    shift = (index >> (SIGNIFICANT_BITS - 1)) - 1
+    mantissa = index - shift * HALF
+    return ((mantissa << shift) + ((mantissa + 1) << shift) - 1) / 2
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """HDR-style log-linear latency histogram: O(1) recording, bounded relative error.
+
+    Buckets are kept sparsely, so a series only pays for the latency range it
+    actually sees.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        index = _bucket(max(0, int(seconds * 1e6)))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q, in seconds (0 when empty)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_midpoint(index) / 1e6, self.max)
+        return self.max
+
+
+class Timer:
+    """Context manager adding its elapsed time to one histogram series"""
+
+    __slots__ = ('metrics', 'key', 'started')
+
+    def __init__(self, metrics: "Metrics", key: SeriesKey):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self) -> "Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe_key(self.key, time.perf_counter() - self.started)
+
+
+class Metrics:
+    """Process-wide counters, gauges and latency histograms, exported as Prometheus text.
+
+    Series are identified by a metric name plus keyword labels. Histograms
+    are exported as summaries (p50/p90/p99/p99.9, sum and count) plus a max gauge.
+    Gauges can also be computed on scrape from registered callbacks, e.g. a
+    queue's current depth. With METRICS_ENABLED the text is served on
+    http://METRICS_HOST:METRICS_PORT/metrics.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[SeriesKey, Histogram] = {}
+        self.counters: Dict[SeriesKey, float] = {}
+        self.gauges: Dict[SeriesKey, float] = {}
+        self.gauge_callbacks: Dict[SeriesKey, Callable[[], float]] = {}
+        self.runner = None
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> SeriesKey:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def observe_key(self, key: SeriesKey, seconds: float):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.record(seconds)
+
+    def observe(self, name: str, seconds: float, **labels):
+        self.observe_key(self._key(name, labels), seconds)
+
+    def timer(self, name: str, **labels) -> Timer:
+        return Timer(self, self._key(name, labels))
+
+    async def timed(self, awaitable: Awaitable[T], name: str, **labels) -> T:
+        """Await `awaitable`, timing it; for stages run side by side under asyncio.gather"""
+        with self.timer(name, **labels):
+            return await awaitable
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def gauge_callback(self, name: str, callback: Callable[[], float], **labels):
+        self.gauge_callbacks[self._key(name, labels)] = callback
+
+    @staticmethod
+    def _series(name: str, labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return name
+        rendered = ",".join(f'{label}="{_escape(value)}"' for label, value in pairs)
+        return f"{name}{{{rendered}}}"
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+
+        def by_name(series: Dict[SeriesKey, object]) -> Dict[str, List[Tuple[LabelKey, object]]]:
+            grouped: Dict[str, List[Tuple[LabelKey, object]]] = {}
+            for (name, labels), value in series.items():
+                grouped.setdefault(name, []).append((labels, value))
+            return grouped
+
+        for name, series in sorted(by_name(self.counters).items()):
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{self._series(name, labels)} {value}" for labels, value in series]
+
+        gauges = dict(self.gauges)
+        for key, callback in self.gauge_callbacks.items():
+            try:
+                gauges[key] = float(callback())
+            except Exception as e:
+                logging.debug(f"Gauge {key[0]} failed: {e}")
+        for name, series in sorted(by_name(gauges).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines += [f"{self._series(name, labels)} {value}" for labels, value in series]
+
+        for name, series in sorted(by_name(self.histograms).items()):
+            lines.append(f"# TYPE {name} summary")
+            for labels, histogram in series:
+                for q in QUANTILES:
+                    lines.append(f"{self._series(name, labels, ('quantile', str(q)))} {histogram.quantile(q)}")
+                lines.append(f"{self._series(name + '_sum', labels)} {histogram.total}")
+                lines.append(f"{self._series(name + '_count', labels)} {histogram.count}")
+            # Summaries have no max sample, so the worst case is its own gauge
+            lines.append(f"# TYPE {name}_max gauge")
+            lines += [f"{self._series(name + '_max', labels)} {histogram.max}" for labels, histogram in series]
+        return "\n".join(lines) + "\n"
+
+    async def start(self):
+        """Serve /metrics locally; aiohttp.web is only imported when the endpoint is enabled"""
+        if not settings.METRICS_ENABLED or self.runner is not None:
+            return
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(body=self.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, settings.METRICS_HOST, settings.METRICS_PORT).start()
+        logging.info(f"Metrics on http://{settings.METRICS_HOST}:{settings.METRICS_PORT}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+metrics = Metrics()
+
+
+class MeteredTTLCache(TTLCache):
+    """TTLCache counting membership checks (and .get) as hits and misses of `name`"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.hit_key = metrics._key("arb_cache_lookups_total", {'cache': name, 'result': 'hit'})
+        self.miss_key = metrics._key("arb_cache_lookups_total", {'cache': name, 'result': 'miss'})
+
+    def __contains__(self, key) -> bool:
+        found = super().__contains__(key)
+        counter = self.hit_key if found else self.miss_key
+        metrics.counters[counter] = metrics.counters.get(counter, 0.0) + 1
+        return found
+
+
+class MeteredLRUCache(LRUCache):
+    """LRUCache counting membership checks (and .get) as hits and misses of `name`"""
+
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(maxsize=maxsize)
+        self.hit_key = metrics._key("arb_cache_lookups_total", {'cache': name, 'result': 'hit'})
+        self.miss_key = metrics._key("arb_cache_lookups_total", {'cache': name, 'result': 'miss'})
+
+    def __contains__(self, key) -> bool:
+        found = super().__contains__(key)
+        counter = self.hit_key if found else self.miss_key
+        metrics.counters[counter] = metrics.counters.get(counter, 0.0) + 1
+        return found
@@ -0,0 +1,101 @@
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+
+class BookSide:
+    """One side of an L2 book as parallel sorted arrays of price keys and sizes.
+
+    Keys are prices for asks and negated prices for bids, so index 0 is always
+    the best level and a walk from the front touches levels in fill order.
+    """
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.keys: List[float] = []
+        self.sizes: List[float] = []
+
+    def _key(self, price: float) -> float:
+        return -price if self.is_bid else price
+
+    def set(self, price: float, size: float):
+        """Set the size at a price level; zero removes the level"""
+        key = self._key(price)
+        index = bisect_left(self.keys, key)
+        exists = index < len(self.keys) and self.keys[index] == key
+        if size <= 0:
+            if exists:
+                del self.keys[index]
+                del self.sizes[index]
+        elif exists:
+            self.sizes[index] = size
+        else:
+            self.keys.insert(index, key)
+            self.sizes.insert(index, size)
+
+    def replace(self, levels: Iterable[Tuple[float, float]]):
+        """Load a full snapshot of (price, size) levels"""
+        ordered = sorted((self._key(price), size) for price, size in levels if size > 0)
+        self.keys = [key for key, _ in ordered]
+        self.sizes = [size for _, size in ordered]
+
+    def truncate(self, depth: int):
+        del self.keys[depth:]
+        del self.sizes[depth:]
+
+    def best(self) -> Optional[float]:
+        if not self.keys:
+            return None
+        return -self.keys[0] if self.is_bid else self.keys[0]
+
+    def vwap(self, amount: float) -> Optional[float]:
+        """Average fill price for `amount` base units, or None if the side is too thin"""
+        if amount <= 0:
+            return self.best()
+        remaining = amount
+        cost = 0.0
+        for key, size in zip(self.keys, self.sizes):
+            fill = size if size < remaining else remaining
+            cost += fill * key
+            remaining -= fill
+            if remaining <= 0:
+                average = cost / amount
+                return -average if self.is_bid else average
+        return None
+
+
+class OrderBook:
+    """Local L2 book for one exchange market, kept in sync from snapshot plus diffs"""
+
+    def __init__(self):
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.sequence: Optional[int] = None
+        self.synced = False
+        self.updated: float = 0.0
+
+    def load(self, bids: Iterable[Tuple[float, float]], asks: Iterable[Tuple[float, float]],
+             sequence: Optional[int] = None):
+        self.bids.replace(bids)
+        self.asks.replace(asks)
+        self.sequence = sequence
+        self.synced = True
+
+    def apply(self, bids: Iterable[Tuple[float, float]], asks: Iterable[Tuple[float, float]]):
+        for price, size in bids:
+            self.bids.set(price, size)
+        for price, size in asks:
+            self.asks.set(price, size)
+
+    def reset(self):
+        self.bids.replace([])
+        self.asks.replace([])
+        self.sequence = None
+        self.synced = False
+
+    def vwap_buy(self, amount: float) -> Optional[float]:
+        """Average price paid to buy `amount` base units by lifting asks"""
+        return self.asks.vwap(amount)
+
+    def vwap_sell(self, amount: float) -> Optional[float]:
+        """Average price received selling `amount` base units into bids"""
+        return self.bids.vwap(amount)
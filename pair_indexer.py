@@ -0,0 +1,164 @@
+from web3_client import web3_client
+from config import settings
+from metadata_store import metadata_store
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+# keccak256("PairCreated(address,address,address,uint256)")
+PAIR_CREATED_TOPIC = '0x0d3648bd0f6ba80134a33ba9275ac585d9d315f0ad8355cddefde31afa28d0e9'
+
+class PairIndex:
+    """Index of every Uniswap V2 factory pair, queryable by either token.
+
+    The first run backfills allPairs through batched calls, each chunk
+    pinned to a recent block so a long backfill stays within a pruned
+    node's state window; after that the index follows PairCreated logs.
+    Everything is persisted in the metadata store, so restarts only catch up
+    on new pairs. Once complete the index answers "no such pair" without a
+    factory getPair call (pairs younger than one poll interval aside).
+    """
+
+    def __init__(self):
+        # token -> {other token: pair}, all keys lowercase
+        self.by_token: Dict[str, Dict[str, str]] = {}
+        self.pairs: Dict[str, Tuple[str, str]] = {}
+        self.pair_count = 0
+        self.last_block: Optional[int] = None
+        self.complete = False
+        # Backfilled pairs whose tokens could not be read; negatives are not trusted while any exist
+        self.unreadable = 0
+        self.task = None
+
+    def _add(self, pair_address: str, token0: str, token1: str):
+        self.pairs[pair_address] = (token0, token1)
+        self.by_token.setdefault(token0.lower(), {})[token1.lower()] = pair_address
+        self.by_token.setdefault(token1.lower(), {})[token0.lower()] = pair_address
+
+    def get_pair(self, token_a: str, token_b: str) -> Optional[str]:
+        """Pair address for two tokens, in either order"""
+        return self.by_token.get(token_a.lower(), {}).get(token_b.lower())
+
+    def known_missing(self, token_a: str, token_b: str) -> bool:
+        """True when the index is complete and has no pair for the two tokens"""
+        return self.complete and self.get_pair(token_a, token_b) is None
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    async def start(self):
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                if self.last_block is None:
+                    await self.load()
+                else:
+                    await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Pair index update failed: {e}")
+            await asyncio.sleep(settings.INDEXER_POLL_INTERVAL)
+
+    async def load(self):
+        """Load persisted pairs, then backfill any allPairs entries not indexed yet"""
+        for pair_address, token0, token1 in metadata_store.iter_pairs():
+            self._add(pair_address, token0, token1)
+        self.pair_count = int(metadata_store.get_meta("indexed_pairs") or 0)
+        self.unreadable = int(metadata_store.get_meta("unreadable_pairs") or 0)
+        stored_block = metadata_store.get_meta("indexed_block")
+
+        block = await web3_client.w3.eth.block_number
+        if stored_block is not None and block - int(stored_block) <= settings.INDEXER_MAX_BLOCK_RANGE:
+            # Close enough to catch up from logs instead of allPairs
+            self.last_block = int(stored_block)
+            await self.poll()
+            self.complete = self.unreadable == 0
+            return
+
+        total = await web3_client.uniswap_factory.functions.allPairsLength().call(block_identifier=block)
+        if total > self.pair_count:
+            logging.info(f"Indexing factory pairs {self.pair_count}..{total} at block {block}")
+        while self.pair_count < total:
+            end = min(total, self.pair_count + settings.INDEXER_BATCH_SIZE)
+            # allPairs only grows, so any block after `block` agrees on these indices
+            await self._backfill(self.pair_count, end, await web3_client.w3.eth.block_number)
+        # Logs from `block` on cover pairs created while the backfill ran
+        self._save_progress(block)
+        self.complete = self.unreadable == 0
+        logging.info(f"Pair index ready: {len(self)} pairs across {len(self.by_token)} tokens")
+
+    async def _backfill(self, start: int, end: int, block: int):
+        factory = web3_client.uniswap_factory
+        pair_addresses = await web3_client.batch_call(
+            [(factory, "allPairs", (index,)) for index in range(start, end)],
+            block_identifier=block
+        )
+
+        calls = []
+        for pair_address in pair_addresses:
+            pair_contract = web3_client.get_contract(pair_address, abi=settings.UNISWAP_PAIR_ABI)
+            calls.append((pair_contract, "token0", ()))
+            calls.append((pair_contract, "token1", ()))
+        tokens = await web3_client.batch_call(calls, block_identifier=block)
+
+        rows = []
+        for index, pair_address in enumerate(pair_addresses):
+            token0, token1 = tokens[2 * index], tokens[2 * index + 1]
+            if token0 is None or token1 is None:
+                logging.warning(f"Could not read tokens of factory pair {pair_address}")
+                self.unreadable += 1
+                continue
+            rows.append((pair_address, token0, token1))
+            self._add(pair_address, token0, token1)
+        metadata_store.add_pairs(rows)
+        self.pair_count = end
+        metadata_store.set_meta("indexed_pairs", str(self.pair_count))
+        metadata_store.set_meta("unreadable_pairs", str(self.unreadable))
+
+    async def poll(self):
+        """Add pairs from PairCreated logs since the last indexed block"""
+        head = await web3_client.w3.eth.block_number
+        while self.last_block < head:
+            from_block = self.last_block + 1
+            to_block = min(head, self.last_block + settings.INDEXER_MAX_BLOCK_RANGE)
+            logs = await web3_client.w3.eth.get_logs({
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'address': settings.UNISWAP_FACTORY_ADDRESS,
+                'topics': [PAIR_CREATED_TOPIC]
+            })
+
+            rows = [self._decode_pair_created(log) for log in logs if not log.get('removed')]
+            for pair_address, token0, token1 in rows:
+                self._add(pair_address, token0, token1)
+            if rows:
+                metadata_store.add_pairs(rows)
+                logging.info(f"Indexed {len(rows)} new pairs up to block {to_block}")
+            self.pair_count += len(rows)
+            self._save_progress(to_block)
+
+    def _decode_pair_created(self, log: dict) -> Tuple[str, str, str]:
+        token0 = web3_client.convert_to_checksum_address(bytes(log['topics'][1])[-20:])
+        token1 = web3_client.convert_to_checksum_address(bytes(log['topics'][2])[-20:])
+        pair_address = web3_client.convert_to_checksum_address(bytes(log['data'])[12:32])
+        return pair_address, token0, token1
+
+    def _save_progress(self, block: int):
+        self.last_block = block
+        metadata_store.set_meta("indexed_pairs", str(self.pair_count))
+        metadata_store.set_meta("indexed_block", str(block))
+
+
+pair_index = PairIndex()
@@ -0,0 +1,50 @@
+from config import settings
+import numpy as np
+from typing import List, Sequence, Tuple
+
+def fee_fraction() -> Tuple[int, int]:
+    """Fraction of the input kept after the LP fee, e.g. (997, 1000) for DEX_COMMISSION = 0.003"""
+    numerator, denominator = settings.DEX_COMMISSION.as_integer_ratio()
+    return denominator - numerator, denominator
+
+def get_amount_out(amount_in: int, reserve_in: int, reserve_out: int) -> int:
+    """UniswapV2Library.getAmountOut, reproduced exactly in integer math"""
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    fee_numerator, fee_denominator = fee_fraction()
+    amount_in_with_fee = amount_in * fee_numerator
+    return (amount_in_with_fee * reserve_out) // (reserve_in * fee_denominator + amount_in_with_fee)
+
+def get_amounts_out(amount_in: int, path_reserves: Sequence[Tuple[int, int]]) -> List[int]:
+    """UniswapV2Library.getAmountsOut over a path given as (reserve_in, reserve_out) per hop"""
+    amounts = [amount_in]
+    for reserve_in, reserve_out in path_reserves:
+        amounts.append(get_amount_out(amounts[-1], reserve_in, reserve_out))
+    return amounts
+
+def quote_batch(amounts_in, reserves_in, reserves_out) -> Tuple[np.ndarray, np.ndarray]:
+    """Quote every size against every pair in one vectorized pass.
+
+    `amounts_in` is either one row of sizes shared by all pairs (shape S) or one
+    row per pair (shape P x S); reserves have shape P. Returns exact integer
+    outputs (object dtype, shape P x S) and the price impact of each quote
+    relative to the pool's mid price, LP fee included (float64, shape P x S).
+    """
+    amounts = np.asarray(amounts_in, dtype=object)
+    if amounts.ndim == 1:
+        amounts = amounts[np.newaxis, :]
+    reserve_in = np.asarray(reserves_in, dtype=object)[:, np.newaxis]
+    reserve_out = np.asarray(reserves_out, dtype=object)[:, np.newaxis]
+
+    fee_numerator, fee_denominator = fee_fraction()
+    valid = (amounts > 0) & (reserve_in > 0) & (reserve_out > 0)
+    # Keep invalid cells away from a zero denominator; they are zeroed below
+    amount_in_with_fee = np.where(valid, amounts, 1) * fee_numerator
+    amounts_out = (amount_in_with_fee * reserve_out) // (reserve_in * fee_denominator + amount_in_with_fee)
+    amounts_out = np.where(valid, amounts_out, 0)
+
+    # Execution price over mid price: (out / in) / (reserve_out / reserve_in)
+    realized = (amounts_out * reserve_in).astype(np.float64)
+    ideal = (np.where(valid, amounts, 1) * reserve_out).astype(np.float64)
+    impact = np.where(valid, 1.0 - realized / ideal, 1.0)
+    return amounts_out, impact
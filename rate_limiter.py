@@ -0,0 +1,138 @@
+from config import settings
+from metrics import metrics
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Request weight per endpoint where a venue charges more than 1 (Binance-style)
+DEFAULT_WEIGHTS: Dict[str, Dict[str, int]] = {
+    'binance': {'price': 2, 'snapshot': 4, 'depth': 5},
+    'kucoin': {'price': 2, 'snapshot': 15},
+}
+
+
+class TokenBucket:
+    """Weighted token bucket whose waiters queue by priority instead of being rejected.
+
+    Lower priority values are served first; equal priorities are FIFO. A 429
+    or 418 pauses the bucket and halves its refill rate, which then creeps
+    back towards the configured rate on successful responses.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.penalties = 0
+        self.waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, weight: float = 1, priority: int = 0):
+        """Wait until `weight` tokens are available and this caller is first in line"""
+        weight = min(weight, self.capacity)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), weight, future))
+        self._drain()
+        with metrics.timer("arb_rate_limit_wait_seconds", bucket=self.name):
+            await future
+
+    def _drain(self):
+        # Called from acquire as well as from the timer: never leave a second wake-up scheduled
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self.waiters:
+            _, _, weight, future = self.waiters[0]
+            if future.done():
+                # The caller gave up (timeout or cancellation); it costs nothing
+                heapq.heappop(self.waiters)
+                metrics.inc("arb_rate_limit_dropped_total", bucket=self.name)
+                continue
+            if now < self.blocked_until:
+                wait = self.blocked_until - now
+            elif self.tokens >= weight:
+                heapq.heappop(self.waiters)
+                self.tokens -= weight
+                future.set_result(None)
+                continue
+            else:
+                wait = (weight - self.tokens) / self.rate
+            self.timer = asyncio.get_running_loop().call_later(wait, self._drain)
+            return
+
+    def penalize(self, retry_after: Optional[float] = None, banned: bool = False):
+        """Back off after a 429 (or an IP ban, 418) from the venue"""
+        self.penalties += 1
+        metrics.inc("arb_rate_limit_penalties_total", bucket=self.name, banned=str(banned).lower())
+        delay = retry_after or min(
+            settings.RATE_LIMIT_MAX_BACKOFF,
+            settings.RATE_LIMIT_BASE_BACKOFF * 2 ** (self.penalties - 1) * (4 if banned else 1)
+        )
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        self.rate = max(self.base_rate * settings.RATE_LIMIT_MIN_RATE_FRACTION, self.rate / 2)
+        self.tokens = 0
+        logging.warning(f"{self.name} rate limited, pausing {delay:.1f}s at {self.rate:.2f} weight/s")
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.waiters:
+            self._drain()
+
+    def record_success(self):
+        """Recover the refill rate gradually after a penalty"""
+        self.penalties = 0
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * settings.RATE_LIMIT_RECOVERY_STEP)
+
+
+class RateLimiter:
+    """One token bucket per exchange, sized from its settings.EXCHANGES entry.
+
+    `rate_limit` is the sustained weight per second and `burst` the bucket
+    capacity; `weights` overrides the per-endpoint request weights.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, exchange: str) -> TokenBucket:
+        if exchange not in self.buckets:
+            config = settings.EXCHANGES.get(exchange, {})
+            rate = float(config.get('rate_limit', 10))
+            self.buckets[exchange] = TokenBucket(exchange, rate, float(config.get('burst', rate)))
+        return self.buckets[exchange]
+
+    def weight(self, exchange: str, endpoint: str) -> float:
+        config_weights = settings.EXCHANGES.get(exchange, {}).get('weights', {})
+        return config_weights.get(endpoint, DEFAULT_WEIGHTS.get(exchange, {}).get(endpoint, 1))
+
+    async def acquire(self, exchange: str, endpoint: str = 'price', priority: int = 0):
+        await self.bucket(exchange).acquire(self.weight(exchange, endpoint), priority)
+
+    def on_response(self, exchange: str, status: int, retry_after: Optional[str] = None):
+        """Feed a REST response status back into the exchange's bucket"""
+        if status in (429, 418):
+            try:
+                delay = float(retry_after) if retry_after else None
+            except ValueError:
+                delay = None
+            self.bucket(exchange).penalize(delay, banned=status == 418)
+        elif status < 400:
+            self.bucket(exchange).record_success()
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,254 @@
+from web3_client import web3_client
+from config import settings
+from metadata_store import metadata_store
+from execution_predictor import execution_predictor
+from collections import OrderedDict, deque
+import asyncio
+import logging
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+# keccak256("Sync(uint112,uint112)")
+SYNC_TOPIC = '0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1'
+
+# (reserve0, reserve1, block number the reserves are valid at)
+ReserveState = Tuple[int, int, int]
+
+
+class ReservesMirror:
+    """In-memory, block-tagged copy of Uniswap V2 pair reserves kept current from Sync logs.
+
+    Pairs are seeded with one batched getReserves read, then updated by an
+    eth_getLogs loop that follows new heads. The last RESERVES_REORG_DEPTH
+    blocks of changes are kept so a reorg can be rolled back and replayed.
+    """
+
+    def __init__(self):
+        self.reserves: Dict[str, ReserveState] = {}
+        self.tokens: Dict[str, Tuple[str, str]] = {}
+        self.last_block: Optional[int] = None
+        self.block_hashes: "OrderedDict[int, bytes]" = OrderedDict()
+        # (block, {pair: state before that block's Sync logs were applied})
+        self.undo_log: Deque[Tuple[int, Dict[str, ReserveState]]] = deque()
+        self.lock = asyncio.Lock()
+        self.task = None
+        # Called with (changed pairs, block) whenever mirrored reserves change
+        self.listeners: List[Callable[[Set[str], int], None]] = []
+
+    def get_reserves(self, pair_address: str) -> Optional[ReserveState]:
+        """Latest known reserves for a tracked pair, without any RPC"""
+        return self.reserves.get(pair_address)
+
+    def get_pair_tokens(self, pair_address: str) -> Optional[Tuple[str, str]]:
+        """(token0, token1) for a tracked pair"""
+        return self.tokens.get(pair_address)
+
+    def is_tracked(self, pair_address: str) -> bool:
+        return pair_address in self.reserves
+
+    def add_listener(self, callback: Callable[[Set[str], int], None]):
+        self.listeners.append(callback)
+
+    def _notify(self, changed_pairs: Set[str]):
+        if not changed_pairs:
+            return
+        for callback in self.listeners:
+            try:
+                callback(changed_pairs, self.last_block)
+            except Exception as e:
+                logging.error(f"Reserves listener failed: {e}")
+
+    async def track(self, pair_addresses: Iterable[str]):
+        """Start mirroring pairs, seeding their reserves in one batch at the mirrored block"""
+        async with self.lock:
+            new_pairs = [pair for pair in dict.fromkeys(pair_addresses) if pair not in self.reserves]
+            if not new_pairs:
+                return
+
+            if self.last_block is None:
+                head = await web3_client.w3.eth.get_block('latest')
+                self._remember_block(head['number'], head['hash'])
+            await self._seed(new_pairs)
+
+    async def _seed(self, pair_addresses: List[str]):
+        calls = []
+        for pair_address in pair_addresses:
+            pair_contract = web3_client.get_contract(pair_address, abi=settings.UNISWAP_PAIR_ABI)
+            # Token ordering never changes, so only unknown pairs pay for token0/token1
+            if metadata_store.get_pair_tokens(pair_address) is None:
+                calls.append((pair_contract, "token0", ()))
+                calls.append((pair_contract, "token1", ()))
+            calls.append((pair_contract, "getReserves", ()))
+        # Seed at the height the log loop has reached so no Sync is missed or replayed
+        results = iter(await web3_client.batch_call(calls, block_identifier=self.last_block))
+
+        seeded = set()
+        for pair_address in pair_addresses:
+            tokens = metadata_store.get_pair_tokens(pair_address)
+            if tokens is None:
+                tokens = (next(results), next(results))
+                if None not in tokens:
+                    metadata_store.set_pair_tokens(pair_address, *tokens)
+            reserves = next(results)
+            if None in tokens or reserves is None:
+                logging.warning(f"Could not seed reserves for pair {pair_address}")
+                continue
+            self.tokens[pair_address] = tokens
+            self.reserves[pair_address] = (reserves[0], reserves[1], self.last_block)
+            seeded.add(pair_address)
+        self._notify(seeded)
+
+    async def start(self):
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Reserves mirror update failed: {e}")
+            await asyncio.sleep(settings.RESERVES_POLL_INTERVAL)
+
+    async def poll(self):
+        """Follow the chain head: detect reorgs, then apply Sync logs for new blocks"""
+        async with self.lock:
+            head = await web3_client.w3.eth.get_block('latest')
+            execution_predictor.record_block(head['number'], head['timestamp'])
+            if self.last_block is None:
+                self._remember_block(head['number'], head['hash'])
+                return
+
+            if head['number'] < self.last_block:
+                # A lagging endpoint; a real reorg shows up as a hash mismatch once the head passes us again
+                return
+
+            # Only roll back when the block we stopped at is no longer on the canonical chain
+            if head['number'] == self.last_block:
+                canonical = head['hash']
+            elif head['number'] == self.last_block + 1:
+                canonical = head['parentHash']
+            else:
+                canonical = (await web3_client.w3.eth.get_block(self.last_block))['hash']
+            if canonical != self.block_hashes.get(self.last_block):
+                await self._handle_reorg()
+
+            from_block = self.last_block + 1
+            to_block = min(head['number'], self.last_block + settings.RESERVES_MAX_BLOCK_RANGE)
+            if from_block > to_block:
+                return
+
+            logs = await self._get_sync_logs(from_block, to_block)
+            changed = self._apply_logs(logs, from_block, to_block)
+
+            if to_block == head['number']:
+                self._remember_block(to_block, head['hash'])
+            else:
+                block = await web3_client.w3.eth.get_block(to_block)
+                self._remember_block(to_block, block['hash'])
+            self._notify(changed)
+
+    async def _get_sync_logs(self, from_block: int, to_block: int) -> List[dict]:
+        log_filter = {'fromBlock': from_block, 'toBlock': to_block, 'topics': [SYNC_TOPIC]}
+        if not self.reserves:
+            return []
+        if len(self.reserves) <= settings.RESERVES_MAX_FILTER_ADDRESSES:
+            log_filter['address'] = list(self.reserves)
+            return await web3_client.w3.eth.get_logs(log_filter)
+        # Too many pairs for an address filter: take every Sync and drop untracked ones
+        logs = await web3_client.w3.eth.get_logs(log_filter)
+        return [log for log in logs if log['address'] in self.reserves]
+
+    def _apply_logs(self, logs: List[dict], from_block: int, to_block: int) -> Set[str]:
+        changed = set()
+        by_block: Dict[int, List[dict]] = {}
+        for log in logs:
+            if log.get('removed'):
+                continue
+            by_block.setdefault(log['blockNumber'], []).append(log)
+
+        for block_number in range(from_block, to_block + 1):
+            block_logs = sorted(by_block.get(block_number, []), key=lambda log: log['logIndex'])
+            previous: Dict[str, ReserveState] = {}
+            for log in block_logs:
+                pair_address = log['address']
+                if pair_address not in previous:
+                    state = self.reserves.get(pair_address)
+                    # Pairs seeded at or after this block already include its Syncs
+                    if state is None or state[2] >= block_number:
+                        continue
+                    previous[pair_address] = state
+                data = bytes(log['data'])
+                self.reserves[pair_address] = (
+                    int.from_bytes(data[0:32], 'big'),
+                    int.from_bytes(data[32:64], 'big'),
+                    block_number
+                )
+            if previous:
+                self.undo_log.append((block_number, previous))
+                changed.update(previous)
+
+        self.last_block = to_block
+        self._trim_history()
+        return changed
+
+    def _remember_block(self, block_number: int, block_hash: bytes):
+        self.last_block = block_number
+        self.block_hashes[block_number] = block_hash
+        self._trim_history()
+
+    def _trim_history(self):
+        oldest = self.last_block - settings.RESERVES_REORG_DEPTH
+        while self.block_hashes and next(iter(self.block_hashes)) < oldest:
+            self.block_hashes.popitem(last=False)
+        while self.undo_log and self.undo_log[0][0] < oldest:
+            self.undo_log.popleft()
+
+    async def _handle_reorg(self):
+        """Roll back to the newest remembered block that is still canonical"""
+        for block_number in reversed(list(self.block_hashes)):
+            block = await web3_client.w3.eth.get_block(block_number)
+            if block['hash'] == self.block_hashes[block_number]:
+                if block_number != self.last_block:
+                    logging.warning(f"Chain reorg detected, rolling reserves back to block {block_number}")
+                    await self._rollback(block_number)
+                return
+
+        logging.warning("Chain reorg deeper than tracked history, reseeding all reserves")
+        pairs = list(self.reserves)
+        self.reserves.clear()
+        self.tokens.clear()
+        self.undo_log.clear()
+        self.block_hashes.clear()
+        head = await web3_client.w3.eth.get_block('latest')
+        self._remember_block(head['number'], head['hash'])
+        await self._seed(pairs)
+
+    async def _rollback(self, block_number: int):
+        restored = set()
+        while self.undo_log and self.undo_log[-1][0] > block_number:
+            _, previous = self.undo_log.pop()
+            self.reserves.update(previous)
+            restored.update(previous)
+        for stale in [number for number in self.block_hashes if number > block_number]:
+            del self.block_hashes[stale]
+        self.last_block = block_number
+
+        # Pairs first seeded on the orphaned branch have nothing to undo to
+        orphaned = [pair for pair, state in self.reserves.items() if state[2] > block_number]
+        for pair_address in orphaned:
+            del self.reserves[pair_address]
+        self._notify(restored - set(orphaned))
+        if orphaned:
+            await self._seed(orphaned)
+
+reserves_mirror = ReservesMirror()
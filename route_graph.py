@@ -0,0 +1,288 @@
+from web3_client import web3_client
+from config import settings
+from metadata_store import metadata_store
+from pair_indexer import pair_index
+from reserves_state import reserves_mirror
+from quote_engine import fee_fraction, get_amount_out
+from collections import deque
+from itertools import combinations
+import logging
+import math
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+EPSILON = 1e-12
+
+class RouteGraph:
+    """Token graph over the mirrored pairs, for multi-hop quotes and DEX cycle detection.
+
+    Each pair gives two directed edges weighted -log(marginal rate after fee),
+    so a negative cycle is a profitable loop. Shortest distances from a
+    virtual source are kept between blocks (incremental SPFA): an update only
+    re-relaxes edges of pairs whose reserves changed, and only invalidates the
+    shortest-path subtrees hanging off edges that got worse.
+    """
+
+    def __init__(self):
+        # token -> {neighbour token: pair}; all token keys lowercase
+        self.edges: Dict[str, Dict[str, str]] = {}
+        self.weights: Dict[Tuple[str, str], float] = {}
+        self.dist: Dict[str, float] = {}
+        self.pred: Dict[str, Tuple[str, str]] = {}
+        self.children: Dict[str, Set[str]] = {}
+        # Rotation-normalised token cycle -> (pairs along it, marginal rate product)
+        self.cycles: Dict[Tuple[str, ...], Tuple[Tuple[str, ...], float]] = {}
+        self.missing_pairs: Set[Tuple[str, str]] = set()
+        # Nodes still to relax; kept across updates when the relaxation budget runs out
+        self.queue: Deque[str] = deque()
+        self.queued: Set[str] = set()
+        reserves_mirror.add_listener(self.on_reserves_update)
+
+    def on_reserves_update(self, changed_pairs: Set[str], block: int):
+        cycles = self.update(changed_pairs)
+        if cycles:
+            tokens, _, rate = max(cycles, key=lambda cycle: cycle[2])
+            logging.info(f"{len(cycles)} new DEX cycles at block {block}, best {' -> '.join(tokens)} rate {rate:.6f}")
+
+    def oriented_reserves(self, token_in: str, pair_address: str) -> Optional[Tuple[int, int]]:
+        """(reserve_in, reserve_out) of a pair when swapping from `token_in`"""
+        reserves = reserves_mirror.get_reserves(pair_address)
+        tokens = reserves_mirror.get_pair_tokens(pair_address)
+        if reserves is None or tokens is None:
+            return None
+        if tokens[0].lower() == token_in:
+            return reserves[0], reserves[1]
+        return reserves[1], reserves[0]
+
+    @staticmethod
+    def _weight(reserve_in: int, reserve_out: int) -> float:
+        if reserve_in <= 0 or reserve_out <= 0:
+            return math.inf
+        fee_numerator, fee_denominator = fee_fraction()
+        return -(math.log(fee_numerator / fee_denominator) + math.log(reserve_out) - math.log(reserve_in))
+
+    async def track_token(self, token_address: str):
+        """Mirror the pairs linking a token to the routing hubs, and the hubs to each other"""
+        hubs = [hub for hub in settings.ROUTING_HUB_TOKENS if hub.lower() != token_address.lower()]
+        wanted = [(token_address, hub) for hub in hubs] + list(combinations(hubs, 2))
+
+        pairs = []
+        unknown = []
+        for token_a, token_b in wanted:
+            pair_address = metadata_store.get_pair(token_a, token_b)
+            if pair_address:
+                pairs.append(pair_address)
+            elif ((token_a.lower(), token_b.lower()) not in self.missing_pairs
+                  and not pair_index.known_missing(token_a, token_b)):
+                unknown.append((token_a, token_b))
+
+        if unknown:
+            factory = web3_client.uniswap_factory
+            found = await web3_client.batch_call([(factory, "getPair", tokens) for tokens in unknown])
+            for (token_a, token_b), pair_address in zip(unknown, found):
+                if pair_address and pair_address != '0x' + '0'*40:
+                    metadata_store.set_pair(token_a, token_b, pair_address)
+                    pairs.append(pair_address)
+                else:
+                    self.missing_pairs.add((token_a.lower(), token_b.lower()))
+
+        await reserves_mirror.track(pairs)
+
+    def best_route(self, token_in: str, token_out: str, amount_in: int,
+                   max_hops: int = None) -> Optional[Tuple[List[str], List[str], int]]:
+        """Best-output path from `token_in` to `token_out` using exact local quotes.
+
+        Returns (tokens along the path, pairs along the path, amount out), or
+        None when the tokens are not connected within `max_hops` swaps.
+        """
+        start, goal = token_in.lower(), token_out.lower()
+        max_hops = max_hops or settings.ROUTING_MAX_HOPS
+        best: Optional[Tuple[List[str], List[str], int]] = None
+
+        # Keep the best amount reaching each token after exactly `hop` swaps
+        layer = {start: (amount_in, [start], [])}
+        for _ in range(max_hops):
+            next_layer: Dict[str, Tuple[int, List[str], List[str]]] = {}
+            for node, (amount, path, pairs) in layer.items():
+                for neighbour, pair_address in self.edges.get(node, {}).items():
+                    if neighbour in path:
+                        continue
+                    reserves = self.oriented_reserves(node, pair_address)
+                    if reserves is None:
+                        continue
+                    amount_out = get_amount_out(amount, *reserves)
+                    if amount_out > next_layer.get(neighbour, (0,))[0]:
+                        next_layer[neighbour] = (amount_out, path + [neighbour], pairs + [pair_address])
+
+            if goal in next_layer and (best is None or next_layer[goal][0] > best[2]):
+                amount_out, path, pairs = next_layer[goal]
+                best = (path, pairs, amount_out)
+            layer = {node: entry for node, entry in next_layer.items() if node != goal}
+            if not layer:
+                break
+
+        return best
+
+    def mid_rate(self, path: List[str], pairs: List[str]) -> float:
+        """Fee-free marginal rate along a path, in raw token units"""
+        rate = 1.0
+        for token_in, pair_address in zip(path, pairs):
+            reserve_in, reserve_out = self.oriented_reserves(token_in, pair_address)
+            rate *= reserve_out / reserve_in
+        return rate
+
+    def update(self, changed_pairs: Set[str]) -> List[Tuple[List[str], List[str], float]]:
+        """Re-weight the edges of changed pairs and re-relax from them; return new cycles"""
+        def enqueue(node: str):
+            if node not in self.queued:
+                self.queued.add(node)
+                self.queue.append(node)
+
+        worsened = []
+        for pair_address in changed_pairs:
+            tokens = reserves_mirror.get_pair_tokens(pair_address)
+            reserves = reserves_mirror.get_reserves(pair_address)
+            if tokens is None or reserves is None:
+                continue
+            token0, token1 = tokens[0].lower(), tokens[1].lower()
+            self.edges.setdefault(token0, {})[token1] = pair_address
+            self.edges.setdefault(token1, {})[token0] = pair_address
+
+            for token_in, token_out, reserve_in, reserve_out in (
+                (token0, token1, reserves[0], reserves[1]),
+                (token1, token0, reserves[1], reserves[0]),
+            ):
+                self.dist.setdefault(token_in, 0.0)
+                self.dist.setdefault(token_out, 0.0)
+                weight = self._weight(reserve_in, reserve_out)
+                previous = self.weights.get((token_in, token_out))
+                self.weights[(token_in, token_out)] = weight
+                if previous is not None and weight > previous and self.pred.get(token_out) == (token_in, pair_address):
+                    worsened.append(token_out)
+                enqueue(token_in)
+
+        if worsened:
+            self._invalidate(worsened, enqueue)
+        self._refresh_cycles(changed_pairs)
+        return self._relax()
+
+    def _set_pred(self, node: str, parent: Optional[Tuple[str, str]]):
+        previous = self.pred.pop(node, None)
+        if previous is not None:
+            self.children.get(previous[0], set()).discard(node)
+        if parent is not None:
+            self.pred[node] = parent
+            self.children.setdefault(parent[0], set()).add(node)
+
+    def _invalidate(self, roots: List[str], enqueue):
+        """Reset shortest-path subtrees whose tree edge got worse, then re-seed them"""
+        subtree: Set[str] = set()
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            if node in subtree:
+                continue
+            subtree.add(node)
+            stack.extend(self.children.get(node, ()))
+
+        for node in subtree:
+            self.dist[node] = 0.0
+            self._set_pred(node, None)
+        for node in subtree:
+            enqueue(node)
+            for neighbour in self.edges.get(node, {}):
+                if neighbour not in subtree:
+                    enqueue(neighbour)
+
+    def _relax(self) -> List[Tuple[List[str], List[str], float]]:
+        """Drain the pending queue, or stop after ROUTING_MAX_RELAXATIONS and resume on the next update"""
+        queue, queued = self.queue, self.queued
+        found = []
+        relaxations = 0
+        while queue:
+            node = queue.popleft()
+            queued.discard(node)
+            node_dist = self.dist[node]
+            for neighbour, pair_address in self.edges.get(node, {}).items():
+                weight = self.weights.get((node, neighbour), math.inf)
+                if node_dist + weight >= self.dist[neighbour] - EPSILON:
+                    continue
+
+                cycle = self._closing_cycle(node, neighbour)
+                if cycle is not None:
+                    # Never let a negative cycle into the tree; report it instead
+                    recorded = self._record_cycle(cycle + [neighbour])
+                    if recorded:
+                        found.append(recorded)
+                    continue
+
+                self.dist[neighbour] = node_dist + weight
+                self._set_pred(neighbour, (node, pair_address))
+                if neighbour not in queued:
+                    queued.add(neighbour)
+                    queue.append(neighbour)
+
+                relaxations += 1
+                if relaxations > settings.ROUTING_MAX_RELAXATIONS:
+                    # This node's remaining edges are re-scanned when the queue resumes
+                    if node not in queued:
+                        queued.add(node)
+                        queue.appendleft(node)
+                    logging.warning(
+                        f"Route graph relaxation budget exhausted, deferring {len(queue)} nodes to the next update"
+                    )
+                    return found
+        return found
+
+    def _closing_cycle(self, node: str, neighbour: str) -> Optional[List[str]]:
+        """If `neighbour` is an ancestor of `node`, the tokens from it down to `node`"""
+        chain = [node]
+        while chain[-1] != neighbour:
+            parent = self.pred.get(chain[-1])
+            if parent is None or len(chain) > len(self.dist):
+                return None
+            chain.append(parent[0])
+        return list(reversed(chain))
+
+    def _cycle_rate(self, tokens: List[str]) -> Tuple[Tuple[str, ...], float]:
+        pairs = []
+        total = 0.0
+        for token_in, token_out in zip(tokens, tokens[1:]):
+            pairs.append(self.edges[token_in][token_out])
+            total += self.weights.get((token_in, token_out), math.inf)
+        return tuple(pairs), math.exp(-total)
+
+    def _record_cycle(self, tokens: List[str]) -> Optional[Tuple[List[str], List[str], float]]:
+        """Store a closed token loop (first == last); return it if it is new"""
+        loop = tokens[:-1]
+        start = loop.index(min(loop))
+        key = tuple(loop[start:] + loop[:start])
+        pairs, rate = self._cycle_rate(list(key) + [key[0]])
+        if rate <= 1.0:
+            return None
+        is_new = key not in self.cycles
+        self.cycles[key] = (pairs, rate)
+        if is_new:
+            return list(key) + [key[0]], list(pairs), rate
+        return None
+
+    def _refresh_cycles(self, changed_pairs: Set[str]):
+        """Re-price known cycles that use a changed pair, dropping ones no longer profitable"""
+        for key, (pairs, _) in list(self.cycles.items()):
+            if changed_pairs.isdisjoint(pairs):
+                continue
+            _, rate = self._cycle_rate(list(key) + [key[0]])
+            if rate <= 1.0:
+                del self.cycles[key]
+            else:
+                self.cycles[key] = (pairs, rate)
+
+    def active_cycles(self) -> List[Tuple[List[str], List[str], float]]:
+        """Currently profitable cycles, best marginal rate first"""
+        return sorted(
+            ((list(key) + [key[0]], list(pairs), rate) for key, (pairs, rate) in self.cycles.items()),
+            key=lambda cycle: cycle[2],
+            reverse=True
+        )
+
+
+route_graph = RouteGraph()
@@ -0,0 +1,252 @@
+from web3 import AsyncHTTPProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.exceptions import ProviderConnectionError
+from web3.types import RPCEndpoint, RPCResponse
+from config import settings
+from metrics import metrics
+from collections import deque
+import aiohttp
+import asyncio
+import logging
+import time
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import urlparse
+
+# Read-only methods that are safe to send to two nodes at once
+HEDGEABLE_METHODS = {
+    "eth_call",
+    "eth_blockNumber",
+    "eth_chainId",
+    "eth_getBlockByNumber",
+    "eth_getBlockByHash",
+    "eth_getLogs",
+    "eth_getBalance",
+    "eth_getCode",
+    "eth_gasPrice",
+    "web3_clientVersion",
+}
+
+# JSON-RPC error codes that mean the node (not the request) is at fault
+NODE_ERROR_CODES = {-32005}  # limit exceeded / rate limited
+
+
+class EndpointStats:
+    """Rolling latency/error statistics and circuit breaker for one RPC endpoint.
+
+    After RPC_BREAKER_FAILURES consecutive failures the breaker opens for
+    RPC_BREAKER_COOLDOWN. It is then half-open: one trial request goes
+    through, closing the breaker on success or reopening it on failure.
+    """
+
+    def __init__(self, label: str):
+        # Host only: endpoint URLs often embed API keys
+        self.label = label
+        self.latencies: Deque[float] = deque(maxlen=settings.RPC_STATS_WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=settings.RPC_STATS_WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.consecutive_failures >= settings.RPC_BREAKER_FAILURES:
+            self.open_until = time.monotonic() + settings.RPC_BREAKER_COOLDOWN
+            logging.warning(f"Circuit opened for {self.label} after {self.consecutive_failures} failures")
+
+    def half_open(self) -> bool:
+        return 0.0 < self.open_until <= time.monotonic()
+
+    def is_available(self) -> bool:
+        """Closed breakers accept traffic; open ones only a single trial call once the cooldown ends"""
+        if self.open_until == 0.0:
+            return True
+        return self.half_open() and not self.trial_in_flight
+
+    def begin_request(self):
+        """Claim the trial call of a half-open breaker; raises if another request already holds it"""
+        if self.half_open():
+            if self.trial_in_flight:
+                raise ProviderConnectionError(f"{self.label} is half-open with a trial request in flight")
+            self.trial_in_flight = True
+
+    def abandon_request(self):
+        """A request was cancelled before its outcome was known"""
+        self.trial_in_flight = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self) -> float:
+        """Lower is better: median latency inflated by the recent error rate"""
+        p50 = self.percentile(0.5)
+        if p50 is None:
+            # Untried endpoints get a chance to report; never-successful ones go last
+            return settings.RPC_TIMEOUT if self.outcomes else 0.0
+        return p50 * (1 + 10 * self.error_rate)
+
+
+class ProviderPool(AsyncJSONBaseProvider):
+    """Async provider that routes each request to the fastest healthy endpoint.
+
+    Read-only calls are hedged: if the chosen node has not answered within its
+    own p95, the same request goes to the runner-up and the first answer wins.
+    """
+
+    def __init__(self, endpoint_uris: List[str]):
+        super().__init__()
+        self.providers: Dict[str, AsyncHTTPProvider] = {
+            url: AsyncHTTPProvider(
+                url,
+                request_kwargs={'timeout': aiohttp.ClientTimeout(total=settings.RPC_TIMEOUT)}
+            )
+            for url in endpoint_uris
+        }
+        # Logs, errors and metric labels carry the host only; paths often embed API keys
+        self.labels: Dict[str, str] = {}
+        for index, url in enumerate(endpoint_uris):
+            host = urlparse(url).hostname or f"endpoint-{index}"
+            self.labels[url] = host if host not in self.labels.values() else f"{host}#{index}"
+        self.stats: Dict[str, EndpointStats] = {url: EndpointStats(self.labels[url]) for url in endpoint_uris}
+
+    async def cache_async_session(self, session: aiohttp.ClientSession):
+        """Share one pooled HTTP session across all endpoints"""
+        for provider in self.providers.values():
+            await provider.cache_async_session(session)
+
+    def _ranked(self) -> List[str]:
+        available = [url for url, stats in self.stats.items() if stats.is_available()]
+        if not available:
+            # Every breaker is open: fall back to whichever reopens first
+            return sorted(self.stats, key=lambda url: self.stats[url].open_until)
+        return sorted(available, key=lambda url: self.stats[url].score())
+
+    def _hedge_delay(self, url: str) -> float:
+        p95 = self.stats[url].percentile(0.95)
+        if p95 is None:
+            return settings.RPC_HEDGE_DEFAULT_DELAY
+        return max(p95, settings.RPC_HEDGE_MIN_DELAY)
+
+    async def _request(self, url: str, method: RPCEndpoint, params: Any) -> RPCResponse:
+        """Send a request to one endpoint and record its outcome"""
+        self.stats[url].begin_request()
+        started = time.perf_counter()
+        try:
+            response = await self.providers[url].make_request(method, params)
+        except asyncio.CancelledError:
+            # Usually the losing leg of a hedge
+            self.stats[url].abandon_request()
+            metrics.inc("arb_rpc_cancelled_total", provider=self.labels[url], method=method)
+            raise
+        except Exception:
+            self.stats[url].record_failure()
+            metrics.inc("arb_rpc_errors_total", provider=self.labels[url], method=method)
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.observe("arb_rpc_request_seconds", elapsed, provider=self.labels[url], method=method)
+
+        error = response.get("error") if isinstance(response, dict) else None
+        if isinstance(error, dict) and error.get("code") in NODE_ERROR_CODES:
+            self.stats[url].record_failure()
+            metrics.inc("arb_rpc_errors_total", provider=self.labels[url], method=method)
+            raise ProviderConnectionError(f"{self.labels[url]} rejected {method}: {error.get('message')}")
+
+        self.stats[url].record_success(elapsed)
+        return response
+
+    async def _hedged_request(self, primary: str, secondary: str, method: RPCEndpoint, params: Any,
+                              tried: set) -> RPCResponse:
+        first = asyncio.ensure_future(self._request(primary, method, params))
+        done, _ = await asyncio.wait({first}, timeout=self._hedge_delay(primary))
+        if done:
+            # Answered (or failed) before the hedge was due; failover picks the next node
+            return first.result()
+
+        tried.add(secondary)
+        second = asyncio.ensure_future(self._request(secondary, method, params))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        ranked = self._ranked()
+        tried = set()
+        last_error: Optional[BaseException] = None
+
+        for index, url in enumerate(ranked):
+            if url in tried:
+                continue
+            tried.add(url)
+            try:
+                runner_up = next((other for other in ranked[index + 1:] if other not in tried), None)
+                if settings.RPC_HEDGE_ENABLED and runner_up and method in HEDGEABLE_METHODS:
+                    return await self._hedged_request(url, runner_up, method, params, tried)
+                return await self._request(url, method, params)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"RPC {method} failed on {self.labels[url]}: {self.redact(e)}")
+                last_error = e
+
+        raise ProviderConnectionError(f"All RPC endpoints failed for {method}: {self.redact(last_error)}")
+
+    async def probe(self) -> List[str]:
+        """Probe every endpoint concurrently to seed latency stats; return the healthy ones"""
+        urls = list(self.providers)
+        results = await asyncio.gather(
+            *(self._request(url, RPCEndpoint("eth_blockNumber"), []) for url in urls),
+            return_exceptions=True
+        )
+        healthy = []
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException) or "result" not in result:
+                logging.warning(f"Connection failed to {self.labels[url]}: {self.redact(result)}")
+            else:
+                healthy.append(url)
+        return healthy
+
+    def redact(self, error: Any) -> str:
+        """Error text with endpoint URLs (transport errors quote them) replaced by their labels"""
+        text = str(error)
+        for url, label in self.labels.items():
+            text = text.replace(url, label)
+        return text
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Current per-endpoint health by label, for logging"""
+        return {
+            self.labels[url]: {
+                'p50': stats.percentile(0.5),
+                'p95': stats.percentile(0.95),
+                'error_rate': stats.error_rate,
+                'available': stats.is_available(),
+            }
+            for url, stats in self.stats.items()
+        }
@@ -0,0 +1,167 @@
+from arbitrage import ArbitrageEngine
+from config import settings
+from collections import deque
+from decimal import Decimal
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Pair classes, from most to least often re-scanned
+HOT, NORMAL, COLD = 'hot', 'normal', 'cold'
+CLASS_PRIORITY = {HOT: 0, NORMAL: 1, COLD: 2}
+
+
+class PairState:
+    def __init__(self, symbol: str, address: str):
+        self.symbol = symbol
+        self.address = address
+        self.pair_class = NORMAL
+        self.interval = settings.SCANNER_BASE_INTERVAL
+        self.last_price: Optional[float] = None
+        self.failures = 0
+
+
+class Scanner:
+    """Scans the whole token universe with a bounded worker pool and priority scheduling.
+
+    Every pair sits in a heap keyed by when it is next due. After each scan
+    the pair is re-classified: volatile pairs and pairs whose best sized
+    profit is close to MIN_PROFIT_USD become hot and are re-scanned every
+    SCANNER_MIN_INTERVAL, while pairs without a pool, liquidity or quotes
+    back off exponentially up to SCANNER_MAX_INTERVAL. Hot pairs also go first
+    in the CEX rate-limit queues.
+    """
+
+    def __init__(self, engine: ArbitrageEngine):
+        self.engine = engine
+        self.pairs: Dict[str, PairState] = {}
+        self.schedule: List[Tuple[float, int, str]] = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.SCANNER_WORKERS)
+        self.tasks: List[asyncio.Task] = []
+        # (finish time, pair class) of recent scans, for the throughput report
+        self.completed: Deque[Tuple[float, str]] = deque()
+
+    def add(self, symbol: str, address: str):
+        if symbol == "USDT" or symbol in self.pairs:
+            return
+        self.pairs[symbol] = PairState(symbol, address)
+        self._schedule(symbol, 0.0)
+
+    def load_universe(self):
+        """Every configured token, scanned against USDT"""
+        for symbol, address in settings.TOKENS.items():
+            self.add(symbol, address)
+        logging.info(f"Scanner universe: {len(self.pairs)} pairs")
+
+    def _schedule(self, symbol: str, delay: float):
+        heapq.heappush(self.schedule, (time.monotonic() + delay, next(self.counter), symbol))
+        self.wakeup.set()
+
+    async def start(self):
+        self.load_universe()
+        self.tasks = [asyncio.create_task(self._dispatch()), asyncio.create_task(self._report())]
+        self.tasks += [asyncio.create_task(self._worker()) for _ in range(settings.SCANNER_WORKERS)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def run(self):
+        await self.start()
+        try:
+            await asyncio.gather(*self.tasks)
+        finally:
+            await self.stop()
+
+    async def _dispatch(self):
+        """Hand due pairs to the workers; the bounded queue applies backpressure"""
+        while True:
+            if not self.schedule:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            due, _, symbol = self.schedule[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.schedule)
+            await self.queue.put(symbol)
+
+    async def _worker(self):
+        while True:
+            symbol = await self.queue.get()
+            state = self.pairs[symbol]
+            try:
+                result = await self.engine.analyze_pair(
+                    state.symbol, state.address, CLASS_PRIORITY[state.pair_class]
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Scan of {symbol} failed: {e}")
+                result = None
+            finally:
+                self.queue.task_done()
+
+            self.completed.append((time.monotonic(), state.pair_class))
+            self._reclassify(state, result)
+            self._schedule(symbol, state.interval)
+
+    def _reclassify(self, state: PairState, result: Optional[Dict]):
+        if result is None or result['status'] in ('no_pool', 'illiquid', 'no_quotes'):
+            state.failures += 1
+            state.pair_class = COLD
+            state.interval = min(
+                settings.SCANNER_MAX_INTERVAL,
+                settings.SCANNER_BASE_INTERVAL * 2 ** state.failures
+            )
+            return
+
+        state.failures = 0
+        price = result['dex_price']
+        moved = (
+            state.last_price is not None and price is not None
+            and abs(price - state.last_price) / state.last_price >= settings.SCANNER_VOLATILITY_THRESHOLD
+        )
+        state.last_price = price
+        near_threshold = result['best_profit'] >= settings.MIN_PROFIT_USD * Decimal(str(settings.SCANNER_NEAR_PROFIT_RATIO))
+
+        if moved or near_threshold or result['status'] == 'opportunity':
+            state.pair_class = HOT
+            state.interval = settings.SCANNER_MIN_INTERVAL
+        else:
+            state.pair_class = NORMAL
+            state.interval = settings.SCANNER_BASE_INTERVAL
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(settings.SCANNER_REPORT_INTERVAL)
+            cutoff = time.monotonic() - settings.SCANNER_REPORT_INTERVAL
+            while self.completed and self.completed[0][0] < cutoff:
+                self.completed.popleft()
+
+            classes = {pair_class: 0 for pair_class in CLASS_PRIORITY}
+            for state in self.pairs.values():
+                classes[state.pair_class] += 1
+            scans = {pair_class: 0 for pair_class in CLASS_PRIORITY}
+            for _, pair_class in self.completed:
+                scans[pair_class] += 1
+
+            report = ", ".join(
+                f"{pair_class} {classes[pair_class]} pairs "
+                f"{scans[pair_class] / settings.SCANNER_REPORT_INTERVAL:.2f} scans/s"
+                for pair_class in CLASS_PRIORITY
+            )
+            logging.info(f"Scanner throughput: {report}")
@@ -0,0 +1,254 @@
+from arbitrage import ArbitrageEngine
+from config import settings
+from incremental_engine import IncrementalEngine
+from market_stream import market_stream
+from shared_board import FIXED_COLUMNS, LIQUIDITY, ORACLE, TOKEN_RESERVE, USDT_RESERVE, SharedPriceBoard
+from decimal import Decimal
+import asyncio
+import logging
+import math
+import multiprocessing
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+
+class BoardFeeder(IncrementalEngine):
+    """Feeder side of sharded mode: the same change-driven inputs, published to the shared board.
+
+    Instead of evaluating dirty cells itself it rewrites the rows of the
+    affected symbols, so each market datum is fetched once in this process
+    and read by every worker. The latencies learned here by the execution
+    predictor are published alongside, since workers measure none. Workers
+    have no order books either, so the candidates they screen come back here
+    for the depth-checked confirmation and the alert.
+    """
+
+    def __init__(self, engine: ArbitrageEngine, board: SharedPriceBoard, candidates: multiprocessing.Queue):
+        super().__init__(engine)
+        self.board = board
+        self.candidates = candidates
+        self.published: Dict[str, Tuple[float, ...]] = {}
+        self.published_estimates: Optional[np.ndarray] = None
+
+    async def _evaluate(self, cells: Set[Tuple[str, str]], pools: Set[str]):
+        if pools:
+            await self._refresh_pools(pools)
+        symbols = {symbol for symbol, _ in cells} | pools
+        oracle = await self.engine.chainlink.get_prices([f"{symbol}/USD" for symbol in symbols])
+        self._publish_estimates()
+
+        deviations = {}
+        for symbol in symbols:
+            row = self.board.symbols.index(symbol)
+            pool, liquidity = self.pools.get(symbol, (None, Decimal(0)))
+            values = [math.nan] * self.board.columns
+            if pool is not None:
+                values[TOKEN_RESERVE], values[USDT_RESERVE] = pool
+            values[LIQUIDITY] = float(liquidity)
+            oracle_price = oracle.get(f"{symbol}/USD")
+            if oracle_price:
+                values[ORACLE] = float(oracle_price)
+            for column, exchange in enumerate(self.board.exchanges, FIXED_COLUMNS):
+                price = market_stream.get_price(exchange, f"{symbol}/USDT") or self.prices.get((symbol, exchange))
+                if price is not None:
+                    self.prices[(symbol, exchange)] = price
+                    values[column] = float(price)
+            if oracle_price:
+                quotes = [value for value in values[FIXED_COLUMNS:] if not math.isnan(value)]
+                if quotes:
+                    deviations[f"{symbol}/USD"] = max(abs(quote - values[ORACLE]) for quote in quotes) / values[ORACLE]
+
+            # NaN never equals itself, so compare the repr-stable tuple instead of the floats
+            key = tuple(repr(value) for value in values)
+            if self.published.get(symbol) == key:
+                self.skipped += 1
+                continue
+            self.published[symbol] = key
+            self.board.write(row, values)
+            self.evaluations += 1
+        # Workers screen against the oracle without reading it, so the feeder watches for new rounds
+        self.engine.chainlink.check_deviations(deviations)
+
+    async def start(self):
+        await super().start()
+        self.tasks.append(asyncio.create_task(self._confirm_loop()))
+
+    async def _confirm_loop(self):
+        """Confirm worker candidates against this process's L2 books"""
+        loop = asyncio.get_running_loop()
+        while True:
+            candidates = await loop.run_in_executor(None, self.candidates.get)
+            if candidates is None:
+                break
+            try:
+                await self.engine.confirm_candidates(candidates)
+            except Exception as e:
+                logging.error(f"Confirming {len(candidates)} shard candidates failed: {e}")
+
+    def _publish_estimates(self):
+        estimates = self.engine.predictor.export(self.board.exchanges)
+        if self.published_estimates is None or not np.array_equal(estimates, self.published_estimates, equal_nan=True):
+            self.board.write_estimates(estimates)
+            self.published_estimates = estimates
+
+
+def worker_main(board_name: str, symbols: Sequence[str], exchanges: Sequence[str],
+                shard: int, shards: int, candidates: multiprocessing.Queue):
+    """Entry point of a worker process screening rows shard, shard + shards, ..."""
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s - shard {shard} - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(_worker(board_name, symbols, exchanges, shard, shards, candidates))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker(board_name: str, symbols: Sequence[str], exchanges: Sequence[str],
+                  shard: int, shards: int, candidates: multiprocessing.Queue):
+    board = SharedPriceBoard(symbols, exchanges, name=board_name)
+    engine = ArbitrageEngine()
+
+    async def forward(screened):
+        candidates.put(screened)
+    engine.defer_confirm = forward
+
+    owned = list(range(shard, board.rows, shards))
+    seen: Dict[int, int] = {}
+    torn: List[int] = []
+    generation = -1
+    try:
+        while True:
+            current = int(board.generation[0])
+            if current == generation and not torn:
+                await asyncio.sleep(settings.SHARD_POLL_INTERVAL)
+                continue
+            # Rows the writer kept busy last time are retried even without a new generation
+            candidates = owned if current != generation else torn
+            generation = current
+
+            estimates = board.read_estimates()
+            if estimates is not None:
+                engine.predictor.adopt(board.exchanges, estimates)
+
+            rows = []
+            oracle = {}
+            torn = []
+            for row in candidates:
+                snapshot = board.read(row)
+                if snapshot is None:
+                    torn.append(row)
+                    continue
+                if seen.get(row) == snapshot[0]:
+                    continue
+                seen[row] = snapshot[0]
+                values = snapshot[1]
+                if math.isnan(values[TOKEN_RESERVE]) or values[TOKEN_RESERVE] <= 0:
+                    continue
+
+                symbol = board.symbols[row]
+                quoted = {
+                    exchange: {'success': True, 'price': Decimal(str(float(values[column])))}
+                    for column, exchange in enumerate(board.exchanges, FIXED_COLUMNS)
+                    if not math.isnan(values[column])
+                }
+                if not quoted:
+                    continue
+                oracle[f"{symbol}/USD"] = None if math.isnan(values[ORACLE]) else Decimal(str(float(values[ORACLE])))
+                pool = (float(values[TOKEN_RESERVE]), float(values[USDT_RESERVE]))
+                result = {'symbol': symbol, 'status': 'no_edge', 'dex_price': pool[1] / pool[0],
+                          'best_profit': Decimal(0), 'alerts': 0}
+                rows.append((symbol, pool, Decimal(str(float(values[LIQUIDITY]))), quoted, result))
+
+            if rows:
+                try:
+                    await engine.evaluate_many(rows, oracle)
+                except Exception as e:
+                    logging.error(f"Shard {shard} evaluation failed: {e}")
+            if torn:
+                # Let the writer finish before trying those rows again
+                await asyncio.sleep(0)
+    finally:
+        board.close()
+
+
+def notifier_main(alerts: multiprocessing.Queue):
+    """Entry point of the process that owns the Telegram connection"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - notifier - %(levelname)s - %(message)s")
+    asyncio.run(_notifier(alerts))
+
+
+async def _notifier(alerts: multiprocessing.Queue):
+    from telegram_notifier import notifier, send_telegram_message
+    from http_transport import http_transport
+
+    await notifier.start()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            alert = await loop.run_in_executor(None, alerts.get)
+            if alert is None:
+                break
+            await send_telegram_message(*alert)
+    finally:
+        # Stopping flushes what is already queued
+        await notifier.stop()
+        await http_transport.close()
+
+
+class ShardedRunner:
+    """Runs the feeder in this process, SHARD_WORKERS evaluator processes and one notifier process"""
+
+    def __init__(self, engine: ArbitrageEngine):
+        self.engine = engine
+        self.context = multiprocessing.get_context('spawn')
+        self.alerts = self.context.Queue()
+        self.candidates = self.context.Queue()
+        self.workers: List[multiprocessing.Process] = []
+        self.notifier = None
+        self.board = None
+
+    def _spawn_worker(self, shard: int) -> multiprocessing.Process:
+        process = self.context.Process(
+            target=worker_main,
+            args=(self.board.name, self.board.symbols, self.board.exchanges,
+                  shard, settings.SHARD_WORKERS, self.candidates),
+            name=f"shard-{shard}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(1.0)
+            for shard, process in enumerate(self.workers):
+                if not process.is_alive():
+                    logging.warning(f"Shard {shard} exited with {process.exitcode}, restarting")
+                    self.workers[shard] = self._spawn_worker(shard)
+
+    async def run(self):
+        symbols = [symbol for symbol in settings.TOKENS if symbol != "USDT"]
+        self.board = SharedPriceBoard(symbols, list(settings.EXCHANGES))
+        self.notifier = self.context.Process(target=notifier_main, args=(self.alerts,), name="notifier", daemon=True)
+        self.notifier.start()
+        self.workers = [self._spawn_worker(shard) for shard in range(settings.SHARD_WORKERS)]
+        logging.info(f"Sharded mode: {len(symbols)} pairs over {settings.SHARD_WORKERS} worker processes")
+
+        async def forward(message: str, key: Optional[str] = None, value: float = math.inf):
+            self.alerts.put((message, key, value))
+        self.engine.alert = forward
+
+        feeder = BoardFeeder(self.engine, self.board, self.candidates)
+        supervisor = asyncio.create_task(self._supervise())
+        try:
+            await feeder.run()
+        finally:
+            supervisor.cancel()
+            # Unblock the feeder's executor thread waiting on worker candidates
+            self.candidates.put(None)
+            for process in self.workers:
+                process.terminate()
+            for process in self.workers:
+                process.join(timeout=5)
+            self.alerts.put(None)
+            self.notifier.join(timeout=15)
+            self.board.close()
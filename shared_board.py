@@ -0,0 +1,91 @@
+from multiprocessing import shared_memory
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+# Fixed columns of a board row; CEX prices per exchange follow
+TOKEN_RESERVE, USDT_RESERVE, LIQUIDITY, ORACLE = range(4)
+FIXED_COLUMNS = 4
+HEADER = 8  # uint64 generation counter, bumped after every published row
+
+
+class SharedPriceBoard:
+    """Pairs x fields float64 price board in shared memory, one writer and many readers.
+
+    Each row carries a seqlock counter: the writer makes it odd, writes the
+    row, then makes it even again. Readers copy a row and retry if the counter
+    was odd or changed meanwhile, so they never act on a half-written row.
+    Missing values are NaN. A separate seqlocked block holds the feeder's
+    execution-time estimates, (p50, p95) per exchange and for DEX inclusion.
+    """
+
+    def __init__(self, symbols: Sequence[str], exchanges: Sequence[str], name: Optional[str] = None):
+        self.symbols: List[str] = list(symbols)
+        self.exchanges: List[str] = list(exchanges)
+        self.rows = len(self.symbols)
+        self.columns = FIXED_COLUMNS + len(self.exchanges)
+        estimates_shape = (len(self.exchanges) + 1, 2)
+        # One sequence per row plus one for the estimates block
+        size = HEADER + (self.rows + 1) * 8 + (self.rows * self.columns + estimates_shape[0] * 2) * 8
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buffer = self.shm.buf
+        self.generation = np.ndarray((1,), dtype=np.uint64, buffer=buffer, offset=0)
+        self.sequences = np.ndarray((self.rows + 1,), dtype=np.uint64, buffer=buffer, offset=HEADER)
+        data_offset = HEADER + (self.rows + 1) * 8
+        self.data = np.ndarray((self.rows, self.columns), dtype=np.float64, buffer=buffer, offset=data_offset)
+        self.estimates = np.ndarray(
+            estimates_shape, dtype=np.float64, buffer=buffer, offset=data_offset + self.rows * self.columns * 8
+        )
+        if self.owner:
+            self.generation[0] = 0
+            self.sequences[:] = 0
+            self.data[:] = np.nan
+            self.estimates[:] = np.nan
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def _publish(self, sequence: int, target: np.ndarray, values):
+        self.sequences[sequence] += 1
+        target[...] = values
+        self.sequences[sequence] += 1
+
+    def _snapshot(self, sequence: int, source: np.ndarray, retries: int) -> Optional[Tuple[int, np.ndarray]]:
+        for _ in range(retries):
+            before = int(self.sequences[sequence])
+            if before & 1:
+                continue
+            values = source.copy()
+            if int(self.sequences[sequence]) == before:
+                return before, values
+        return None
+
+    def write(self, row: int, values: Sequence[float]):
+        """Publish one row (single writer only)"""
+        self._publish(row, self.data[row], values)
+        self.generation[0] += 1
+
+    def read(self, row: int, retries: int = 100) -> Optional[Tuple[int, np.ndarray]]:
+        """(sequence, consistent copy of the row), or None if the writer kept it busy"""
+        return self._snapshot(row, self.data[row], retries)
+
+    def write_estimates(self, values: np.ndarray):
+        """Publish execution-time estimates; unlike rows this does not wake the readers"""
+        self._publish(self.rows, self.estimates, values)
+
+    def read_estimates(self, retries: int = 100) -> Optional[np.ndarray]:
+        snapshot = self._snapshot(self.rows, self.estimates, retries)
+        return None if snapshot is None else snapshot[1]
+
+    def close(self):
+        # Drop the numpy views before the buffer can be released
+        del self.generation, self.sequences, self.data, self.estimates
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
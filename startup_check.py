@@ -0,0 +1,71 @@
+from config import get_settings
+from web3_client import get_web3_client, load_router_abi
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+# Timed in a fresh interpreter each, so every figure is a cold import
+MODULES = ['config', 'web3_client', 'execution_predictor', 'cex_client', 'arbitrage', 'main']
+
+
+def _cold_import(module: str) -> float:
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+async def check_startup() -> bool:
+    """Time each startup stage and print a report; True when at least one RPC provider is healthy"""
+    rows: List[Tuple[str, float, str]] = []
+
+    def timed(stage: str, action):
+        started = time.perf_counter()
+        try:
+            outcome = action()
+            rows.append((stage, time.perf_counter() - started, outcome or "ok"))
+            return True
+        except Exception as e:
+            rows.append((stage, time.perf_counter() - started, f"FAILED: {e}"))
+            return False
+
+    for module in MODULES:
+        try:
+            rows.append((f"import {module}", _cold_import(module), "ok"))
+        except Exception as e:
+            rows.append((f"import {module}", 0.0, f"FAILED: {e}"))
+    settings_ok = timed("load settings", lambda: get_settings() and None)
+
+    def parse_abi():
+        load_router_abi.cache_clear()
+        return f"{len(load_router_abi())} entries"
+    timed("parse router ABI", parse_abi)
+
+    healthy = []
+    if settings_ok and timed("build web3 client", lambda: get_web3_client() and None):
+        client = get_web3_client()
+        started = time.perf_counter()
+        try:
+            await client.connect()
+            healthy = [url for url, stats in client.pool.snapshot().items() if stats['p50'] is not None]
+            rows.append(("probe providers (parallel)", time.perf_counter() - started,
+                         f"{len(healthy)}/{len(client.providers)} healthy"))
+        except Exception as e:
+            rows.append(("probe providers (parallel)", time.perf_counter() - started, f"FAILED: {e}"))
+        finally:
+            await client.close()
+
+    width = max(len(stage) for stage, _, _ in rows)
+    print("Startup check")
+    for stage, seconds, outcome in rows:
+        print(f"  {stage:<{width}}  {seconds * 1000:8.1f} ms  {outcome}")
+    if not healthy:
+        logging.error("No healthy RPC provider")
+    return bool(healthy)
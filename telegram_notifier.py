@@ -1,50 +1,247 @@
-import aiohttp
 import asyncio
 from config import settings
+from http_transport import http_transport
+from metrics import metrics
+from rate_limiter import TokenBucket
+import aiohttp
+import itertools
 import logging
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+# Telegram rejects longer messages
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n"
+
+
+class PendingAlert:
+    __slots__ = ('key', 'message', 'value', 'ready_at', 'created', 'updates')
+
+    def __init__(self, key: str, message: str, value: float, ready_at: float):
+        self.key = key
+        self.message = message
+        self.value = value
+        self.ready_at = ready_at
+        self.created = time.monotonic()
+        self.updates = 1
+
 
 class TelegramNotifier:
+    """Bounded, coalescing, rate-aware delivery of alerts to the Telegram chat.
+
+    Alerts carry a key (pair and exchange for opportunities). A new alert for
+    a key that is still pending replaces its text, and a key delivered less
+    than TELEGRAM_COALESCE_WINDOW ago is held until the window ends and then
+    sent once with the latest text. The sender waits on the per-chat and
+    global token buckets, then packs the ready alerts, most valuable first,
+    into one digest message. A 429 pauses the chat bucket for `retry_after`;
+    network errors and 5xx retry with exponential backoff. Every retry takes
+    budget from both buckets again and counts toward TELEGRAM_MAX_RETRIES. Beyond
+    TELEGRAM_QUEUE_SIZE pending alerts the least valuable one is dropped.
+    """
+
     def __init__(self):
-        self.queue = asyncio.Queue()
-        self.semaphore = asyncio.Semaphore(3)
+        self.pending: Dict[str, PendingAlert] = {}
+        self.last_sent: Dict[str, float] = {}
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.chat_bucket: Optional[TokenBucket] = None
+        self.global_bucket: Optional[TokenBucket] = None
         self.worker_task = None
         self.session = None
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def submit(self, message: str, key: Optional[str] = None, value: float = math.inf):
+        """Queue an alert; unkeyed alerts are never merged and rank above any opportunity"""
+        if key is None:
+            key = f"#{next(self.counter)}"
+
+        pending = self.pending.get(key)
+        if pending is not None:
+            pending.message = message
+            pending.value = value
+            pending.updates += 1
+            self.coalesced += 1
+            metrics.inc("arb_notifier_alerts_total", outcome='coalesced')
+            return
+
+        if len(self.pending) >= settings.TELEGRAM_QUEUE_SIZE:
+            victim = min(self.pending.values(), key=lambda alert: (alert.value, alert.created))
+            self.dropped += 1
+            metrics.inc("arb_notifier_alerts_total", outcome='dropped')
+            if victim.value >= value:
+                logging.debug(f"Telegram queue full, dropping new alert {key}")
+                return
+            logging.debug(f"Telegram queue full, dropping alert {victim.key}")
+            del self.pending[victim.key]
+
+        now = time.monotonic()
+        ready_at = max(now, self.last_sent.get(key, -math.inf) + settings.TELEGRAM_COALESCE_WINDOW)
+        self.pending[key] = PendingAlert(key, message, value, ready_at)
+        self.idle.clear()
+        self.wakeup.set()
+
+    def _take_ready(self) -> List[PendingAlert]:
+        now = time.monotonic()
+        ready = sorted(
+            (alert for alert in self.pending.values() if alert.ready_at <= now),
+            key=lambda alert: -alert.value
+        )
+        batch, length = [], 0
+        for alert in ready[:settings.TELEGRAM_BATCH_SIZE]:
+            size = len(self._render(alert)) + len(DIGEST_SEPARATOR)
+            if batch and length + size > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(alert)
+            length += size
+        for alert in batch:
+            del self.pending[alert.key]
+            if not alert.key.startswith("#"):
+                self.last_sent[alert.key] = now
+        return batch
+
+    @staticmethod
+    def _render(alert: PendingAlert) -> str:
+        if alert.updates > 1:
+            return f"{alert.message}\n_(updated {alert.updates} times)_"
+        return alert.message
+
+    def _digest(self, batch: List[PendingAlert]) -> str:
+        if len(batch) == 1:
+            text = self._render(batch[0])
+        else:
+            text = f"📬 *{len(batch)} alerts*{DIGEST_SEPARATOR}" + DIGEST_SEPARATOR.join(
+                self._render(alert) for alert in batch
+            )
+        return text[:MAX_MESSAGE_LENGTH]
+
+    async def _wait_ready(self):
+        while True:
+            if self.pending:
+                wait = min(alert.ready_at for alert in self.pending.values()) - time.monotonic()
+                if wait <= 0:
+                    return
+            else:
+                self.idle.set()
+                wait = None
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
 
     async def worker(self):
-        self.session = aiohttp.ClientSession()
+        self.session = await http_transport.get_session()
+        while True:
+            await self._wait_ready()
+            # Alerts arriving while we wait for rate budget join this digest
+            await self._acquire_budget()
+            batch = self._take_ready()
+            if batch:
+                if await self._deliver(self._digest(batch)):
+                    self.sent += len(batch)
+                    metrics.inc("arb_notifier_alerts_total", len(batch), outcome='sent')
+                else:
+                    self.dropped += len(batch)
+                    metrics.inc("arb_notifier_alerts_total", len(batch), outcome='dropped')
+
+    async def _acquire_budget(self):
+        await self.global_bucket.acquire()
+        await self.chat_bucket.acquire()
+
+    async def _deliver(self, text: str) -> bool:
+        """Send one message; the caller has already taken the rate budget for the first attempt"""
+        parse_mode = "Markdown"
+        failures = 0
+        first = True
         while True:
-            message = await self.queue.get()
-            async with self.semaphore:
-                try:
-                    await self.session.post(
+            if not first:
+                await self._acquire_budget()
+            first = False
+            payload = {"chat_id": settings.TELEGRAM_CHAT_ID, "text": text}
+            if parse_mode:
+                payload["parse_mode"] = parse_mode
+            try:
+                with metrics.timer("arb_http_request_seconds", exchange='telegram', endpoint='sendMessage'):
+                    async with self.session.post(
                         f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage",
-                        json={
-                            "chat_id": settings.TELEGRAM_CHAT_ID,
-                            "text": message,
-                            "parse_mode": "Markdown"
-                        }
-                    )
-                except Exception as e:
-                    logging.error(f"Telegram error: {e}")
-                finally:
-                    self.queue.task_done()
+                        json=payload
+                    ) as response:
+                        status = response.status
+                        body = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                status, body = None, {}
+                # Transport errors can quote the request URL, which embeds the bot token
+                logging.warning(f"Telegram error: {str(e).replace(settings.TELEGRAM_BOT_TOKEN, '<token>')}")
+
+            if status == 200 and body.get('ok'):
+                self.chat_bucket.record_success()
+                return True
+            if status is not None and status != 429 and 400 <= status < 500:
+                description = body.get('description', '')
+                if parse_mode and "parse" in description:
+                    # Markdown that Telegram cannot parse is still worth sending as plain text
+                    parse_mode = None
+                    continue
+                logging.error(f"Telegram rejected message: {status} {description}")
+                return False
+
+            failures += 1
+            if failures > settings.TELEGRAM_MAX_RETRIES:
+                break
+            if status == 429:
+                # The paused chat bucket does the waiting before the next attempt
+                retry_after = body.get('parameters', {}).get('retry_after')
+                self.chat_bucket.penalize(float(retry_after) if retry_after else None)
+                continue
+            delay = min(settings.TELEGRAM_MAX_BACKOFF, settings.TELEGRAM_BASE_BACKOFF * 2 ** (failures - 1))
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        logging.error(f"Telegram delivery failed after {settings.TELEGRAM_MAX_RETRIES} retries")
+        return False
+
+    async def flush(self, timeout: float) -> bool:
+        """Wait until every pending alert has been delivered or dropped"""
+        if not self.worker_task or self.worker_task.done():
+            return not self.pending
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
 
     async def start(self):
+        if self.chat_bucket is None:
+            self.chat_bucket = TokenBucket('telegram chat', settings.TELEGRAM_CHAT_RATE, settings.TELEGRAM_CHAT_BURST)
+            self.global_bucket = TokenBucket('telegram', settings.TELEGRAM_GLOBAL_RATE, settings.TELEGRAM_GLOBAL_RATE)
+            metrics.gauge_callback("arb_notifier_queue_depth", lambda: len(self.pending))
         if not self.worker_task or self.worker_task.done():
             self.worker_task = asyncio.create_task(self.worker())
 
     async def stop(self):
         if self.worker_task:
+            # Held repeats go out now rather than being lost with the process
+            for alert in self.pending.values():
+                alert.ready_at = 0.0
+            self.wakeup.set()
+            if not await self.flush(settings.TELEGRAM_FLUSH_TIMEOUT):
+                logging.warning(f"Telegram notifier stopped with {len(self.pending)} undelivered alerts")
             self.worker_task.cancel()
             try:
                 await self.worker_task
             except asyncio.CancelledError:
                 pass
-        if self.session:
-            await self.session.close()
+        logging.info(
+            f"Telegram notifier: {self.sent} alerts sent, {self.coalesced} coalesced, {self.dropped} dropped"
+        )
 
 # Глобальный экземпляр
 notifier = TelegramNotifier()
 
-async def send_telegram_message(message: str):
-    await notifier.queue.put(message)
\ No newline at end of file
+async def send_telegram_message(message: str, key: Optional[str] = None, value: float = math.inf):
+    notifier.submit(message, key, value)
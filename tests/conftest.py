@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Settings are read lazily but still require these; tests never reach the network
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test")
+os.environ.setdefault("TELEGRAM_CHAT_ID", "1")
+os.environ.setdefault("INFURA_PROJECT_ID", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
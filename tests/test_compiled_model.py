@@ -0,0 +1,27 @@
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor
+
+from compiled_model import compile_model
+from execution_predictor import MODEL_FEATURES
+
+
+def _fit(n_features: int) -> GradientBoostingRegressor:
+    rng = np.random.default_rng(0)
+    features = rng.random((200, n_features))
+    return GradientBoostingRegressor(n_estimators=20, max_depth=3).fit(features, features.sum(axis=1))
+
+
+def test_compiled_predictions_match_sklearn():
+    model = _fit(len(MODEL_FEATURES))
+    compiled = compile_model(model, len(MODEL_FEATURES))
+    features = np.random.default_rng(1).random((50, len(MODEL_FEATURES)))
+
+    assert compiled is not None
+    np.testing.assert_allclose(compiled.predict(features), model.predict(features))
+
+
+def test_feature_count_mismatch_is_not_compiled(caplog):
+    model = _fit(len(MODEL_FEATURES) + 2)
+
+    assert compile_model(model, len(MODEL_FEATURES)) is None
+    assert "expected" in caplog.text
@@ -0,0 +1,65 @@
+import asyncio
+from decimal import Decimal
+
+from arbitrage import ArbitrageEngine
+from config import settings
+from dex_client import DexPriceFetcher
+from liquidity_analyzer import LiquidityAnalyzer
+from reserves_state import reserves_mirror
+from route_graph import route_graph
+
+TOKEN = "0x1111111111111111111111111111111111111111"
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+TOKEN_WETH = "0x2222222222222222222222222222222222222222"
+WETH_USDT = "0x3333333333333333333333333333333333333333"
+
+
+class _CEX:
+    async def get_prices(self, pair, priority=0):
+        return {}
+
+
+def _weth_only_dex(monkeypatch) -> DexPriceFetcher:
+    """A token whose only pool is against WETH, with a deep WETH/USDT pool behind it"""
+    usdt = settings.TOKENS["USDT"]
+    # 1M tokens vs 500 WETH, and 10k WETH vs 30M USDT: ~$1.5M of USDT behind the token
+    monkeypatch.setitem(reserves_mirror.reserves, TOKEN_WETH, (10**24, 500 * 10**18, 1))
+    monkeypatch.setitem(reserves_mirror.tokens, TOKEN_WETH, (TOKEN, WETH))
+    monkeypatch.setitem(reserves_mirror.reserves, WETH_USDT, (10_000 * 10**18, 30_000_000 * 10**6, 1))
+    monkeypatch.setitem(reserves_mirror.tokens, WETH_USDT, (WETH, usdt))
+    route_graph.update({TOKEN_WETH, WETH_USDT})
+
+    async def no_rpc(*args, **kwargs):
+        return None
+
+    async def decimals(token_addresses):
+        return {token_address: 18 for token_address in token_addresses}
+
+    dex = DexPriceFetcher()
+    monkeypatch.setattr(dex, "_get_pair_address", no_rpc)
+    monkeypatch.setattr(dex, "_get_decimals_many", decimals)
+    monkeypatch.setattr(route_graph, "track_token", no_rpc)
+    return dex
+
+
+def test_routed_token_liquidity_is_the_usdt_side_of_its_pool(monkeypatch):
+    analyzer = LiquidityAnalyzer(_weth_only_dex(monkeypatch))
+
+    pool, liquidity = asyncio.run(analyzer.get_pools([TOKEN]))[TOKEN]
+
+    assert pool is not None
+    assert liquidity == Decimal(str(pool[1]))
+    assert liquidity >= settings.MIN_LIQUIDITY
+
+
+def test_weth_only_token_passes_the_liquidity_gate(monkeypatch):
+    engine = ArbitrageEngine.__new__(ArbitrageEngine)
+    engine.dex = _weth_only_dex(monkeypatch)
+    engine.liquidity = LiquidityAnalyzer(engine.dex)
+    engine.cex = _CEX()
+
+    result = asyncio.run(engine.analyze_pair("TKN", TOKEN))
+
+    # Past the pool and liquidity checks, stopped only by the missing CEX quotes
+    assert result['status'] == 'no_quotes'
+    assert result['dex_price'] is not None
@@ -0,0 +1,94 @@
+from config import settings
+from order_book import OrderBook
+import numpy as np
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+class TradeSizing(NamedTuple):
+    direction: np.ndarray  # +1 buy on DEX / sell on CEX, -1 buy on CEX / sell on DEX, 0 no trade
+    size: np.ndarray       # tokens traded on both legs
+    profit: np.ndarray     # USDT profit at the optimal size, net of DEX_COMMISSION
+    dex_price: np.ndarray  # DEX execution price per token at the optimal size
+
+def compose_reserves(path_reserves: Sequence[Tuple[float, float]]) -> Tuple[float, float]:
+    """Fold a multi-hop route into one equivalent constant-product pool.
+
+    `path_reserves` holds (reserve_in, reserve_out) per hop. The result trades
+    like the whole route with the fee applied once per hop, so the closed-form
+    sizing below applies to routed tokens too.
+    """
+    fee = 1 - float(settings.DEX_COMMISSION)
+    reserve_in, reserve_out = path_reserves[0]
+    for next_in, next_out in path_reserves[1:]:
+        denominator = next_in + fee * reserve_out
+        reserve_in, reserve_out = reserve_in * next_in / denominator, fee * reserve_out * next_out / denominator
+    return reserve_in, reserve_out
+
+def optimal_trades(token_reserves, usdt_reserves, cex_prices) -> TradeSizing:
+    """Profit-maximising trade against each pool for every CEX price, in one vectorized pass.
+
+    Reserves have shape P (whole token / USDT units); `cex_prices` has shape
+    P x E with NaN where an exchange has no quote. With fee factor g, buying on
+    the DEX for d USDT and selling on the CEX at price p peaks at
+    d* = (sqrt(g p x y) - y) / g; selling t tokens into the pool after buying
+    them on the CEX peaks at t* = (sqrt(g x y / p) - x) / g.
+    """
+    x = np.asarray(token_reserves, dtype=np.float64).reshape(-1, 1)
+    y = np.asarray(usdt_reserves, dtype=np.float64).reshape(-1, 1)
+    price = np.asarray(cex_prices, dtype=np.float64).reshape(x.shape[0], -1)
+    fee = 1 - float(settings.DEX_COMMISSION)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Buy on the DEX, sell on the CEX
+        usdt_in = np.maximum((np.sqrt(fee * price * x * y) - y) / fee, 0.0)
+        tokens_bought = fee * usdt_in * x / (y + fee * usdt_in)
+        profit_buy = price * tokens_bought - usdt_in
+
+        # Buy on the CEX, sell on the DEX
+        tokens_in = np.maximum((np.sqrt(fee * x * y / price) - x) / fee, 0.0)
+        usdt_out = fee * tokens_in * y / (x + fee * tokens_in)
+        profit_sell = usdt_out - price * tokens_in
+
+        profit_buy = np.nan_to_num(profit_buy, nan=0.0)
+        profit_sell = np.nan_to_num(profit_sell, nan=0.0)
+        buy = profit_buy >= profit_sell
+        profit = np.where(buy, profit_buy, profit_sell)
+        direction = np.where(profit > 0, np.where(buy, 1, -1), 0)
+        size = np.where(direction == 0, 0.0, np.where(buy, tokens_bought, tokens_in))
+        dex_price = np.where(
+            direction == 0,
+            np.nan,
+            np.where(buy, usdt_in / tokens_bought, usdt_out / tokens_in)
+        )
+
+    return TradeSizing(direction, size, np.maximum(profit, 0.0), dex_price)
+
+def dex_leg(direction: int, size: float, token_reserve: float, usdt_reserve: float) -> Optional[float]:
+    """USDT paid to buy (direction +1) or received for selling (-1) `size` tokens on the pool"""
+    fee = 1 - float(settings.DEX_COMMISSION)
+    if direction > 0:
+        if size >= token_reserve:
+            return None
+        return usdt_reserve * size / (fee * (token_reserve - size))
+    return fee * size * usdt_reserve / (token_reserve + fee * size)
+
+def depth_adjusted(book: OrderBook, token_reserve: float, usdt_reserve: float,
+                   direction: int, size: float) -> Optional[Tuple[float, float, float, float]]:
+    """Re-price a sized trade against CEX depth, shrinking it while thin books eat the edge.
+
+    Tries `size`, size/2, size/4, ... for CEX_DEPTH_SIZE_STEPS steps, pricing
+    both legs at the same size, and returns the most profitable
+    (size, DEX price, CEX VWAP, profit), or None if no size is profitable.
+    """
+    best = None
+    for step in range(settings.CEX_DEPTH_SIZE_STEPS):
+        amount = size / 2**step
+        cex_price = book.vwap_sell(amount) if direction > 0 else book.vwap_buy(amount)
+        dex_usdt = dex_leg(direction, amount, token_reserve, usdt_reserve)
+        if cex_price is None or dex_usdt is None:
+            continue
+        profit = cex_price * amount - dex_usdt if direction > 0 else dex_usdt - cex_price * amount
+        if best is None or profit > best[3]:
+            best = (amount, dex_usdt / amount, cex_price, profit)
+    if best is None or best[3] <= 0:
+        return None
+    return best
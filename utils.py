@@ -0,0 +1,7 @@
+from decimal import Decimal
+from typing import Union
+
+
+def format_decimal(value: Union[Decimal, float, int], places: int = 2) -> str:
+    """Fixed-point with thousands separators, e.g. 12,345.68"""
+    return f"{Decimal(str(value)):,.{places}f}"
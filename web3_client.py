@@ -1,51 +1,67 @@
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
 from config import settings
+import aiohttp
 import json
 import os
 import logging
-from typing import Optional, Any, Dict, List
+from functools import lru_cache
+from typing import Optional, Any, Dict, List, Sequence, Tuple
 import time
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 abi_path = os.path.join(current_dir, "load.json")
 
+
+@lru_cache(maxsize=None)
+def load_router_abi() -> Tuple[Dict[str, Any], ...]:
+    """Uniswap Router ABI, parsed once per process"""
+    with open(abi_path, "r") as f:
+        return tuple(json.load(f))
+
+
 class Web3Client:
     def __init__(self):
-        self.w3: Optional[Web3] = None
+        # web3 takes most of a second to import, so it is only paid for when a client is built
+        from web3 import AsyncWeb3
+        from web3.middleware import async_geth_poa_middleware
+        from rpc_pool import ProviderPool
+
         self.uniswap_router = None
         self.providers = [
             f"https://mainnet.infura.io/v3/{settings.INFURA_PROJECT_ID}",
             "https://eth.llamarpc.com",
             "https://rpc.ankr.com/eth"
         ]
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Every request is routed by the pool to the fastest healthy endpoint
+        self.pool = ProviderPool(self.providers)
+        self.w3 = AsyncWeb3(self.pool)
+        self.w3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
         self.contract_cache = {}
-        self._connect()
         self._init_contracts()
 
-    def _connect(self):
-        for provider_url in self.providers:
-            try:
-                self.w3 = Web3(Web3.HTTPProvider(provider_url))
-                if self.w3.is_connected():
-                    logging.info(f"Connected to {provider_url}")
-                    self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-                    return
-            except Exception as e:
-                logging.warning(f"Connection failed to {provider_url}: {str(e)}")
-        
-        raise ConnectionError("Could not connect to any Ethereum node")
+    async def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.RPC_POOL_SIZE)
+            )
+
+    async def connect(self):
+        """Probe all providers concurrently, sharing one pooled HTTP session"""
+        await self._ensure_session()
+        await self.pool.cache_async_session(self.session)
+        healthy = await self.pool.probe()
+        if not healthy:
+            raise ConnectionError("Could not connect to any Ethereum node")
+        logging.info(
+            f"Connected to {len(healthy)}/{len(self.providers)} Ethereum nodes: {[self.pool.labels[url] for url in healthy]}"
+        )
 
     def _init_contracts(self):
         try:
-            # Load the Uniswap Router ABI
-            with open(abi_path, "r") as f:
-                uniswap_abi = json.load(f)
-            
             # Initialize the Uniswap Router contract
             self.uniswap_router = self.w3.eth.contract(
                 address=settings.UNISWAP_ROUTER_ADDRESS,
-                abi=uniswap_abi
+                abi=list(load_router_abi())
             )
             logging.info("Uniswap router contract initialized")
             
@@ -55,6 +71,12 @@ class Web3Client:
                 abi=settings.UNISWAP_FACTORY_ABI
             )
             logging.info("Uniswap factory contract initialized")
+            
+            # Initialize Multicall3 contract for batched reads
+            self.multicall = self.w3.eth.contract(
+                address=settings.MULTICALL3_ADDRESS,
+                abi=settings.MULTICALL3_ABI
+            )
         except Exception as e:
             logging.error(f"Contract initialization failed: {e}")
             raise
@@ -74,15 +96,56 @@ class Web3Client:
         self.contract_cache[cache_key] = contract
         return contract
     
-    def reconnect_if_needed(self):
-        """Check connection and reconnect if needed"""
+    async def batch_call(self, calls: Sequence[Tuple[Any, str, Sequence[Any]]],
+                   block_identifier: Optional[int] = None) -> List[Any]:
+        """Run many view calls through Multicall3 aggregate3, all pinned to one block.
+
+        Each call is a (contract, function name, args) tuple. Results are decoded
+        per sub-call in the same order and shape as `.call()` would return them;
+        a sub-call that reverts or returns undecodable data yields None.
+        """
+        if not calls:
+            return []
+        
+        if block_identifier is None:
+            block_identifier = await self.w3.eth.block_number
+        
+        results = []
+        batch_size = settings.MULTICALL_BATCH_SIZE
+        for start in range(0, len(calls), batch_size):
+            chunk = calls[start:start + batch_size]
+            payload = [
+                (contract.address, True, contract.encodeABI(fn_name=fn_name, args=list(args)))
+                for contract, fn_name, args in chunk
+            ]
+            responses = await self.multicall.functions.aggregate3(payload).call(
+                block_identifier=block_identifier
+            )
+            for (contract, fn_name, _), (success, return_data) in zip(chunk, responses):
+                results.append(self._decode_result(contract, fn_name, success, return_data))
+        
+        return results
+    
+    def _decode_result(self, contract: Any, fn_name: str, success: bool, return_data: bytes) -> Any:
+        """Decode a single Multicall3 sub-call result"""
+        if not success or not return_data:
+            return None
+        
+        outputs = contract.get_function_by_name(fn_name).abi['outputs']
         try:
-            if not self.w3.is_connected():
-                logging.warning("Web3 connection lost, reconnecting...")
-                self._connect()
-                self._init_contracts()
+            decoded = self.w3.codec.decode([output['type'] for output in outputs], return_data)
         except Exception as e:
-            logging.error(f"Reconnection failed: {e}")
+            logging.warning(f"Could not decode {fn_name} result from {contract.address}: {e}")
+            return None
+        
+        if len(outputs) == 1:
+            return decoded[0]
+        return list(decoded)
+    
+    async def close(self):
+        """Close the pooled RPC session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
             
     def is_address(self, address: str) -> bool:
         """Validate if the given string is a valid Ethereum address"""
@@ -92,9 +155,26 @@ class Web3Client:
         """Convert address to checksum format"""
         return self.w3.to_checksum_address(address)
 
-# Initialize Web3 client
-try:
-    web3_client = Web3Client()
-except Exception as e:
-    logging.critical(f"Web3 client initialization failed: {e}")
-    exit(1)
\ No newline at end of file
+_client: Optional[Web3Client] = None
+
+
+def get_web3_client() -> Web3Client:
+    """The shared Web3Client, built on first use (no network until connect() is awaited)"""
+    global _client
+    if _client is None:
+        try:
+            _client = Web3Client()
+        except Exception as e:
+            logging.critical(f"Web3 client initialization failed: {e}")
+            raise
+    return _client
+
+
+class LazyWeb3Client:
+    """Stands in for the shared client so `from web3_client import web3_client` imports nothing heavy"""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_web3_client(), name)
+
+
+web3_client = LazyWeb3Client()